@@ -0,0 +1,192 @@
+# encoding: utf-8
+
+################################################################################
+#                             music-metadata-tools                             #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                  (C) 2009-10, 2015-16, 2019-20 Jeremy Brown                  #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+import platform
+
+from argparse import ArgumentParser, ArgumentTypeError
+from logging import basicConfig, getLogger, INFO, WARNING
+from os.path import abspath
+from shutil import rmtree
+from sys import exit, stdout
+from tempfile import mkdtemp
+
+import mutagen
+
+from benchmarks.library import DEFAULT_MIX, generate_library, parse_mix
+from benchmarks.memory import measure_memory
+from benchmarks.pagecache import measure_page_cache
+from benchmarks.stages import Library, run_stages, STAGES
+
+
+DEFAULT_SIZE = 500
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+
+# Stages faster than this in both results are too close to timer noise to flag
+DEFAULT_MIN_TIME = 0.005
+
+
+def parse_args():
+	"""
+	Parse the benchmark suite's command line.
+
+	:returns: (Namespace) Parsed arguments
+	"""
+	def _mix(raw_mix):
+		try:
+			result = parse_mix(raw_mix)
+		except ValueError as e:
+			raise ArgumentTypeError(str(e))
+
+		return result
+
+	parser = ArgumentParser(prog="python -m benchmarks", description="Time each stage of sorting and tagging a synthetic library.")
+	parser.add_argument("-v", "--verbose", action="store_true", help="Log each stage as it runs")
+	commands = parser.add_subparsers(dest="command")
+	commands.required = True
+
+	library_options = ArgumentParser(add_help=False)
+	library_options.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Number of music files to generate")
+	library_options.add_argument("--mix", type=_mix, default=DEFAULT_MIX,
+								 help="Relative number of files per format, like mp3=4,flac=1")
+	library_options.add_argument("--seed", type=int, default=0, help="Seed for the generated tags and formats")
+	library_options.add_argument("--no-art", dest="art", action="store_false", help="Don't embed cover art")
+
+	generate = commands.add_parser("generate", parents=[library_options], help="Write a synthetic library and keep it")
+	generate.add_argument("directory", type=abspath, help="Directory to write the library to")
+
+	run = commands.add_parser("run", parents=[library_options], help="Time every stage against a fresh library")
+	run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Times to run each stage; the best run is kept")
+	run.add_argument("--stage", dest="stages", action="append", choices=[stage.name for stage in STAGES],
+					 help="Only time this stage; may be given more than once")
+	run.add_argument("-o", "--output", help="Write results as JSON to this file instead of stdout")
+
+	memory = commands.add_parser("memory", parents=[library_options],
+								 help="Trace memory allocated scanning a fresh library")
+	memory.add_argument("-o", "--output", help="Write results as JSON to this file instead of stdout")
+
+	page_cache = commands.add_parser("cache", parents=[library_options],
+									 help="Measure how much of a fresh library scanning it leaves in the page cache")
+	page_cache.add_argument("-o", "--output", help="Write results as JSON to this file instead of stdout")
+
+	compare = commands.add_parser("compare", help="Flag stages that got slower than a baseline")
+	compare.add_argument("baseline", help="Results JSON to compare against")
+	compare.add_argument("current", help="Results JSON to check")
+	compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+						 help="Fraction slower a stage can get before it counts as a regression")
+	compare.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+						 help="Seconds a stage has to take before it can count as a regression")
+
+	return parser.parse_args()
+
+
+def run(args):
+	"""
+	Generate a library in a temporary directory and time every stage against it,
+	or trace the memory scanning it takes, or measure what it leaves in the page cache.
+
+	:param args: (Namespace) Parsed arguments
+
+	:returns: (dict) What was benchmarked and each stage's results
+	"""
+	root = mkdtemp(prefix="bench-library-")
+
+	try:
+		files = generate_library(root, args.size, args.mix, args.seed, args.art)
+
+		if args.command == "memory":
+			results = {"memory": measure_memory(root, files)}
+		elif args.command == "cache":
+			results = {"page_cache": measure_page_cache(root, files)}
+		else:
+			results = {"stages": run_stages(Library(root, files), args.repeat, args.stages)}
+	finally:
+		rmtree(root)
+
+	results["meta"] = {
+		"size": args.size,
+		"mix": args.mix,
+		"seed": args.seed,
+		"art": args.art,
+		"repeat": getattr(args, "repeat", None),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"mutagen": mutagen.version_string,
+		}
+
+	return results
+
+
+def compare(baseline, current, threshold, min_time=DEFAULT_MIN_TIME):
+	"""
+	Compare the best time of each stage the two results have in common.
+
+	:param baseline: (dict) Results to compare against
+	:param current: (dict) Results to check
+	:param threshold: (float) Fraction slower a stage can get before it counts as a regression
+	:param min_time: (float) Seconds a stage has to take before it can count as a regression
+
+	:returns: (list) (str, float, float, float, bool) tuples of each stage's name, baseline time,
+					 current time, relative change and whether or not it regressed
+	"""
+	result = []
+
+	for (name, stage) in current["stages"].items():
+		if name in baseline["stages"]:
+			before = baseline["stages"][name]["best"]
+			after = stage["best"]
+			change = (after - before) / before if before else 0.0
+			result.append((name, before, after, change, change > threshold and max(before, after) >= min_time))
+
+	return result
+
+
+def main():
+	args = parse_args()
+	basicConfig(level=WARNING, format="%(message)s")
+
+	if args.verbose:
+		getLogger("benchmarks").setLevel(INFO)
+
+	status = 0
+
+	if args.command == "generate":
+		files = generate_library(args.directory, args.size, args.mix, args.seed, args.art)
+		print("Wrote {0} files to {1}".format(len(files), args.directory))
+	elif args.command in ("run", "memory", "cache"):
+		results = run(args)
+
+		if args.output:
+			with open(args.output, "w") as output:
+				json.dump(results, output, indent=2)
+		else:
+			json.dump(results, stdout, indent=2)
+			print()
+	else:
+		with open(args.baseline) as baseline, open(args.current) as current:
+			(baseline, current) = (json.load(baseline), json.load(current))
+
+		if baseline["meta"]["size"] != current["meta"]["size"] or baseline["meta"]["mix"] != current["meta"]["mix"]:
+			print("Warning: results are for different libraries")
+
+		print("{0:<12} {1:>12} {2:>12} {3:>9}".format("stage", "baseline", "current", "change"))
+
+		for (name, before, after, change, regressed) in compare(baseline, current, args.threshold, args.min_time):
+			print("{0:<12} {1:>11.4f}s {2:>11.4f}s {3:>+8.1%}{4}".format(
+				name, before, after, change, "  REGRESSION" if regressed else ""))
+
+			if regressed:
+				status = 1
+
+	exit(status)
+
+
+if __name__ == "__main__":
+	main()
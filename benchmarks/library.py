@@ -0,0 +1,206 @@
+# encoding: utf-8
+
+################################################################################
+#                             music-metadata-tools                             #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                  (C) 2009-10, 2015-16, 2019-20 Jeremy Brown                  #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import struct
+
+from base64 import b64encode
+from os import makedirs
+from os.path import abspath, dirname, join
+from random import Random
+from shutil import copyfile
+
+from mutagen import File
+from mutagen.asf import ASFByteArrayAttribute
+from mutagen.flac import Picture
+from mutagen.id3 import APIC, TALB, TCON, TDRC, TIT2, TPE1, TRCK
+from mutagen.mp4 import MP4Cover
+
+
+TEST_DIR = join(dirname(dirname(abspath(__file__))), "test")
+TEMPLATE_DIR = join(TEST_DIR, "id3autosort", "audio")
+COVER_PATH = join(TEST_DIR, "apic_tool", "data", "test_cover.png")
+
+# Template each format's files are made from
+TEMPLATES = {
+	"aiff": "test_aiff.aiff",
+	"flac": "test_flac.flac",
+	"m4a": "test_aac.m4a",
+	"mp3": "test_mp3.mp3",
+	"ogg": "test_ogg.ogg",
+	"wma": "test_wma.wma",
+	}
+
+DEFAULT_MIX = {"mp3": 4, "flac": 2, "m4a": 2, "ogg": 1, "wma": 1, "aiff": 1}
+
+TRACKS_PER_DIR = 12
+FILES_PER_ALBUM = 10
+ALBUMS_PER_ARTIST = 3
+
+WORDS = [
+	"Amber", "Broken", "City", "Delta", "Echo", "Falling", "Glass", "Harbor", "Iron", "Jade",
+	"Kingdom", "Lights", "Midnight", "North", "Ocean", "Paper", "Quiet", "River", "Silver", "Thunder",
+	"Under", "Velvet", "Winter", "Yellow", "Zero", "Café", "Señor", "Björk", "Über", "Día",
+	]
+GENRES = ["Rock", "Pop", "Jazz", "Electronic", "Hip-Hop", "Classical", "Folk", "Metal", "Soul", "Ambient"]
+
+
+def parse_mix(raw_mix):
+	"""
+	Parse a format mix like "mp3=4,flac=1" into weights per format.
+
+	:param raw_mix: (str) Comma-separated format=weight pairs
+
+	:returns: (dict) Weights keyed by format
+	"""
+	mix = {}
+
+	for pair in raw_mix.split(","):
+		(name, weight) = pair.split("=")
+		name = name.strip().lower()
+
+		if name not in TEMPLATES:
+			raise ValueError("Unknown format: {0}".format(name))
+
+		mix[name] = int(weight)
+
+	return mix
+
+
+def _tag_id3(music, meta, cover):
+	if music.tags is None:
+		music.add_tags()
+
+	music.tags.clear()
+	music.tags.add(TPE1(encoding=3, text=meta["artist"]))
+	music.tags.add(TALB(encoding=3, text=meta["album"]))
+	music.tags.add(TDRC(encoding=3, text=meta["date"]))
+	music.tags.add(TCON(encoding=3, text=meta["genre"]))
+	music.tags.add(TIT2(encoding=3, text=meta["title"]))
+	music.tags.add(TRCK(encoding=3, text=meta["tracknumber"]))
+
+	if cover is not None:
+		music.tags.add(APIC(encoding=3, type=3, mime="image/png", data=cover))
+
+
+def _tag_vorbis(music, meta, cover):
+	music.tags.clear()
+
+	for (key, value) in meta.items():
+		music.tags[key] = value
+
+	if cover is not None:
+		picture = Picture()
+		picture.type = 3
+		picture.mime = "image/png"
+		picture.data = cover
+
+		if hasattr(music, "add_picture"):
+			music.clear_pictures()
+			music.add_picture(picture)
+		else:
+			music.tags["metadata_block_picture"] = b64encode(picture.write()).decode("ascii")
+
+
+def _tag_mp4(music, meta, cover):
+	music.tags.clear()
+	music.tags["\xa9ART"] = meta["artist"]
+	music.tags["\xa9alb"] = meta["album"]
+	music.tags["\xa9day"] = meta["date"]
+	music.tags["\xa9gen"] = meta["genre"]
+	music.tags["\xa9nam"] = meta["title"]
+	music.tags["trkn"] = [(int(meta["tracknumber"]), 0)]
+
+	if cover is not None:
+		music.tags["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_PNG)]
+
+
+def _tag_asf(music, meta, cover):
+	music.tags.clear()
+	music.tags["Author"] = meta["artist"]
+	music.tags["WM/AlbumTitle"] = meta["album"]
+	music.tags["year"] = meta["date"]
+	music.tags["WM/Genre"] = meta["genre"]
+	music.tags["Title"] = meta["title"]
+	music.tags["WM/TrackNumber"] = meta["tracknumber"]
+
+	if cover is not None:
+		# Picture type, data size, then null-terminated UTF-16 MIME type and description
+		picture = (struct.pack("<bi", 3, len(cover)) + "image/png\0".encode("utf-16-le")
+				   + "\0".encode("utf-16-le") + cover)
+		music.tags["WM/Picture"] = [ASFByteArrayAttribute(picture)]
+
+
+TAGGERS = {
+	"aiff": _tag_id3,
+	"flac": _tag_vorbis,
+	"m4a": _tag_mp4,
+	"mp3": _tag_id3,
+	"ogg": _tag_vorbis,
+	"wma": _tag_asf,
+	}
+
+
+def generate_library(root, size, mix=None, seed=0, art=True):
+	"""
+	Write a synthetic, unsorted music library made from the test suite's audio files.
+	The same arguments always produce the same files with the same tags.
+
+	:param root: (str) Absolute path to directory to create the library in
+	:param size: (int) Number of music files to create
+	:param mix: (dict/None) Relative number of files per format, None for DEFAULT_MIX
+	:param seed: (int) Seed for the tags and formats chosen
+	:param art: (bool) Whether or not to embed cover art in every file
+
+	:returns: (list) (str, str) tuples of each file's absolute path and format
+	"""
+	mix = mix or DEFAULT_MIX
+	rand = Random(seed)
+	formats = sorted(mix)
+	weights = [mix[name] for name in formats]
+	cover = None
+	files = []
+
+	if art:
+		with open(COVER_PATH, "rb") as cover_file:
+			cover = cover_file.read()
+
+	artists = ["{0} {1}".format(rand.choice(WORDS), rand.choice(WORDS))
+			   for _ in range(max(1, size // (FILES_PER_ALBUM * ALBUMS_PER_ARTIST)))]
+	albums = {}
+
+	for index in range(size):
+		artist = rand.choice(artists)
+
+		if artist not in albums:
+			albums[artist] = [("{0} {1}".format(rand.choice(WORDS), rand.choice(WORDS)),
+							   str(rand.randint(1960, 2020)), rand.choice(GENRES))
+							  for _ in range(ALBUMS_PER_ARTIST)]
+
+		(album, date, genre) = rand.choice(albums[artist])
+		meta = {
+			"artist": artist,
+			"album": album,
+			"date": date,
+			"genre": genre,
+			"title": "{0} {1}".format(rand.choice(WORDS), rand.choice(WORDS)),
+			"tracknumber": str(index % TRACKS_PER_DIR + 1),
+			}
+		kind = rand.choices(formats, weights)[0]
+
+		directory = join(root, "incoming{0:05d}".format(index // TRACKS_PER_DIR))
+		path = join(directory, "track{0:06d}.{1}".format(index, kind))
+		makedirs(directory, exist_ok=True)
+		copyfile(join(TEMPLATE_DIR, TEMPLATES[kind]), path)
+
+		music = File(path)
+		TAGGERS[kind](music, meta, cover)
+		music.save()
+		files.append((path, kind))
+
+	return files
@@ -0,0 +1,76 @@
+# encoding: utf-8
+
+################################################################################
+#                             music-metadata-tools                             #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                  (C) 2009-10, 2015-16, 2019-20 Jeremy Brown                  #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import gc
+import tracemalloc
+
+from collections import OrderedDict
+
+from mutagen import File
+
+from id3autosort.readorder import INODE_ORDER, WALK_ORDER
+from id3autosort.sorter import get_music_files, normalize_value
+
+from benchmarks.stages import logger, STRUCTURE, tool_logger
+
+
+def _traced(run):
+	"""
+	Run something with every allocation traced.
+
+	:param run: (callable) Called with no arguments; returns whatever it wants kept alive
+
+	:returns: (tuple) (int, int, object) Bytes allocated at the peak, bytes
+					  still allocated after the run, and what the run returned
+	"""
+	normalize_value.cache_clear()
+	gc.collect()
+	tracemalloc.start()
+
+	try:
+		kept = run()
+		gc.collect()
+		(current, peak) = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+	return (peak, current, kept)
+
+
+def measure_memory(root, files):
+	"""
+	Measure how much memory scanning a library takes, streaming the results
+	the way sorting does and keeping them all, against keeping Mutagen's
+	objects for every file. Only tag reading in this process is traced,
+	so scans run with a single job.
+
+	:param root: (str) Absolute path to the library
+	:param files: (list) (str, str) tuples of each file's absolute path and format
+
+	:returns: (OrderedDict) Bytes allocated at the peak of each kind of scan, and per file
+							for the ones that keep something for every file
+	"""
+	result = OrderedDict()
+
+	for (name, order) in [("stream", WALK_ORDER), ("stream_inode", INODE_ORDER)]:
+		logger.info("Tracing a %s scan", name)
+		(peak, _, _) = _traced(lambda: sum(1 for _ in get_music_files(tool_logger, root, True,
+																	   fields=STRUCTURE.fields, read_order=order)))
+		result[name] = {"peak": peak}
+
+	logger.info("Tracing a kept scan")
+	(peak, current, kept) = _traced(lambda: list(get_music_files(tool_logger, root, True,
+																  fields=STRUCTURE.fields)))
+	result["kept"] = {"peak": peak, "per_file": current / max(len(kept), 1)}
+
+	logger.info("Tracing kept Mutagen objects")
+	(peak, current, kept) = _traced(lambda: [File(path, easy=True) for (path, _) in files])
+	result["mutagen"] = {"peak": peak, "per_file": current / max(len(files), 1)}
+
+	return result
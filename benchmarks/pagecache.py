@@ -0,0 +1,126 @@
+# encoding: utf-8
+
+################################################################################
+#                             music-metadata-tools                             #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                  (C) 2009-10, 2015-16, 2019-20 Jeremy Brown                  #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import ctypes
+import os
+
+from collections import OrderedDict
+from os.path import getsize
+from timeit import default_timer
+
+from id3autosort.sorter import get_music_files
+
+from benchmarks.stages import evict, logger, STRUCTURE, tool_logger
+
+
+PROT_READ = 0x1
+MAP_SHARED = 0x01
+
+
+def _libc():
+	"""
+	Load the C library functions needed to see which pages of a file are cached.
+
+	:returns: (CDLL/None) The C library, None where mincore isn't available
+	"""
+	result = None
+
+	try:
+		libc = ctypes.CDLL(None, use_errno=True)
+		libc.mincore
+	except (AttributeError, OSError):
+		libc = None
+
+	if libc is not None:
+		libc.mmap.restype = ctypes.c_void_p
+		libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+							  ctypes.c_long]
+		libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+		libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+		result = libc
+
+	return result
+
+
+def resident_bytes(paths):
+	"""
+	Count how much of a set of files is in the page cache.
+
+	:param paths: (iterable) Strings representing absolute paths to files
+
+	:returns: (int/None) Bytes of the files in the page cache, None if it can't be told
+	"""
+	libc = _libc()
+	result = None if libc is None else 0
+	page = os.sysconf("SC_PAGE_SIZE") if libc is not None else 0
+
+	for path in paths if libc is not None else []:
+		size = getsize(path)
+
+		if not size:
+			continue
+
+		fd = os.open(path, os.O_RDONLY)
+
+		try:
+			# Mapping a file doesn't read it; mincore reports the pages already cached
+			address = libc.mmap(None, size, PROT_READ, MAP_SHARED, fd, 0)
+
+			if address in (None, ctypes.c_void_p(-1).value):
+				continue
+
+			try:
+				pages = (ctypes.c_ubyte * ((size + page - 1) // page))()
+
+				if libc.mincore(address, size, pages) == 0:
+					result += sum(page for cached in pages if cached & 1)
+			finally:
+				libc.munmap(address, size)
+		finally:
+			os.close(fd)
+
+	return result
+
+
+def measure_page_cache(root, files):
+	"""
+	Measure how much of a library scanning it leaves in the page cache, starting
+	cold, with and without the hints that drop each file once its tags are read.
+	The kernel doesn't let a benchmark cap the page cache, so instead of filling
+	a budget and watching what gets evicted, this measures what a scan adds to
+	the cache; on a host where the library is larger than the memory spare, every
+	byte of that pushes something else out.
+
+	:param root: (str) Absolute path to the library
+	:param files: (list) (str, str) tuples of each file's absolute path and format
+
+	:returns: (OrderedDict) Size of the library, then for scans with and without hints, the files
+							scanned, the seconds it took and the bytes of the library cached
+							before and after it
+	"""
+	result = OrderedDict()
+	paths = [path for (path, _) in files]
+	result["library_bytes"] = sum(getsize(path) for path in paths)
+
+	for (name, drop_cache) in [("hints", True), ("no_hints", False)]:
+		evict(paths)
+		cached_before = resident_bytes(paths)
+		logger.info("Scanning cold with%s page cache hints", "" if drop_cache else "out")
+		start = default_timer()
+		scanned = sum(1 for _ in get_music_files(tool_logger, root, True, fields=STRUCTURE.fields,
+												 drop_cache=drop_cache))
+
+		result[name] = {
+			"files": scanned,
+			"seconds": default_timer() - start,
+			"cached_before": cached_before,
+			"cached_after": resident_bytes(paths),
+			}
+
+	return result
@@ -0,0 +1,252 @@
+# encoding: utf-8
+
+################################################################################
+#                             music-metadata-tools                             #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                  (C) 2009-10, 2015-16, 2019-20 Jeremy Brown                  #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import os
+
+from collections import OrderedDict
+from functools import partial
+from logging import getLogger, WARNING
+from os.path import join
+from shutil import copytree, rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from mutagen import File
+
+from apic_tool.workers.mp3worker import MP3Worker
+from id3autosort.mover import MoveEngine
+from id3autosort.pagecache import drop_pages
+from id3autosort.readorder import EXTENT_ORDER, INODE_ORDER
+from id3autosort.sorter import (
+	get_music_files,
+	get_new_path,
+	move_files,
+	normalize_tags,
+	normalize_value,
+	Structure,
+	)
+from id3autosort.walker import scan_files
+
+from benchmarks.library import COVER_PATH
+
+
+logger = getLogger("benchmarks")
+
+# Handed to the code being timed, so its per-file logging stays out of the results
+tool_logger = getLogger("benchmarks.tools")
+tool_logger.setLevel(WARNING)
+
+STRUCTURE = Structure("{artist}/{album} ({date})")
+
+
+class Stage(object):
+	"""
+	A piece of work to time: setup runs before every repetition and isn't timed,
+	the stage itself is, and teardown cleans up after it.
+	"""
+	def __init__(self, name, run, setup=None, teardown=None):
+		"""
+		:param name: (str) Name results are recorded under
+		:param run: (callable) Called with whatever setup returned; returns the number of files handled
+		:param setup: (callable/None) Called with the library before each run
+		:param teardown: (callable/None) Called with whatever setup returned after each run
+		"""
+		self.name = name
+		self.run = run
+		self.setup = setup
+		self.teardown = teardown
+
+	def time(self, library, repeat):
+		"""
+		Time the stage.
+
+		:param library: (Library) Library to run the stage against
+		:param repeat: (int) Number of times to run the stage
+
+		:returns: (dict) Number of files handled, each run's time, the best and the median time
+		"""
+		times = []
+		files = 0
+
+		for _ in range(repeat):
+			state = self.setup(library) if self.setup is not None else library
+
+			try:
+				start = default_timer()
+				files = self.run(state)
+				times.append(default_timer() - start)
+			finally:
+				if self.teardown is not None:
+					self.teardown(state)
+
+		ordered = sorted(times)
+
+		return {
+			"files": files,
+			"times": times,
+			"best": ordered[0],
+			"median": ordered[len(ordered) // 2],
+			}
+
+
+class Library(object):
+	"""
+	A generated library, plus what earlier stages worked out about it
+	that later stages need as input.
+	"""
+	def __init__(self, root, files):
+		"""
+		:param root: (str) Absolute path to the library
+		:param files: (list) (str, str) tuples of each file's absolute path and format
+		"""
+		self.root = root
+		self.files = files
+		self.mp3s = [path for (path, kind) in files if kind == "mp3"]
+		self.parsed = [File(path, easy=True) for (path, _) in files]
+		self.tags = [tags for (_, tags) in get_music_files(tool_logger, root, True, fields=STRUCTURE.fields)]
+
+
+def _scratch_copy(library):
+	scratch = mkdtemp(prefix="bench-")
+	copied = join(scratch, "library")
+	copytree(library.root, copied)
+	return (scratch, copied, library)
+
+
+def _remove_scratch(state):
+	rmtree(state[0])
+
+
+def evict(paths):
+	"""
+	Drop a set of files from the page cache, so the next read of them comes from disk.
+
+	:param paths: (iterable) Strings representing absolute paths to files
+	"""
+	# Only pages already written back can be dropped
+	getattr(os, "sync", lambda: None)()
+
+	for path in paths:
+		drop_pages(path)
+
+
+def _evict_library(library):
+	evict(path for (path, _) in library.files)
+	return library
+
+
+def _walk(library):
+	return sum(1 for _ in scan_files(tool_logger, [library.root]))
+
+
+def _scan(library):
+	return sum(1 for _ in get_music_files(tool_logger, library.root, True, fields=STRUCTURE.fields))
+
+
+def _scan_full(library):
+	return sum(1 for _ in get_music_files(tool_logger, library.root, True))
+
+
+def _scan_drop(library):
+	return sum(1 for _ in get_music_files(tool_logger, library.root, True, fields=STRUCTURE.fields, drop_cache=True))
+
+
+def _scan_ordered(order, library):
+	return sum(1 for _ in get_music_files(tool_logger, library.root, True, fields=STRUCTURE.fields, read_order=order))
+
+
+def _normalize(library):
+	normalize_value.cache_clear()
+
+	for parsed in library.parsed:
+		normalize_tags(tool_logger, parsed, True)
+
+	return len(library.parsed)
+
+
+def _path_build(library):
+	for tags in library.tags:
+		get_new_path(tool_logger, "/music", STRUCTURE, tags)
+
+	return len(library.tags)
+
+
+def _move_setup(library):
+	(scratch, copied, _) = _scratch_copy(library)
+	batch = OrderedDict()
+
+	for (path, tags) in get_music_files(tool_logger, copied, True, fields=STRUCTURE.fields):
+		new_path = get_new_path(tool_logger, join(scratch, "sorted"), STRUCTURE, tags)
+
+		if new_path is not None:
+			batch.setdefault(new_path, []).append(path)
+
+	return (scratch, batch)
+
+
+def _move(state):
+	(_, batch) = state
+	engine = MoveEngine(tool_logger)
+	move_files(tool_logger, batch, set(), engine)
+	engine.finish()
+	return sum(len(paths) for paths in batch.values())
+
+
+def _insert(state):
+	(_, copied, library) = state
+
+	for path in library.mp3s:
+		MP3Worker.write_to_metadata(tool_logger, join(copied, path[len(library.root) + 1:]), COVER_PATH, True)
+
+	return len(library.mp3s)
+
+
+def _extract(library):
+	for path in library.mp3s:
+		MP3Worker.get_image_data(tool_logger, path)
+
+	return len(library.mp3s)
+
+
+STAGES = [
+	Stage("walk", _walk),
+	Stage("scan", _scan),
+	Stage("scan_full", _scan_full),
+	# Reading from disk, without and with dropping each file from the page cache once its tags are read
+	Stage("scan_cold", _scan, _evict_library),
+	Stage("scan_cold_drop", _scan_drop, _evict_library),
+	# The other read orders, against scan_cold's walk order; only reads from disk can be sped up by them
+	Stage("scan_cold_inode", partial(_scan_ordered, INODE_ORDER), _evict_library),
+	Stage("scan_cold_extent", partial(_scan_ordered, EXTENT_ORDER), _evict_library),
+	Stage("normalize", _normalize),
+	Stage("path_build", _path_build),
+	Stage("move", _move, _move_setup, _remove_scratch),
+	Stage("insert", _insert, _scratch_copy, _remove_scratch),
+	Stage("extract", _extract),
+	]
+
+
+def run_stages(library, repeat, names=None):
+	"""
+	Time every stage, or the named ones, against a library.
+
+	:param library: (Library) Library to run the stages against
+	:param repeat: (int) Number of times to run each stage
+	:param names: (iterable/None) Names of the stages to run, None for all of them
+
+	:returns: (OrderedDict) Each stage's results, keyed by name
+	"""
+	results = OrderedDict()
+
+	for stage in STAGES:
+		if names is None or stage.name in names:
+			logger.info("Timing %s", stage.name)
+			results[stage.name] = stage.time(library, repeat)
+
+	return results
@@ -39,7 +39,7 @@ setup(
 
 	python_requires="~=3.6",
 
-	install_requires=["mutagen"],
+	install_requires=["mutagen >= 1.45"],
 
 	setup_requires=["pytest-runner", "setuptools_scm"],
 
@@ -24,6 +24,9 @@ from sys import argv
 from apic_tool import __version__, SUPPORTED_IMAGES, SUPPORTED_MUSIC
 from apic_tool.extraction import extract_image
 from apic_tool.insertion import insert_image
+from id3autosort.profiler import profiling, RunProfiler
+from id3autosort.quarantine import Quarantine
+from id3autosort.stats import load_hook, log_report, RunStats, write_report
 
 
 logger = getLogger(__file__)
@@ -58,9 +61,9 @@ class AbsoluteAccessiblePaths(Action):
 			expanded_path = abspath(expanduser(values))
 
 			# Confirm file paths point to files and directory paths point to directories
-			# Since the path pointed to by extract_pic may not currently exist, don't raise
-			# if it doesn't
-			if self.dest == "extract_pic":
+			# Since the paths pointed to by extract_pic, stats_json, profile and quarantine
+			# may not currently exist, don't raise if they don't
+			if self.dest in ["extract_pic", "stats_json", "profile", "quarantine"]:
 				pass
 			elif self.dest in ["insert_files", "insert_pic", "extract_music"]:
 				if not isfile(expanded_path):
@@ -94,6 +97,39 @@ def parse_args(**kwargs):
 
 	:returns: (Namespace) Tool arguments
 	"""
+	def _positive_int(raw_value):
+		try:
+			value = int(raw_value)
+		except ValueError:
+			raise ArgumentTypeError("Not an integer: {0}".format(raw_value))
+
+		if value < 1:
+			raise ArgumentTypeError("Must be at least 1: {0}".format(raw_value))
+
+		return value
+
+
+	def _positive_float(raw_value):
+		try:
+			value = float(raw_value)
+		except ValueError:
+			raise ArgumentTypeError("Not a number: {0}".format(raw_value))
+
+		if not value > 0:
+			raise ArgumentTypeError("Must be more than 0: {0}".format(raw_value))
+
+		return value
+
+
+	def _hook(spec):
+		try:
+			hook = load_hook(spec)
+		except ValueError as e:
+			raise ArgumentTypeError(str(e))
+
+		return hook
+
+
 	main_parser = ArgumentParser(
 		prog = "apic-tool",
 		description = "Inserts and extracts cover images to/from music files.",
@@ -114,6 +150,36 @@ def parse_args(**kwargs):
 							 dest="force",
 							 help="Whether or not the tool should allow things to happen that may have complications")
 
+	main_parser.add_argument("--stats",
+							 action="store_true",
+							 help="Report time spent in each stage, files per second and per-file latency")
+
+	main_parser.add_argument("--stats-json",
+							 action=AbsoluteAccessiblePaths,
+							 dest="stats_json",
+							 metavar="STATS_FILE",
+							 help="Save the run's stats to this file as JSON")
+
+	main_parser.add_argument("--slowest",
+							 type=_positive_int,
+							 default=0,
+							 metavar="N",
+							 help="Report the N slowest files in each stage, with their size and format")
+
+	main_parser.add_argument("--profile",
+							 action=AbsoluteAccessiblePaths,
+							 dest="profile",
+							 metavar="PSTATS_FILE",
+							 help="Profile the run with cProfile and save the results to this file")
+
+	main_parser.add_argument("--hook",
+							 type=_hook,
+							 action="append",
+							 dest="hooks",
+							 metavar="MODULE:NAME",
+							 help=("Call a StageHook made by NAME in MODULE as each stage starts and finishes; "
+								   "may be given more than once"))
+
 	main_parser.add_argument("--version",
 							 action="version",
 							 version="%(prog)s {}".format(__version__))
@@ -154,6 +220,21 @@ def parse_args(**kwargs):
 							   help="Don't delete image after inserting it"
 							   )
 
+	insert_parser.add_argument("--file-timeout",
+							   type=_positive_float,
+							   dest="file_timeout",
+							   metavar="SECONDS",
+							   help=("Skip files that take longer than this to load, "
+									 "e.g. corrupt files or ones on an unresponsive network share")
+							   )
+
+	insert_parser.add_argument("--quarantine",
+							   action=AbsoluteAccessiblePaths,
+							   dest="quarantine",
+							   metavar="QUARANTINE_FILE",
+							   help="Record files given up on in this file and skip them until they are modified"
+							   )
+
 	extract_parser.add_argument("extract_music",
 								action=AbsoluteAccessiblePaths,
 								help="File to extract image from"
@@ -182,14 +263,46 @@ def main():
 
 	logger.debug("Dry run: %s", args.dry_run)
 	logger.debug("Forcing: %s", args.force)
-
-	if args.action == "extract":
-		logger.debug("Extraction file: %s", args.extract_music)
-		logger.debug("Extraction result: %s", args.extract_pic)
-		extract_image(logger, args.extract_music, args.extract_pic, args.dry_run, args.force)
-	else:
-		logger.debug("Insertion files: %s", args.insert_files)
-		logger.debug("Insertion directories: %s", args.insert_dirs)
-		logger.debug("Cover to insert: %s", args.insert_pic)
-		logger.debug("Keep covers after insertion: %s", args.keep_pic)
-		insert_image(logger, args.insert_pic, args.insert_dirs, args.insert_files, args.keep_pic, args.dry_run, args.force)
+	logger.debug("Keeping stats: %s", args.stats or args.stats_json is not None)
+	logger.debug("Slowest files reported per stage: %d", args.slowest)
+	logger.debug("Profile: %s", args.profile)
+	logger.debug("Hooks: %s", args.hooks)
+
+	keep_stats = args.stats or args.stats_json is not None or args.slowest or args.hooks
+	stats = RunStats(args.slowest, args.hooks or ()) if keep_stats else None
+	profiler = RunProfiler() if args.profile is not None else None
+
+	try:
+		with profiling(profiler):
+			if args.action == "extract":
+				logger.debug("Extraction file: %s", args.extract_music)
+				logger.debug("Extraction result: %s", args.extract_pic)
+				extract_image(logger, args.extract_music, args.extract_pic, args.dry_run, args.force, stats)
+			else:
+				logger.debug("Insertion files: %s", args.insert_files)
+				logger.debug("Insertion directories: %s", args.insert_dirs)
+				logger.debug("Cover to insert: %s", args.insert_pic)
+				logger.debug("Keep covers after insertion: %s", args.keep_pic)
+				logger.debug("Per-file timeout: %s", args.file_timeout)
+				logger.debug("Quarantine: %s", args.quarantine)
+				quarantine = Quarantine(args.quarantine) if args.quarantine is not None else None
+
+				try:
+					insert_image(logger, args.insert_pic, args.insert_dirs, args.insert_files, args.keep_pic,
+								 args.dry_run, args.force, stats=stats, file_timeout=args.file_timeout,
+								 quarantine=quarantine)
+				finally:
+					if quarantine is not None:
+						quarantine.close()
+	finally:
+		if profiler is not None:
+			profiler.dump(args.profile)
+
+	if stats is not None:
+		report = stats.report()
+
+		if args.stats or args.slowest:
+			log_report(logger, report)
+
+		if args.stats_json is not None:
+			write_report(args.stats_json, report)
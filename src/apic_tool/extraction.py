@@ -11,6 +11,7 @@ from errno import EACCES
 from os.path import isfile
 
 from apic_tool.workers import get_format_worker
+from id3autosort.stats import timing
 
 
 def write_to_disk(logger, path, data):
@@ -105,7 +106,7 @@ def get_image_path(logger, music_path, image_path, worker_ext, forced):
 	return path
 
 
-def extract_image(logger, music_path, cover_path, dry_run, forced):
+def extract_image(logger, music_path, cover_path, dry_run, forced, stats=None):
 	"""
 	Dispatch function handling extracting cover image from music files.
 
@@ -115,6 +116,7 @@ def extract_image(logger, music_path, cover_path, dry_run, forced):
 	:param dry_run: (bool) Whether or not to actually write images to disk
 	:param forced: (bool) Whether or not the tool should do things it doesn't
 						  believe are beneficial
+	:param stats: (RunStats/None) Stats to record time spent reading and writing the image in
 	"""
 	worker = get_format_worker(music_path)
 
@@ -122,10 +124,16 @@ def extract_image(logger, music_path, cover_path, dry_run, forced):
 		logger.info("File %s is not a supported music file", music_path)
 		return
 
-	(image_data, worker_ext) = worker.get_image_data(logger, music_path)
+	with timing(stats, "extract", music_path, latency=True):
+		(image_data, worker_ext) = worker.get_image_data(logger, music_path)
+
+	if stats is not None:
+		stats.count("files")
+
 	cover_path = get_image_path(logger, music_path, cover_path, worker_ext, forced)
 
 	if cover_path is not None:
 		logger.debug("Writing image data from %s to %s", music_path, cover_path)
 		if not dry_run:
-			write_to_disk(logger, cover_path, image_data)
+			with timing(stats, "write"):
+				write_to_disk(logger, cover_path, image_data)
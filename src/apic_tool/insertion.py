@@ -7,13 +7,38 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
-from os import listdir, remove
-from os.path import isfile, join
+from functools import partial
+from os import remove, stat
 
 from apic_tool.workers import get_format_worker
+from id3autosort.logbuffer import BufferedLogger
+from id3autosort.pagecache import drop_pages
+from id3autosort.stats import timing
+from id3autosort.walker import scan_files
+from id3autosort.watchdog import DONE, TIMED_OUT, WatchdogPool
 
 
-def get_music_files(logger, files, dirs, forced):
+# Number of insertion directories listed at once
+LIST_THREADS = 4
+
+
+def _check_job(path, forced):
+	"""
+	Watchdog worker entry point for checking whether an image can be inserted into a file;
+	log messages are sent back alongside the answer instead of being emitted directly.
+
+	:param path: (str) Absolute path to music file
+	:param forced: (bool) Whether or not the tool should allow things to happen
+						  that may have complications
+
+	:returns: (tuple) Whether or not the file is usable, and a BufferedLogger of the messages logged
+	"""
+	buffered = BufferedLogger()
+	result = (get_format_worker(path).can_insert_image(buffered, path, forced), buffered)
+	return result
+
+
+def get_music_files(logger, files, dirs, forced, *, stats=None, file_timeout=None, quarantine=None):
 	"""
 	Obtain a list of all music files among the provided files and directories
 	that the tool is capable of adding images to.
@@ -24,18 +49,24 @@ def get_music_files(logger, files, dirs, forced):
 						containing music files
 	:param forced: (bool) Whether or not the tool should allow things to happen
 						  that may have complications
+	:param stats: (RunStats/None) Stats to record time spent listing and checking files in
+	:param file_timeout: (float/None) Seconds a file may take to check before it is given up on,
+									  None to wait as long as it takes
+	:param quarantine: (Quarantine/None) Files to pass over until they are modified,
+										 given up on files are added to
 
 	:returns: (list) Strings representing absolute paths to manipulable music files
 	"""
 	valid_files = []
 	paths = []
+	guarded = []
 
 	if files is not None:
 		paths.extend(files)
 
 	if dirs is not None:
-		for dirfiles in [list(filter(isfile, map(lambda f: join(d, f), listdir(d)))) for d in dirs]:
-			paths.extend(dirfiles)
+		listed = scan_files(logger, dirs, recursive=False, threads=min(len(dirs), LIST_THREADS))
+		paths.extend(stats.timed("walk", listed) if stats is not None else listed)
 
 	for path in paths:
 		worker = get_format_worker(path)
@@ -44,13 +75,59 @@ def get_music_files(logger, files, dirs, forced):
 			logger.debug("File %s is not a supported music file, skipping", path)
 			continue
 
-		if worker.can_insert_image(logger, path, forced):
+		if quarantine is not None:
+			try:
+				held = quarantine.holds(path, stat(path))
+			except OSError:
+				# Let checking the file report the problem
+				held = False
+
+			if held:
+				logger.info("Skipping %s, quarantined", path)
+				continue
+
+		if file_timeout is not None:
+			guarded.append(path)
+			continue
+
+		with timing(stats, "check", path):
+			usable = worker.can_insert_image(logger, path, forced)
+
+		if usable:
 			valid_files.append(path)
 
+	if guarded:
+		# Checking loads the file the same way writing to it does, so only files that load
+		# in time are written to; writes themselves are never cut short partway through
+		checks = WatchdogPool(1, file_timeout).imap(partial(_check_job, forced=forced), guarded)
+
+		if stats is not None:
+			checks = stats.timed("check", checks)
+
+		for (path, result, status) in checks:
+			if status == DONE:
+				(usable, buffered) = result
+				buffered.replay(logger)
+
+				if usable:
+					valid_files.append(path)
+			else:
+				if status == TIMED_OUT:
+					logger.warning("Gave up checking %s after %g seconds", path, file_timeout)
+				else:
+					logger.warning("Checking %s crashed its worker process", path)
+
+				if quarantine is not None:
+					quarantine.add(path, status)
+
+				if stats is not None:
+					stats.count("abandoned")
+
 	return valid_files
 
 
-def insert_image(logger, cover_path, insertion_dirs, insertion_files, keep_cover, dry_run, forced):
+def insert_image(logger, cover_path, insertion_dirs, insertion_files, keep_cover, dry_run, forced, *, stats=None,
+				 file_timeout=None, quarantine=None):
 	"""
 	Dispatch function handling qualifying files to insert images into
 	and actually performing insertion.
@@ -67,17 +144,31 @@ def insert_image(logger, cover_path, insertion_dirs, insertion_files, keep_cover
 						   images into files and deletion of cover afterwards
 	:param forced: (bool) Whether or not the tool should allow things to happen
 						  that may have complications
+	:param stats: (RunStats/None) Stats to record time spent in each stage of insertion in
+	:param file_timeout: (float/None) Seconds a file may take to check before it is given up on,
+									  None to wait as long as it takes
+	:param quarantine: (Quarantine/None) Files to pass over until they are modified,
+										 given up on files are added to
 	"""
 	result = True
 
-	music_files = get_music_files(logger, insertion_files, insertion_dirs, forced)
+	music_files = get_music_files(logger, insertion_files, insertion_dirs, forced, stats=stats,
+								  file_timeout=file_timeout, quarantine=quarantine)
 
 	if music_files:
 		for track in music_files:
 			logger.debug("Writing image %s to file %s", cover_path, track)
 			if not dry_run:
 				worker = get_format_worker(track)
-				result &= worker.write_to_metadata(logger, track, cover_path, forced)
+
+				with timing(stats, "save", track, latency=True):
+					result &= worker.write_to_metadata(logger, track, cover_path, forced)
+
+				# Nothing reads the file again once the image is in it
+				drop_pages(track, written=True)
+
+				if stats is not None:
+					stats.count("files")
 
 		if result and not keep_cover:
 			logger.info("Deleting image file %s", cover_path)
@@ -18,6 +18,7 @@ from mutagen.id3 import ID3, APIC
 from mutagen.mp3 import MP3
 
 from apic_tool.workers.baseworker import BaseWorker
+from id3autosort.pagecache import drop_pages, tag_read_hints
 
 
 SUPPORTED_EXTENSIONS = ["mp3"]
@@ -48,7 +49,8 @@ class MP3Worker(BaseWorker):
 		music = None
 
 		try:
-			music = MP3(path)
+			with tag_read_hints(path, drop_cache=False):
+				music = MP3(path)
 		except MutagenError as e:
 			orig_e = e.args[0]
 			if isinstance(orig_e, getattr(builtins, "PermissionError", IOError)) and orig_e.errno == EACCES:
@@ -113,6 +115,11 @@ class MP3Worker(BaseWorker):
 			else:
 				result = True
 
+		# Files an image is inserted into are read again to write to them, so only
+		# the ones passed over are done with and can leave the page cache
+		if not result:
+			drop_pages(path)
+
 		return result
 
 	@staticmethod
@@ -0,0 +1,233 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from os import stat
+from os.path import basename, join
+from threading import Event
+
+from id3autosort.mover import move_file
+from id3autosort.sorter import get_new_path, make_dir, MOVE_BATCH_SIZE, read_tags, screen_files
+from id3autosort.walker import scan_files
+
+
+DEFAULT_READ_LIMIT = 8
+DEFAULT_MOVE_LIMIT = 4
+
+# Items queued in front of a stage per unit of its concurrency
+STAGE_QUEUE_DEPTH = 4
+
+# Seconds between checks by a walk waiting on a full queue for whether sorting has stopped
+WALK_STOP_INTERVAL = 0.1
+
+
+def _read_file(logger, path, windows_safe, fields, cache, prefilter, exclude, drop_cache):
+	"""
+	Screen a file and read its tags, consulting and updating the cache.
+
+	:returns: None if the file isn't music or can't be read, a dict of normalized tags otherwise
+	"""
+	result = None
+
+	for (path, file_stat, tags) in screen_files(logger, [path], windows_safe, fields, cache, prefilter, exclude):
+		if tags is None:
+			tags = read_tags(logger, path, windows_safe, fields, drop_cache)
+
+			if tags is not None and file_stat is not None and cache is not None:
+				cache.put(file_stat, windows_safe, fields, tags)
+
+		result = tags
+
+	return result
+
+
+def _move_file(logger, file_path, new_path, ready_dirs, devices, verify, want_stat):
+	"""
+	Move a file into its new directory, creating the directory if needed.
+
+	:returns: None if the file wasn't moved, otherwise a (stat_result/None, stat_result/None, str) tuple
+			  of the file's status before and after moving and its new path
+	"""
+	result = None
+
+	if make_dir(logger, new_path, [file_path], ready_dirs):
+		try:
+			old_stat = stat(file_path) if want_stat else None
+			dest = move_file(file_path, new_path, verify, devices)
+			result = (old_stat, stat(dest) if want_stat else None, dest)
+		except Exception as e:
+			logger.info("Could not move file %s to new location: %s", file_path, e)
+
+	return result
+
+
+async def async_sort(logger, in_dir, out_dir, structure, windows_safe, dry_run, *, cache=None, prefilter=None,
+					 walk_threads=1, read_limit=DEFAULT_READ_LIMIT, move_limit=DEFAULT_MOVE_LIMIT, verify=False,
+					 journal=None, resume=False, drop_cache=False):
+	"""
+	Coroutine moving files into place the way sort() does, with walking, reading
+	tags and moving files running as concurrent stages connected by bounded queues.
+	Blocking work runs in thread pools sized by each stage's limit. Files are
+	only ever moved; linking, views and file lists are left to sort().
+
+	:param logger: (Logger) Logging object
+	:param in_dir: (str) Absolute path to music source directory
+	:param out_dir: (str) Absolute path to music destination directory
+	:param structure: (Structure) Desired structure for music files inside root directory
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param dry_run: (bool) Whether or not to perform actual movement of files
+	:param cache: (MetadataCache/None) Cache of previously read tags to consult and update
+	:param prefilter: (PreFilter/None) Checks files must pass before being read
+	:param walk_threads: (int) Number of directories to list at once
+	:param read_limit: (int) Number of files to read tags from at once
+	:param move_limit: (int) Number of files to move at once
+	:param verify: (bool) Whether or not to compare checksums of copies before deleting originals
+	:param journal: (MoveJournal/None) Journal to record moves in
+	:param resume: (bool) Whether or not to pass over files the journal shows were already moved
+	:param drop_cache: (bool) Whether or not to drop files from the page cache after reading them
+	"""
+	loop = asyncio.get_event_loop()
+	paths = asyncio.Queue(read_limit * STAGE_QUEUE_DEPTH)
+	found = asyncio.Queue(read_limit * STAGE_QUEUE_DEPTH)
+	moves = asyncio.Queue(move_limit * STAGE_QUEUE_DEPTH)
+	stop = Event()
+	ready_dirs = set()
+	devices = {}
+	found_music = False
+	moved = set(dest for (_, dest) in journal.moves()) if journal is not None and resume else None
+
+	walk_pool = ThreadPoolExecutor(max_workers=1)
+	read_pool = ThreadPoolExecutor(max_workers=read_limit)
+	move_pool = ThreadPoolExecutor(max_workers=move_limit)
+
+	def _walk():
+		for path in scan_files(logger, [in_dir], threads=walk_threads):
+			if stop.is_set():
+				break
+
+			queued = asyncio.run_coroutine_threadsafe(paths.put(path), loop)
+
+			# The loop may stop before the path is queued if sorting fails
+			while True:
+				try:
+					queued.result(WALK_STOP_INTERVAL)
+					break
+				except TimeoutError:
+					if stop.is_set():
+						queued.cancel()
+						return
+
+
+	async def _walk_stage():
+		await loop.run_in_executor(walk_pool, _walk)
+
+		for _ in range(read_limit):
+			await paths.put(None)
+
+
+	async def _read_stage():
+		path = await paths.get()
+
+		while path is not None:
+			tags = await loop.run_in_executor(read_pool, _read_file, logger, path, windows_safe,
+											  structure.fields, cache, prefilter, moved, drop_cache)
+
+			if tags is not None:
+				await found.put((path, tags))
+
+			path = await paths.get()
+
+
+	async def _read_stages():
+		await asyncio.gather(*[_read_stage() for _ in range(read_limit)])
+		await found.put(None)
+
+
+	async def _plan_stage():
+		nonlocal found_music
+		finished = False
+
+		while not finished:
+			batch = [await found.get()]
+			planned = []
+
+			# Plan whatever else has been read by now in one go
+			while len(batch) < MOVE_BATCH_SIZE and not found.empty():
+				batch.append(found.get_nowait())
+
+			for item in batch:
+				if item is None:
+					finished = True
+					continue
+
+				(file_path, tags) = item
+				found_music = True
+				new_path = get_new_path(logger, out_dir, structure, tags)
+
+				if new_path is None:
+					logger.info("File %s does not have tags to fulfill specified structure, skipping",
+							 file_path)
+				else:
+					logger.debug("Moving file %s to %s", file_path, new_path)
+
+					if not dry_run:
+						planned.append((file_path, new_path))
+
+			if journal is not None and planned:
+				journal.plan((file_path, join(new_path, basename(file_path))) for (file_path, new_path) in planned)
+
+			for move in planned:
+				await moves.put(move)
+
+		for _ in range(move_limit):
+			await moves.put(None)
+
+
+	async def _move_stage():
+		move = await moves.get()
+
+		while move is not None:
+			(file_path, new_path) = move
+			result = await loop.run_in_executor(move_pool, _move_file, logger, file_path, new_path,
+												ready_dirs, devices, verify, cache is not None)
+
+			if result is not None:
+				(old_stat, new_stat, dest) = result
+
+				if cache is not None:
+					cache.move(old_stat, new_stat)
+
+				if journal is not None:
+					journal.done(file_path, dest)
+
+			move = await moves.get()
+
+
+	stages = [asyncio.ensure_future(stage) for stage in
+			  [_walk_stage(), _read_stages(), _plan_stage()] + [_move_stage() for _ in range(move_limit)]]
+
+	try:
+		await asyncio.gather(*stages)
+	finally:
+		stop.set()
+
+		for stage in stages:
+			stage.cancel()
+
+		# Let a walk waiting on a full queue see that it should stop
+		while not paths.empty():
+			paths.get_nowait()
+
+		for pool in [walk_pool, read_pool, move_pool]:
+			pool.shutdown(wait=False)
+
+	if not found_music:
+		logger.info("No music files in %s", in_dir)
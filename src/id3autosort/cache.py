@@ -0,0 +1,154 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+import sqlite3
+
+from threading import Lock
+from time import time
+
+
+DEFAULT_CACHE_SIZE = 1000000
+
+# Number of writes buffered before they are committed to disk
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tags (
+	dev INTEGER NOT NULL,
+	ino INTEGER NOT NULL,
+	windows_safe INTEGER NOT NULL,
+	size INTEGER NOT NULL,
+	mtime_ns INTEGER NOT NULL,
+	fields TEXT,
+	tags TEXT NOT NULL,
+	last_used INTEGER NOT NULL,
+	PRIMARY KEY (dev, ino, windows_safe)
+	);
+
+CREATE INDEX IF NOT EXISTS tags_last_used ON tags (last_used);
+"""
+
+
+class MetadataCache(object):
+	"""
+	Persistent store of normalized tags, keyed by the device, inode, size and
+	modification time of the file they were read from so changed files miss.
+	Safe to share between threads.
+	"""
+	def __init__(self, path, max_entries=DEFAULT_CACHE_SIZE):
+		"""
+		:param path: (str) Absolute path to the SQLite database, created if missing
+		:param max_entries: (int) Number of files to remember before evicting
+								  the ones used least recently
+		"""
+		self.max_entries = max_entries
+		self.now = int(time())
+		self.pending = 0
+		self.used = []
+		self.lock = Lock()
+		self.db = sqlite3.connect(path, check_same_thread=False)
+		self.db.executescript(SCHEMA)
+
+	def _flush(self):
+		# Recording hits one at a time would turn every read into a write
+		self.db.executemany("UPDATE tags SET last_used = ? WHERE dev = ? AND ino = ? AND windows_safe = ?",
+							self.used)
+		self.db.commit()
+		self.used = []
+		self.pending = 0
+
+	def _commit(self):
+		self.pending += 1
+
+		if self.pending >= COMMIT_INTERVAL:
+			self._flush()
+
+	def get(self, file_stat, windows_safe, fields):
+		"""
+		Look up the tags previously read from the given file.
+
+		:param file_stat: (stat_result) Current status of the file
+		:param windows_safe: (bool) Whether the tags were normalized for Windows platforms
+		:param fields: (iterable/None) Names of the tags needed, None for every tag
+
+		:returns: None if the file is unknown, changed, or lacks the needed tags,
+				  the cached dict of normalized tags otherwise
+		"""
+		tags = None
+
+		with self.lock:
+			row = self.db.execute("SELECT fields, tags FROM tags WHERE dev = ? AND ino = ? AND windows_safe = ? "
+								  "AND size = ? AND mtime_ns = ?",
+								  (file_stat.st_dev, file_stat.st_ino, int(windows_safe),
+								   file_stat.st_size, file_stat.st_mtime_ns)).fetchone()
+
+			if row is not None:
+				(cached_fields, cached_tags) = row
+
+				# Entries made from a partial read only cover the fields read at the time
+				if cached_fields is None or (fields is not None and set(fields) <= set(json.loads(cached_fields))):
+					tags = json.loads(cached_tags)
+					self.used.append((self.now, file_stat.st_dev, file_stat.st_ino, int(windows_safe)))
+					self._commit()
+
+		return tags
+
+	def put(self, file_stat, windows_safe, fields, tags):
+		"""
+		Remember the tags read from the given file.
+
+		:param file_stat: (stat_result) Status of the file when it was read
+		:param windows_safe: (bool) Whether the tags were normalized for Windows platforms
+		:param fields: (iterable/None) Names of the tags that were read, None for every tag
+		:param tags: (dict) Normalized tags
+		"""
+		with self.lock:
+			self.db.execute("INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+							(file_stat.st_dev, file_stat.st_ino, int(windows_safe),
+							 file_stat.st_size, file_stat.st_mtime_ns,
+							 None if fields is None else json.dumps(sorted(fields)),
+							 json.dumps(tags), self.now))
+			self._commit()
+
+	def move(self, old_stat, new_stat, keep=False):
+		"""
+		Carry entries for a file over to its new identity after it was moved,
+		so it still hits in the cache if it moved across devices.
+
+		:param old_stat: (stat_result) Status of the file before it was moved
+		:param new_stat: (stat_result) Status of the file after it was moved
+		:param keep: (bool) Whether or not to keep the old entries too, for a file copied or linked
+							rather than moved
+		"""
+		if (old_stat.st_dev, old_stat.st_ino) != (new_stat.st_dev, new_stat.st_ino):
+			with self.lock:
+				self.db.execute("INSERT OR REPLACE INTO tags "
+								"SELECT ?, ?, windows_safe, ?, ?, fields, tags, last_used FROM tags "
+								"WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+								(new_stat.st_dev, new_stat.st_ino, new_stat.st_size, new_stat.st_mtime_ns,
+								 old_stat.st_dev, old_stat.st_ino, old_stat.st_size, old_stat.st_mtime_ns))
+
+				if not keep:
+					self.db.execute("DELETE FROM tags WHERE dev = ? AND ino = ?", (old_stat.st_dev, old_stat.st_ino))
+
+				self._commit()
+
+	def close(self):
+		"""
+		Evict the least recently used entries over the size limit
+		and write everything to disk.
+		"""
+		with self.lock:
+			self._flush()
+			self.db.execute("DELETE FROM tags WHERE rowid IN "
+							"(SELECT rowid FROM tags ORDER BY last_used DESC, rowid DESC LIMIT -1 OFFSET ?)",
+							(self.max_entries,))
+			self.db.commit()
+			self.db.close()
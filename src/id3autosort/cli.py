@@ -20,15 +20,36 @@ from logging import (
 	WARNING,
 	)
 from os import access, makedirs, walk, R_OK, sep, W_OK
-from os.path import abspath, expanduser, isdir, join
-from sys import argv
+from os.path import abspath, commonpath, dirname, expanduser, isdir, join
+from queue import Queue
+from sys import argv, stdin
+from threading import Thread
 
 from id3autosort import __version__
-from id3autosort.sorter import sort
+from id3autosort.cache import DEFAULT_CACHE_SIZE, MetadataCache
+from id3autosort.dirsnapshot import DirSnapshot
+from id3autosort.estimate import DEFAULT_SAMPLE_FRACTION, estimate, log_estimate
+from id3autosort.journal import MoveJournal
+from id3autosort.mover import DEFAULT_COPY_WORKERS, LINK_MODES, MoveEngine, SYMLINK
+from id3autosort.prefilter import AUDIO_EXTENSIONS, PreFilter
+from id3autosort.profiler import profiling, RunProfiler
+from id3autosort.quarantine import Quarantine
+from id3autosort.readorder import EXTENT_ORDER, READ_ORDERS, WALK_ORDER
+from id3autosort.scheduler import DEFAULT_ROTATIONAL_JOBS, group_by_device, run_per_device
+from id3autosort.sorter import sort, Structure, undo
+from id3autosort.stats import load_hook, log_report, RunStats, timing, write_report
+from id3autosort.walker import read_file_list, scan_files
+from id3autosort.watch import DEFAULT_SETTLE, make_watcher, watch
 
 
 logger = getLogger(__file__)
 
+STRUCTURE_TAGS = {"r": "{artist}", "l": "{album}", "d": "{date}", "g": "{genre}"}
+STRUCTURE_TAG_PATTERN = re.compile("|".join(STRUCTURE_TAGS.keys()))
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+SIZE_PATTERN = re.compile("^([0-9]+)([kmgt]?)b?$")
+
 
 class CustomLogs(Formatter):
 	FORMATS = {
@@ -65,16 +86,102 @@ def parse_args(**kwargs):
 		return expanded_path
 
 
+	def _absolute_file_path(path):
+		expanded_path = abspath(expanduser(path))
+
+		if isdir(expanded_path):
+			raise ArgumentTypeError("The given path is a directory: {0}".format(expanded_path))
+
+		if not access(dirname(expanded_path), R_OK | W_OK):
+			raise ArgumentTypeError("User cannot read/write to the directory: {0}".format(dirname(expanded_path)))
+
+		return expanded_path
+
+
+	def _file_list(path):
+		result = path
+
+		if path != "-":
+			result = abspath(expanduser(path))
+
+			if isdir(result) or not access(result, R_OK):
+				raise ArgumentTypeError("Not a readable file: {0}".format(result))
+
+		return result
+
+
+	def _positive_int(raw_value):
+		try:
+			value = int(raw_value)
+		except ValueError:
+			raise ArgumentTypeError("Not an integer: {0}".format(raw_value))
+
+		if value < 1:
+			raise ArgumentTypeError("Must be at least 1: {0}".format(raw_value))
+
+		return value
+
+
+	def _positive_float(raw_value):
+		try:
+			value = float(raw_value)
+		except ValueError:
+			raise ArgumentTypeError("Not a number: {0}".format(raw_value))
+
+		if not value > 0:
+			raise ArgumentTypeError("Must be more than 0: {0}".format(raw_value))
+
+		return value
+
+
+	def _fraction(raw_value):
+		try:
+			value = float(raw_value)
+		except ValueError:
+			raise ArgumentTypeError("Not a number: {0}".format(raw_value))
+
+		if not 0 < value <= 1:
+			raise ArgumentTypeError("Must be more than 0 and at most 1: {0}".format(raw_value))
+
+		return value
+
+
+	def _size(raw_size):
+		match = SIZE_PATTERN.match(raw_size.strip().lower())
+
+		if match is None:
+			raise ArgumentTypeError("Not a size: {0}".format(raw_size))
+
+		return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+	def _extensions(raw_extensions):
+		if raw_extensions.strip() == "*":
+			return None
+
+		if raw_extensions.strip().lower() == "audio":
+			return AUDIO_EXTENSIONS
+
+		return frozenset(ext.strip().lstrip(".").lower() for ext in raw_extensions.split(",") if ext.strip())
+
+
+	def _hook(spec):
+		try:
+			hook = load_hook(spec)
+		except ValueError as e:
+			raise ArgumentTypeError(str(e))
+
+		return hook
+
+
 	def _directory_structure(raw_structure):
 		expanded_structure = []
-		subs = {"r": "{artist}", "l": "{album}", "d": "{date}", "g": "{genre}"}
 		split_structure = [level for level in raw_structure.split(sep) if level != ""]
 
 		for level in split_structure:
-			pattern = re.compile("|".join(subs.keys()))
-			expanded_structure.append(pattern.sub(lambda x: subs[x.group(0)], level))
+			expanded_structure.append(STRUCTURE_TAG_PATTERN.sub(lambda x: STRUCTURE_TAGS[x.group(0)], level))
 
-		return sep.join(expanded_structure)
+		return Structure(sep.join(expanded_structure))
 
 
 	parser = ArgumentParser(
@@ -98,8 +205,10 @@ def parse_args(**kwargs):
 
 	parser.add_argument("-s", "--structure",
 						type=_directory_structure,
-						default=sep.join(["r", "l"]),
-						help = "Specify structure used to organize sorted MP3s")
+						action="append",
+						dest="structures",
+						help = ("Specify structure used to organize sorted MP3s; may be given more than once, "
+								"in which case files are moved into the first and linked into the others"))
 
 	parser.add_argument("-u", "--windows-unsafe",
 						dest="windows_safe",
@@ -117,12 +226,206 @@ def parse_args(**kwargs):
 						help="Don't actually move music files"
 						)
 
+	parser.add_argument("--estimate",
+						action="store_true",
+						help=("Don't sort; list every file but read the tags of only a random sample of them, "
+							  "and estimate how many files would be sorted and skipped, the directories made, "
+							  "the bytes copied across devices and how long it would take"))
+
+	parser.add_argument("--sample",
+						type=_fraction,
+						default=DEFAULT_SAMPLE_FRACTION,
+						metavar="FRACTION",
+						help="Fraction of files --estimate reads the tags of (default: %(default)s)")
+
+	parser.add_argument("-j", "--jobs",
+						type=_positive_int,
+						default=1,
+						help="Number of processes used to read tags")
+
+	parser.add_argument("--walk-threads",
+						type=_positive_int,
+						default=1,
+						help=("Number of directories to list at once; "
+							  "helps on network filesystems (default: %(default)s)"))
+
+	parser.add_argument("--rotational-jobs",
+						type=_positive_int,
+						default=DEFAULT_ROTATIONAL_JOBS,
+						help=("Most processes and directory listing threads used per spinning disk; "
+							  "input paths on different disks are sorted at the same time (default: %(default)s)"))
+
+	parser.add_argument("--read-order",
+						choices=READ_ORDERS + ("auto",),
+						default=WALK_ORDER,
+						help=("Order to read tags in: as files are found, by inode, by position on disk, "
+							  "or by position on spinning disks only (default: %(default)s)"))
+
+	parser.add_argument("-e", "--extensions",
+						type=_extensions,
+						help=("Comma-separated extensions of files to read tags from, or audio "
+							  "for every audio format Mutagen supports (default: any file)"))
+
+	parser.add_argument("--sniff",
+						action="store_true",
+						help="Only read tags from files whose first bytes look like audio")
+
+	parser.add_argument("--max-size",
+						type=_size,
+						help="Ignore files larger than this, e.g. 500M or 2G")
+
+	parser.add_argument("--keep-page-cache",
+						dest="drop_cache",
+						action="store_false",
+						help=("Leave files in the page cache after reading their tags "
+							  "instead of dropping them to spare everything else on the host"))
+
+	parser.add_argument("--file-timeout",
+						type=_positive_float,
+						metavar="SECONDS",
+						help=("Give up on files whose tags take longer than this to read, "
+							  "e.g. corrupt files or ones on an unresponsive network share"))
+
+	parser.add_argument("--quarantine",
+						type=_absolute_file_path,
+						metavar="QUARANTINE_FILE",
+						help="Record files given up on in this file and skip them until they are modified")
+
+	parser.add_argument("--cache",
+						type=_absolute_file_path,
+						metavar="CACHE_FILE",
+						help="Remember tags in this database so unchanged files aren't read again")
+
+	parser.add_argument("--cache-size",
+						type=_positive_int,
+						default=DEFAULT_CACHE_SIZE,
+						help="Number of files the tag cache remembers (default: %(default)s)")
+
+	parser.add_argument("--dir-snapshot",
+						type=_absolute_file_path,
+						metavar="SNAPSHOT_FILE",
+						help=("Remember directories in this file after sorting, and skip the files in ones "
+							  "that haven't had entries added, removed or renamed since"))
+
+	file_lists = parser.add_mutually_exclusive_group()
+
+	file_lists.add_argument("--files-from",
+							type=_file_list,
+							metavar="LIST_FILE",
+							help=("Sort only the files listed in this file, NUL-separated like find -print0 writes, "
+								  "instead of walking the input paths; files are sorted as the list arrives, "
+								  "files outside the input paths are skipped, and - reads the list from stdin"))
+
+	file_lists.add_argument("--from-stdin",
+							dest="files_from",
+							action="store_const",
+							const="-",
+							help="Same as --files-from -")
+
+	parser.add_argument("--copy-workers",
+						type=_positive_int,
+						default=DEFAULT_COPY_WORKERS,
+						help=("Number of files copied at once when moving them to another device "
+							  "(default: %(default)s)"))
+
+	parser.add_argument("--verify",
+						action="store_true",
+						help="Compare checksums of files copied to another device before deleting the originals")
+
+	parser.add_argument("--link",
+						choices=LINK_MODES,
+						help=("Build the sorted layout out of links to the files instead of moving them, "
+							  "leaving the input paths as they are; files that can't be linked are copied"))
+
+	parser.add_argument("--view-link",
+						choices=LINK_MODES,
+						default=SYMLINK,
+						help=("Kind of link used to add files to the views built from every structure "
+							  "after the first (default: %(default)s)"))
+
+	parser.add_argument("--journal",
+						type=_absolute_file_path,
+						metavar="JOURNAL_FILE",
+						help="Record every move in this file so interrupted sorts can be resumed or undone")
+
+	parser.add_argument("--resume",
+						action="store_true",
+						help="Skip files the journal shows were already moved, without reading their tags")
+
+	parser.add_argument("--undo",
+						action="store_true",
+						help="Move files the journal shows were moved from input_path to output_path back")
+
+	parser.add_argument("--watch",
+						action="store_true",
+						help=("Keep running after sorting, sorting new files as they arrive in the input paths; "
+							  "uses inotify on Linux and polling elsewhere"))
+
+	parser.add_argument("--settle",
+						type=_positive_float,
+						default=DEFAULT_SETTLE,
+						metavar="SECONDS",
+						help=("Seconds a directory has to go without changes before the files that arrived in it "
+							  "are sorted when watching (default: %(default)s)"))
+
+	parser.add_argument("--poll",
+						type=_positive_float,
+						metavar="SECONDS",
+						help=("Watch by rescanning the input paths this often instead of using inotify, "
+							  "e.g. for network filesystems"))
+
+	parser.add_argument("--stats",
+						action="store_true",
+						help="Report time spent in each stage, files per second and per-file latency")
+
+	parser.add_argument("--stats-json",
+						type=_absolute_file_path,
+						metavar="STATS_FILE",
+						help="Save the run's stats to this file as JSON")
+
+	parser.add_argument("--slowest",
+						type=_positive_int,
+						default=0,
+						metavar="N",
+						help="Report the N slowest files in each stage, with their size and format")
+
+	parser.add_argument("--profile",
+						type=_absolute_file_path,
+						metavar="PSTATS_FILE",
+						help="Profile the run with cProfile and save the results to this file")
+
+	parser.add_argument("--hook",
+						type=_hook,
+						action="append",
+						dest="hooks",
+						metavar="MODULE:NAME",
+						help=("Call a StageHook made by NAME in MODULE as each stage starts and finishes; "
+							  "may be given more than once"))
+
 	parser.add_argument("--version",
 						action="version",
 						version="%(prog)s {}".format(__version__))
 
 	args = parser.parse_args(kwargs.get("argv", argv[1:]))
-	
+
+	if (args.resume or args.undo) and args.journal is None:
+		parser.error("--resume and --undo need a --journal")
+
+	if args.watch and args.undo:
+		parser.error("--watch can't be used with --undo")
+
+	if args.files_from is not None and (args.watch or args.undo):
+		parser.error("--files-from and --from-stdin can't be used with --watch or --undo")
+
+	if args.estimate and (args.watch or args.undo):
+		parser.error("--estimate can't be used with --watch or --undo")
+
+	# The first structure decides where files go, the rest are views linking to them
+	structures = args.structures or [_directory_structure(sep.join(["r", "l"]))]
+	args.structure = structures[0]
+	args.views = structures[1:]
+	del args.structures
+
 	return args
 
 
@@ -138,10 +441,210 @@ def main():
 	logger.addHandler(log_hdlr)
 
 	logger.debug("Dry run: %s", args.dry_run)
+	logger.debug("Estimating from a sample of: %s", args.sample if args.estimate else None)
 	for path in args.src_paths:
 		logger.debug("Source path: %s", path)
 	logger.debug("Destination structure: %s%s%s", args.dest_path, sep, args.structure)
+	for view in args.views:
+		logger.debug("View structure: %s%s%s", args.dest_path, sep, view)
 	logger.debug("Windows-safe directories: %s", args.windows_safe)
-
-	for path in args.src_paths:
-		sort(logger, path, args.dest_path, args.structure, args.windows_safe, args.dry_run)
+	logger.debug("Tag reading processes: %d", args.jobs)
+	logger.debug("Directory listing threads: %d", args.walk_threads)
+	logger.debug("Processes/threads per spinning disk: %d", args.rotational_jobs)
+	logger.debug("Read order: %s", args.read_order)
+	logger.debug("Dropping files from page cache: %s", args.drop_cache)
+	logger.debug("Per-file timeout: %s", args.file_timeout)
+	logger.debug("Quarantine: %s", args.quarantine)
+	logger.debug("Tag cache: %s", args.cache)
+	logger.debug("Directory snapshot: %s", args.dir_snapshot)
+	logger.debug("File list: %s", "stdin" if args.files_from == "-" else args.files_from)
+	logger.debug("Allowed extensions: %s", "any" if args.extensions is None else ", ".join(sorted(args.extensions)))
+	logger.debug("Sniffing file contents: %s", args.sniff)
+	logger.debug("Maximum file size: %s", args.max_size)
+	logger.debug("Cross-device copy workers: %d", args.copy_workers)
+	logger.debug("Verifying copies: %s", args.verify)
+	logger.debug("Link mode: %s", args.link)
+	logger.debug("View link mode: %s", args.view_link)
+	logger.debug("Move journal: %s", args.journal)
+	logger.debug("Resuming: %s", args.resume)
+	logger.debug("Undoing: %s", args.undo)
+	logger.debug("Watching: %s", args.watch)
+	logger.debug("Settle time: %s", args.settle)
+	logger.debug("Poll interval: %s", args.poll)
+	logger.debug("Keeping stats: %s", args.stats or args.stats_json is not None)
+	logger.debug("Slowest files reported per stage: %d", args.slowest)
+	logger.debug("Profile: %s", args.profile)
+	logger.debug("Hooks: %s", args.hooks)
+
+	keep_stats = args.stats or args.stats_json is not None or args.slowest or args.hooks
+	cache = MetadataCache(args.cache, args.cache_size) if args.cache is not None else None
+	prefilter = PreFilter(args.extensions, args.sniff, args.max_size)
+	journal = MoveJournal(args.journal) if args.journal is not None else None
+	quarantine = Quarantine(args.quarantine) if args.quarantine is not None else None
+	snapshot = DirSnapshot(args.dir_snapshot) if args.dir_snapshot is not None else None
+	stats = RunStats(args.slowest, args.hooks or ()) if keep_stats else None
+	profiler = RunProfiler() if args.profile is not None else None
+
+	def _read_listed():
+		# Each listed file with the innermost input path it's in, as soon as it has been read
+		stream = stdin.buffer if args.files_from == "-" else open(args.files_from, "rb")
+
+		try:
+			for path in read_file_list(stream):
+				tops = [top for top in args.src_paths if path.startswith(top.rstrip(sep) + sep)]
+
+				if tops:
+					# Input paths can be nested; files belong to the innermost one they're in
+					yield (max(tops, key=len), path)
+				else:
+					logger.warning("Skipping %s, not inside any input path", path)
+		finally:
+			if stream is not stdin.buffer:
+				stream.close()
+
+
+	def _route_listed(groups):
+		# Hand listed files to the sort of the device they're on while the rest of the list is
+		# still being written; returns the files each input path's sort gets, the thread reading
+		# the list and what reading it failed with
+		queues = {}
+		failed = []
+
+		for (_, _, paths) in groups:
+			device_files = Queue()
+			queues.update((path, device_files) for path in paths)
+
+		def _read():
+			try:
+				for (top, path) in _read_listed():
+					queues[top].put(path)
+			except Exception as e:
+				failed.append(e)
+			finally:
+				for device_files in set(queues.values()):
+					device_files.put(None)
+
+		reader = Thread(target=_read, name="files-from", daemon=True)
+		reader.start()
+
+		return (dict((path, iter(device_files.get, None)) for (path, device_files) in queues.items()), reader, failed)
+
+
+	def _sort_options(jobs, walk_threads, mover, read_order):
+		# What every sort takes beyond where it sorts from and to, passed by name so none can be swapped
+		return dict(jobs=jobs, cache=cache, prefilter=prefilter, walk_threads=walk_threads, mover=mover,
+					journal=journal, resume=args.resume, read_order=read_order, drop_cache=args.drop_cache,
+					stats=stats, file_timeout=args.file_timeout, quarantine=quarantine, views=args.views)
+
+
+	def _sort_device(rotational, paths):
+		jobs = min(args.jobs, args.rotational_jobs) if rotational else args.jobs
+		walk_threads = min(args.walk_threads, args.rotational_jobs) if rotational else args.walk_threads
+		read_order = args.read_order
+
+		if read_order == "auto":
+			read_order = EXTENT_ORDER if rotational else WALK_ORDER
+		mover = MoveEngine(logger, args.copy_workers, args.verify, args.link, args.view_link)
+
+		logger.debug("Sorting %s from a %s disk with %d processes, %d listing threads, reading in %s order",
+					 ", ".join(paths), "spinning" if rotational else "solid state/unknown", jobs, walk_threads,
+					 read_order)
+		options = _sort_options(jobs, walk_threads, mover, read_order)
+
+		with profiling(profiler):
+			try:
+				if listed is not None:
+					# Listed files from every input path on the device come in one stream, so none
+					# waits on the list to finish before files in another input path are sorted
+					sort(logger, commonpath(paths), args.dest_path, args.structure, args.windows_safe,
+						 args.dry_run, files=listed[paths[0]], **options)
+				else:
+					for path in paths:
+						sort(logger, path, args.dest_path, args.structure, args.windows_safe, args.dry_run,
+							 snapshot=snapshot, **options)
+			finally:
+				# Copies still in flight update the cache and journal as they finish
+				with timing(stats, "move"):
+					mover.finish()
+
+
+	def _sort_arrivals(directory, files):
+		mover = MoveEngine(logger, args.copy_workers, args.verify, args.link, args.view_link)
+		read_order = WALK_ORDER if args.read_order == "auto" else args.read_order
+
+		with profiling(profiler):
+			try:
+				sort(logger, directory, args.dest_path, args.structure, args.windows_safe, args.dry_run,
+					 files=files, **_sort_options(min(args.jobs, len(files)), 1, mover, read_order))
+			finally:
+				with timing(stats, "move"):
+					mover.finish()
+
+
+	try:
+		with profiling(profiler):
+			if args.undo:
+				mover = MoveEngine(logger, args.copy_workers, args.verify)
+
+				try:
+					undo(logger, journal, args.src_paths, args.dest_path, args.dry_run, mover)
+				finally:
+					mover.finish()
+			elif args.estimate:
+				paths = ((path for (_, path) in _read_listed()) if args.files_from is not None
+						 else scan_files(logger, args.src_paths, threads=args.walk_threads))
+
+				log_estimate(logger, estimate(logger, paths, args.dest_path, args.structure, args.windows_safe,
+											  fraction=args.sample, jobs=args.jobs, cache=cache, prefilter=prefilter,
+											  link=args.link, drop_cache=args.drop_cache))
+			else:
+				# Watch from the start, so files arriving during the first sort aren't missed
+				watcher = make_watcher(logger, args.src_paths, args.poll) if args.watch else None
+
+				try:
+					groups = group_by_device(logger, args.src_paths)
+					(listed, reader, failed) = (_route_listed(groups) if args.files_from is not None
+												else (None, None, []))
+					run_per_device(groups, _sort_device)
+
+					if reader is not None:
+						reader.join()
+
+					if failed:
+						raise failed[0]
+
+					# Only once everything was sorted, or files left behind would be passed over next time
+					if snapshot is not None and not args.dry_run:
+						snapshot.save()
+
+					if watcher is not None:
+						logger.info("Watching %s for new music", ", ".join(args.src_paths))
+
+						try:
+							watch(logger, watcher, _sort_arrivals, args.settle)
+						except KeyboardInterrupt:
+							logger.info("Stopped watching")
+				finally:
+					if watcher is not None:
+						watcher.close()
+	finally:
+		if journal is not None:
+			journal.close()
+
+		if cache is not None:
+			cache.close()
+
+		if quarantine is not None:
+			quarantine.close()
+
+		if profiler is not None:
+			profiler.dump(args.profile)
+
+	if stats is not None:
+		report = stats.report()
+
+		if args.stats or args.slowest:
+			log_report(logger, report)
+
+		if args.stats_json is not None:
+			write_report(args.stats_json, report)
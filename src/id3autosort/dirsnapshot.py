@@ -0,0 +1,114 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+
+from os import replace
+from os.path import basename, exists, join, sep
+from threading import Lock
+
+
+SNAPSHOT_VERSION = 1
+
+
+class DirSnapshot(object):
+	"""
+	Directories as they were when last listed, so a walk can pass over the files
+	in ones that haven't changed since. A directory's modification time only changes
+	when entries are added to, removed from or renamed in it, so files modified in
+	place aren't noticed unless something else in their directory changes, and
+	subdirectories of an unchanged directory are still checked themselves.
+	Safe to share between threads.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: (str) Absolute path to the snapshot, created when saved
+		"""
+		self.path = path
+		self.dirs = {}
+		self.removed = set()
+		self.recorded = set()
+		self.lock = Lock()
+
+		if exists(path):
+			with open(path, "r", encoding="utf-8") as snapshot:
+				try:
+					saved = json.load(snapshot)
+				except ValueError:
+					saved = {}
+
+			if saved.get("version") == SNAPSHOT_VERSION:
+				self.dirs = saved["dirs"]
+
+	@staticmethod
+	def _state(dir_stat):
+		# ctime changes along with anything that sets the mtime back, like rsync -t or cp -p
+		return [dir_stat.st_ino, dir_stat.st_mtime_ns, dir_stat.st_ctime_ns]
+
+	def check(self, path, dir_stat):
+		"""
+		Check whether a directory is the same as when it was last listed.
+
+		:param path: (str) Absolute path to directory
+		:param dir_stat: (stat_result) Directory's current stat
+
+		:returns: (tuple) Absolute paths to its subdirectories when last listed, None if it has to
+						  be listed again; and its ctime in nanoseconds when last listed, which files
+						  new or changed since then have later ones than, None if it never was
+		"""
+		subdirs = None
+		since = None
+
+		with self.lock:
+			entry = self.dirs.get(path)
+
+		if entry is not None:
+			since = entry[2]
+
+			if entry[:3] == self._state(dir_stat):
+				subdirs = [join(path, name) for name in entry[3]]
+
+		return (subdirs, since)
+
+	def record(self, path, dir_stat, subdirs):
+		"""
+		Remember a directory as it was just listed.
+
+		:param path: (str) Absolute path to directory
+		:param dir_stat: (stat_result) Directory's stat from before it was listed
+		:param subdirs: (list) Absolute paths to its subdirectories
+		"""
+		names = [basename(subdir) for subdir in subdirs]
+
+		with self.lock:
+			entry = self.dirs.get(path)
+
+			if entry is not None:
+				self.removed.update(join(path, name) for name in set(entry[3]) - set(names))
+
+			self.dirs[path] = self._state(dir_stat) + [names]
+			self.recorded.add(path)
+
+	def save(self):
+		"""
+		Write the snapshot out, replacing the last one in one step.
+		"""
+		with self.lock:
+			if self.removed:
+				prefixes = tuple(removed + sep for removed in self.removed)
+				# Directories since made again under the same name were recorded afresh
+				self.dirs = dict((path, entry) for (path, entry) in self.dirs.items()
+								 if path in self.recorded
+								 or (path not in self.removed and not path.startswith(prefixes)))
+				self.removed = set()
+
+			with open(self.path + ".tmp", "w", encoding="utf-8") as snapshot:
+				json.dump({"version": SNAPSHOT_VERSION, "dirs": self.dirs}, snapshot)
+
+			replace(self.path + ".tmp", self.path)
@@ -0,0 +1,229 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import Counter, OrderedDict
+from math import sqrt
+from os import stat
+from random import Random
+from timeit import default_timer
+
+from id3autosort.mover import COPY_CHUNK_SIZE, SYMLINK
+from id3autosort.sorter import get_new_path, read_tags, screen_files
+from id3autosort.stats import _megabytes
+
+
+DEFAULT_SAMPLE_FRACTION = 0.01
+
+# Normal quantile of the 95% confidence intervals reported
+CONFIDENCE_Z = 1.96
+
+# Most bytes of sampled files read in full to measure how fast files that have to be copied can be read
+COPY_SAMPLE_BYTES = 64 * 1024 * 1024
+
+
+def _total(values, population):
+	"""
+	Scale a sample of per-file values up to a total over every file.
+
+	:param values: (list) Value for each sampled file
+	:param population: (int) Number of files sampled from
+
+	:returns: (list) Estimated total and the low and high ends of its confidence interval
+	"""
+	count = len(values)
+	mean = sum(values) / count if count else 0.0
+	variance = sum((value - mean) ** 2 for value in values) / (count - 1) if count > 1 else 0.0
+
+	# Sampling without replacement; a sample of every file is exact
+	correction = max(0.0, 1.0 - count / population) if population else 0.0
+	half = CONFIDENCE_Z * sqrt(variance / count * correction) if count else 0.0
+
+	return [population * mean, population * max(0.0, mean - half), population * (mean + half)]
+
+
+def estimate_distinct(counts, fraction):
+	"""
+	Estimate how many distinct values there are among every file from how often each turned up in
+	a sample, using Chao and Lin's lower bound for samples taken without replacement. Values seen
+	once or twice say how many were missed; a value common to many files is hardly ever missed.
+
+	:param counts: (dict) Number of sampled files each value turned up for
+	:param fraction: (float) Fraction of files sampled
+
+	:returns: (list) Estimated number of distinct values and the low and high ends of its confidence interval
+	"""
+	observed = len(counts)
+	sampled = sum(counts.values())
+	once = sum(1 for count in counts.values() if count == 1)
+	twice = sum(1 for count in counts.values() if count == 2)
+	unseen = 0.0
+	variance = 0.0
+
+	# Nothing is missed when every file was sampled
+	if once and fraction < 1.0:
+		pairs = 2.0 * sampled / (sampled - 1) if sampled > 1 else 2.0
+		odds = fraction / (1.0 - fraction)
+		denominator = pairs * twice + odds * once
+		unseen = once ** 2 / denominator
+
+		# Delta method over the numbers of values seen once and twice
+		total = observed + unseen
+		d_once = once * (2.0 * pairs * twice + odds * once) / denominator ** 2
+		d_twice = -pairs * once ** 2 / denominator ** 2
+		variance = (d_once ** 2 * once * (1.0 - once / total) + d_twice ** 2 * twice * (1.0 - twice / total)
+					- 2.0 * d_once * d_twice * once * twice / total)
+
+	result = observed + unseen
+	half = CONFIDENCE_Z * sqrt(max(0.0, variance))
+
+	return [result, max(float(observed), result - half), result + half]
+
+
+def _read_rate(path, budget):
+	"""
+	Time reading a file in full.
+
+	:param path: (str) Absolute path to file
+	:param budget: (int) Most bytes to read
+
+	:returns: (tuple) (int, float) Bytes read and seconds it took
+	"""
+	read = 0
+	start = default_timer()
+
+	with open(path, "rb") as music:
+		for chunk in iter(lambda: music.read(min(COPY_CHUNK_SIZE, budget - read)), b""):
+			read += len(chunk)
+
+	return (read, default_timer() - start)
+
+
+def estimate(logger, paths, out_dir, structure, windows_safe, *, fraction=DEFAULT_SAMPLE_FRACTION, jobs=1,
+			 cache=None, prefilter=None, link=None, drop_cache=False, seed=None):
+	"""
+	Estimate what sorting would involve without reading every file: list every
+	file, but read the tags of only a random sample of them and extrapolate.
+
+	:param logger: (Logger) Logging object
+	:param paths: (iterable) Strings representing absolute paths to possible music files, like a walk finds
+	:param out_dir: (str) Absolute path to music destination directory
+	:param structure: (Structure) Desired structure for music files inside root directory
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fraction: (float) Fraction of files to read the tags of
+	:param jobs: (int) Number of processes the sort would read tags with
+	:param cache: (MetadataCache/None) Cache of previously read tags the sort would consult
+	:param prefilter: (PreFilter/None) Checks files must pass before being read
+	:param link: (str/None) Kind of link the sort would make instead of moving files, None if it moves them
+	:param drop_cache: (bool) Whether or not to drop sampled files from the page cache after reading them
+	:param seed: (int/None) Seed for picking the sample, None for a different sample every time
+
+	:returns: (OrderedDict) Number of files found and sampled, then estimates of the files that would be
+							sorted, the rate files are skipped at, the destination directories made, the bytes
+							copied across devices and the wall time the sort takes; each estimate is
+							listed with the low and high ends of its 95% confidence interval
+	"""
+	result = OrderedDict()
+	random = Random(seed)
+	out_dev = stat(out_dir).st_dev
+	files = 0
+	skipped = []
+	copied = []
+	seconds = []
+	new_dirs = Counter()
+	sample_time = 0.0
+	(rate_bytes, rate_time) = (0, 0.0)
+	start = default_timer()
+
+	for path in paths:
+		if prefilter is not None and not prefilter.accepts_name(logger, path):
+			continue
+
+		files += 1
+
+		if random.random() >= fraction:
+			continue
+
+		sample_start = default_timer()
+		new_path = None
+		size = 0
+
+		for (_, _, tags) in screen_files(logger, [path], windows_safe, structure.fields, cache, prefilter):
+			if tags is None:
+				tags = read_tags(logger, path, windows_safe, structure.fields, drop_cache)
+
+			if tags is not None:
+				new_path = get_new_path(logger, out_dir, structure, tags)
+
+		read_time = default_timer() - sample_start
+
+		if new_path is not None:
+			try:
+				file_stat = stat(path)
+			except OSError:
+				new_path = None
+			else:
+				# Symlinks are all that never copies data across devices
+				if file_stat.st_dev != out_dev and link != SYMLINK:
+					size = file_stat.st_size
+
+		if size and rate_bytes < COPY_SAMPLE_BYTES:
+			(read, took) = _read_rate(path, COPY_SAMPLE_BYTES - rate_bytes)
+			rate_bytes += read
+			rate_time += took
+
+		skipped.append(0 if new_path is not None else 1)
+		copied.append(size)
+		seconds.append(read_time)
+
+		if new_path is not None:
+			new_dirs[new_path] += 1
+
+		sample_time += default_timer() - sample_start
+
+	walk_time = default_timer() - start - sample_time
+	if files and not skipped:
+		logger.warning("None of the %d files were picked to be read; estimate from a larger fraction of them", files)
+
+	copy_bytes = _total(copied, files)
+	read_seconds = _total(seconds, files)
+	# Copies are limited by how fast the files can be read; without a sample of them, assume no time
+	copy_rate = rate_bytes / rate_time if rate_time else None
+
+	result["files"] = files
+	result["sampled"] = len(skipped)
+	result["sorted"] = _total([1 - value for value in skipped], files)
+	result["skip_rate"] = [value / files if files else 0.0 for value in _total(skipped, files)]
+	result["directories"] = estimate_distinct(new_dirs, fraction)
+	result["cross_device_bytes"] = copy_bytes
+	result["copy_rate"] = copy_rate
+	result["walk_time"] = walk_time
+	# Reading tags is assumed to scale with the number of processes doing it
+	result["wall"] = [walk_time + reading / jobs + (copy / copy_rate if copy_rate else 0.0)
+					  for (reading, copy) in zip(read_seconds, copy_bytes)]
+
+	return result
+
+
+def log_estimate(logger, report):
+	"""
+	Log an estimate of what sorting would involve.
+
+	:param logger: (Logger) Logging object
+	:param report: (dict) Result of estimate()
+	"""
+	copy_rate = ", read at {0}/s".format(_megabytes(report["copy_rate"])) if report["copy_rate"] else ""
+
+	logger.info("Read tags of %d of %d files; ranges are 95%% confidence intervals",
+				report["sampled"], report["files"])
+	logger.info("Files sorted: %.0f (%.0f-%.0f)", *report["sorted"])
+	logger.info("Files skipped: %.1f%% (%.1f%%-%.1f%%)", *(rate * 100 for rate in report["skip_rate"]))
+	logger.info("Destination directories: %.0f (%.0f-%.0f)", *report["directories"])
+	logger.info("Copied across devices: %s (%s-%s)%s",
+				*([_megabytes(amount) for amount in report["cross_device_bytes"]] + [copy_rate]))
+	logger.info("Wall time: %.1fs (%.1fs-%.1fs), %.1fs of it listing files", *(report["wall"] + [report["walk_time"]]))
@@ -0,0 +1,143 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+
+from collections import OrderedDict
+from os import fsync
+from os.path import exists
+from threading import Lock
+
+
+# Completed moves recorded before they are forced to disk
+JOURNAL_SYNC_INTERVAL = 256
+
+PLAN = "plan"
+DONE = "done"
+UNDONE = "undone"
+
+
+class MoveJournal(object):
+	"""
+	Append-only log of the moves made while sorting. Moves are written and
+	synced before they happen, so the journal accounts for every move made
+	even if sorting is interrupted; completions are synced in batches.
+	Safe to share between threads.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: (str) Absolute path to the journal, created if missing
+		"""
+		self.planned = OrderedDict()
+		self.completed = OrderedDict()
+		self.pending = 0
+		self.lock = Lock()
+		line = "\n"
+
+		if exists(path):
+			with open(path, "r", encoding="utf-8") as journal:
+				for line in journal:
+					try:
+						(op, src, dest) = json.loads(line)
+					except ValueError:
+						# Interrupted in the middle of writing this entry
+						continue
+
+					self._apply(op, src, dest)
+
+		self.journal = open(path, "a", encoding="utf-8")
+
+		# Start after whatever an interruption left of the last entry
+		if not line.endswith("\n"):
+			self.journal.write("\n")
+
+	def _apply(self, op, src, dest):
+		if op == PLAN:
+			self.planned[(src, dest)] = True
+		elif op == DONE:
+			self.planned.pop((src, dest), None)
+			self.completed.pop((src, dest), None)
+			self.completed[(src, dest)] = True
+		elif op == UNDONE:
+			self.planned.pop((src, dest), None)
+			self.completed.pop((src, dest), None)
+
+	def _write(self, op, src, dest):
+		self.journal.write(json.dumps([op, src, dest]) + "\n")
+		self._apply(op, src, dest)
+
+	def _sync(self):
+		self.journal.flush()
+		fsync(self.journal.fileno())
+		self.pending = 0
+
+	def _record(self, op, src, dest):
+		self._write(op, src, dest)
+		self.pending += 1
+
+		if self.pending >= JOURNAL_SYNC_INTERVAL:
+			self._sync()
+
+	def moves(self):
+		"""
+		List the moves made and not undone, including ones that finished
+		without their completion reaching the journal.
+
+		:returns: (list) (str, str) Absolute paths each file was moved from and to,
+						 in the order they were moved
+		"""
+		with self.lock:
+			result = list(self.completed)
+			planned = list(self.planned)
+
+		for (src, dest) in planned:
+			if exists(dest) and not exists(src):
+				result.append((src, dest))
+
+		return result
+
+	def plan(self, moves):
+		"""
+		Record moves about to be made, returning once they are on disk.
+
+		:param moves: (iterable) (str, str) Absolute paths files will be moved from and to
+		"""
+		with self.lock:
+			for (src, dest) in moves:
+				self._write(PLAN, src, dest)
+
+			self._sync()
+
+	def done(self, src, dest):
+		"""
+		Record a move that was made.
+
+		:param src: (str) Absolute path the file was moved from
+		:param dest: (str) Absolute path the file was moved to
+		"""
+		with self.lock:
+			self._record(DONE, src, dest)
+
+	def undone(self, src, dest):
+		"""
+		Record a move that was reversed.
+
+		:param src: (str) Absolute path the file was originally moved from
+		:param dest: (str) Absolute path the file was originally moved to
+		"""
+		with self.lock:
+			self._record(UNDONE, src, dest)
+
+	def close(self):
+		"""
+		Write everything to disk.
+		"""
+		with self.lock:
+			self._sync()
+			self.journal.close()
@@ -0,0 +1,32 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from logging import DEBUG, INFO, WARNING
+
+
+class BufferedLogger(object):
+	"""
+	Stand-in for a Logger inside worker processes; messages are recorded
+	so they can be emitted by the real logger in a predictable order.
+	"""
+	def __init__(self):
+		self.records = []
+
+	def debug(self, msg, *args):
+		self.records.append((DEBUG, msg, args))
+
+	def info(self, msg, *args):
+		self.records.append((INFO, msg, args))
+
+	def warning(self, msg, *args):
+		self.records.append((WARNING, msg, args))
+
+	def replay(self, logger):
+		for (level, msg, args) in self.records:
+			logger.log(level, msg, *args)
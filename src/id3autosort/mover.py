@@ -0,0 +1,434 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from errno import EEXIST, EINVAL, ENOSYS, ENOTSUP, ENOTTY, EOPNOTSUPP, EPERM, EXDEV
+from hashlib import blake2b
+from os import lstat, remove, rename, stat
+from os.path import basename, dirname, exists, islink, join, lexists, samefile
+from shutil import copyfileobj, copystat
+
+import os
+
+try:
+	from fcntl import ioctl
+except ImportError:
+	ioctl = None
+
+
+DEFAULT_COPY_WORKERS = 4
+
+# Copies queued per worker before moving another file waits for one to finish
+COPY_QUEUE_DEPTH = 2
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+TEMP_SUFFIX = ".id3autosort-partial"
+
+HARD_LINK = "hard"
+REFLINK = "reflink"
+SYMLINK = "symlink"
+LINK_MODES = (HARD_LINK, REFLINK, SYMLINK)
+
+# Linux ioctl making a file share another's data blocks, on btrfs and XFS
+FICLONE = 0x40049409
+
+# Errors from linking files between filesystems, or on ones that can't link files that way
+UNSUPPORTED_LINK_ERRORS = frozenset([EINVAL, ENOSYS, ENOTSUP, ENOTTY, EOPNOTSUPP, EPERM, EXDEV])
+
+
+def _copy_data(src, dest, size):
+	"""
+	Copy the contents of one open file to another, keeping the data
+	in the kernel where the platform allows it.
+
+	:param src: (file) Source file opened for binary reading
+	:param dest: (file) Destination file opened for binary writing
+	:param size: (int) Number of bytes to copy
+	"""
+	copied = 0
+
+	for name in ["copy_file_range", "sendfile"]:
+		kernel_copy = getattr(os, name, None)
+
+		if kernel_copy is None:
+			continue
+
+		try:
+			while copied < size:
+				if name == "copy_file_range":
+					sent = kernel_copy(src.fileno(), dest.fileno(), min(COPY_CHUNK_SIZE, size - copied))
+				else:
+					sent = kernel_copy(dest.fileno(), src.fileno(), copied, min(COPY_CHUNK_SIZE, size - copied))
+
+				if not sent:
+					break
+
+				copied += sent
+		except OSError:
+			# Not supported between these filesystems; try the next way
+			# from wherever the previous one stopped
+			pass
+		else:
+			break
+
+	src.seek(copied)
+	dest.seek(copied)
+	copyfileobj(src, dest, COPY_CHUNK_SIZE)
+
+
+def checksum(path):
+	"""
+	Calculate a checksum of the given file's contents.
+
+	:param path: (str) Absolute path to file
+
+	:returns: (bytes) The file's digest
+	"""
+	digest = blake2b()
+
+	with open(path, "rb") as data:
+		for chunk in iter(lambda: data.read(COPY_CHUNK_SIZE), b""):
+			digest.update(chunk)
+
+	return digest.digest()
+
+
+def copy_file(src, dest, verify):
+	"""
+	Copy a file under a temporary name, optionally verify the copy and then put it in place.
+
+	:param src: (str) Absolute path to file to copy
+	:param dest: (str) Absolute path the copy should end up at
+	:param verify: (bool) Whether or not to compare checksums before putting the copy in place
+	"""
+	partial = join(dirname(dest), "." + basename(dest) + TEMP_SUFFIX)
+
+	try:
+		with open(src, "rb") as src_file, open(partial, "wb") as dest_file:
+			_copy_data(src_file, dest_file, os.fstat(src_file.fileno()).st_size)
+
+		# Keep modification times, which the metadata cache is keyed on
+		copystat(src, partial)
+
+		if verify and checksum(src) != checksum(partial):
+			raise IOError("Copy of {0} does not match the original".format(src))
+
+		rename(partial, dest)
+	except BaseException:
+		if exists(partial):
+			remove(partial)
+		raise
+
+
+def copy_move(src, dest, verify):
+	"""
+	Move a file across filesystems: copy it, optionally verify
+	the copy, and only once it is in place delete the original.
+
+	:param src: (str) Absolute path to file to move
+	:param dest: (str) Absolute path the file should end up at
+	:param verify: (bool) Whether or not to compare checksums before deleting the original
+	"""
+	copy_file(src, dest, verify)
+	remove(src)
+
+
+def reflink(src, dest):
+	"""
+	Make a new file sharing another's data blocks until either is written to,
+	so no data is copied. Only btrfs, XFS and a few other filesystems support it.
+
+	:param src: (str) Absolute path to file to share data blocks of
+	:param dest: (str) Absolute path to the new file
+	"""
+	if ioctl is None:
+		raise OSError(ENOTSUP, "Reflinks are not supported on this platform", dest)
+
+	with open(src, "rb") as src_file:
+		dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+
+		try:
+			try:
+				ioctl(dest_fd, FICLONE, src_file.fileno())
+			finally:
+				os.close(dest_fd)
+		except BaseException:
+			remove(dest)
+			raise
+
+	# Keep modification times, which the metadata cache is keyed on
+	copystat(src, dest)
+
+
+def link_file(src, dest, mode):
+	"""
+	Make a file appear at a second path without copying its data.
+
+	:param src: (str) Absolute path to file to link
+	:param dest: (str) Absolute path the link should be made at
+	:param mode: (str) Kind of link to make: hard link, reflink or symbolic link
+	"""
+	if mode == HARD_LINK:
+		os.link(src, dest)
+	elif mode == REFLINK:
+		reflink(src, dest)
+	elif mode == SYMLINK:
+		os.symlink(src, dest)
+	else:
+		raise ValueError("Unknown link mode {0}".format(mode))
+
+
+def already_linked(src, dest):
+	"""
+	Check whether a file was already linked or copied to the given path by an earlier sort.
+
+	:param src: (str) Absolute path to file
+	:param dest: (str) Absolute path to a link or copy of it
+
+	:returns: (bool) Whether dest is a hard or symbolic link to src, or a file matching it
+					 in size and modification time, as reflinks and copies do
+	"""
+	result = False
+
+	try:
+		if lexists(dest):
+			src_stat = stat(src)
+			dest_stat = lstat(dest)
+			result = samefile(src, dest) or (not islink(dest) and src_stat.st_size == dest_stat.st_size
+											  and src_stat.st_mtime_ns == dest_stat.st_mtime_ns)
+	except OSError:
+		pass
+
+	return result
+
+
+def remove_link(src, dest):
+	"""
+	Remove a link or copy of a file, leaving the file itself.
+
+	:param src: (str) Absolute path to file
+	:param dest: (str) Absolute path to a link or copy of it; checked to hold the same contents first
+	"""
+	if not samefile(src, dest):
+		if stat(src).st_size != stat(dest).st_size or checksum(src) != checksum(dest):
+			raise IOError("{0} is not a link to or copy of {1}".format(dest, src))
+
+	remove(dest)
+
+
+def rename_into(src, dest_dir, devices):
+	"""
+	Move a file into the given directory by renaming it, if both are on the same device.
+
+	:param src: (str) Absolute path to file to move
+	:param dest_dir: (str) Absolute path to directory to move file into
+	:param devices: (dict) Devices of directories, keyed by absolute path; updated as directories are seen
+
+	:returns: (bool) True if the file was renamed, False if it has to be copied across devices
+	"""
+	result = True
+	dest = join(dest_dir, basename(src))
+
+	# Renaming would silently replace an existing file
+	if exists(dest):
+		raise OSError(EEXIST, "Destination path already exists", dest)
+
+	if dest_dir not in devices:
+		devices[dest_dir] = stat(dest_dir).st_dev
+
+	if stat(src).st_dev == devices[dest_dir]:
+		try:
+			rename(src, dest)
+		except OSError as e:
+			# Mount points of the same device can't be renamed across either
+			if e.errno != EXDEV:
+				raise
+
+			result = False
+	else:
+		result = False
+
+	return result
+
+
+def move_file(src, dest_dir, verify=False, devices=None):
+	"""
+	Move a file into the given directory, keeping its name,
+	and wait for it to get there.
+
+	:param src: (str) Absolute path to file to move
+	:param dest_dir: (str) Absolute path to directory to move file into
+	:param verify: (bool) Whether or not to compare checksums before deleting the original of a copy
+	:param devices: (dict/None) Devices of directories, keyed by absolute path; updated as directories are seen
+
+	:returns: (str) Absolute path to the moved file
+	"""
+	dest = join(dest_dir, basename(src))
+
+	if not rename_into(src, dest_dir, devices if devices is not None else {}):
+		copy_move(src, dest, verify)
+
+	return dest
+
+
+class MoveEngine(object):
+	"""
+	Moves files into their new directories, renaming them when source and
+	destination share a device and copying them with a pool of workers otherwise.
+	Can instead link files into place and leave the originals, copying them
+	where links of the chosen kind can't be made.
+	Completion callbacks are always run on the thread that moves files.
+	"""
+	def __init__(self, logger, copy_workers=DEFAULT_COPY_WORKERS, verify=False, link=None, view_link=SYMLINK):
+		"""
+		:param logger: (Logger) Logging object
+		:param copy_workers: (int) Number of files to copy across devices at once
+		:param verify: (bool) Whether or not to compare checksums of copies before deleting originals
+		:param link: (str/None) Kind of link to make in place of moving files, None to move them
+		:param view_link: (str) Kind of link to make for files added to views
+		"""
+		self.logger = logger
+		self.copy_workers = copy_workers
+		self.verify = verify
+		self.link = link
+		self.view_link = view_link
+		self.devices = {}
+		self.unlinkable = set()
+		self.pending = deque()
+		self.pool = None
+
+	def _link_into(self, src, dest_dir):
+		"""
+		Link a file into the given directory, keeping its name.
+
+		:param src: (str) Absolute path to file to link
+		:param dest_dir: (str) Absolute path to directory to link file into
+
+		:returns: (bool/None) True if the file was linked, False if it has to be copied,
+							  None if an earlier sort already linked it there
+		"""
+		result = True
+		dest = join(dest_dir, basename(src))
+
+		if already_linked(src, dest):
+			self.logger.debug("File %s is already linked at %s, skipping", src, dest)
+			result = None
+		# Copies are renamed into place, which would silently replace an existing file
+		elif lexists(dest):
+			raise OSError(EEXIST, "Destination path already exists", dest)
+		else:
+			if dest_dir not in self.devices:
+				self.devices[dest_dir] = stat(dest_dir).st_dev
+
+			devices = (stat(src).st_dev, self.devices[dest_dir])
+
+			if devices in self.unlinkable:
+				result = False
+			else:
+				try:
+					link_file(src, dest, self.link)
+				except OSError as e:
+					if e.errno not in UNSUPPORTED_LINK_ERRORS:
+						raise
+
+					# Whatever stopped this link stops every other one between these devices
+					self.logger.info("Could not make %s links from %s to %s, copying files instead: %s",
+									 self.link, dirname(src), dest_dir, e)
+					self.unlinkable.add(devices)
+					result = False
+
+		return result
+
+	def _finish_oldest(self):
+		(src, dest, future, callback) = self.pending.popleft()
+
+		try:
+			future.result()
+		except Exception as e:
+			self.logger.info("Could not move file %s to new location: %s", src, e)
+		else:
+			if callback is not None:
+				callback(dest)
+
+	def move(self, src, dest_dir, callback=None):
+		"""
+		Move a file into the given directory, keeping its name. Cross-device moves
+		happen in the background; call finish() to wait for them.
+
+		:param src: (str) Absolute path to file to move
+		:param dest_dir: (str) Absolute path to directory to move file into
+		:param callback: (callable/None) Called with the file's new path once it has been moved
+										 or linked; not called for files an earlier sort already linked there
+		"""
+		dest = join(dest_dir, basename(src))
+
+		try:
+			if self.link is not None:
+				placed = self._link_into(src, dest_dir)
+			else:
+				placed = rename_into(src, dest_dir, self.devices)
+		except OSError as e:
+			self.logger.info("Could not move file %s to new location: %s", src, e)
+		else:
+			if placed:
+				if callback is not None:
+					callback(dest)
+			elif placed is not None:
+				if self.pool is None:
+					self.pool = ThreadPoolExecutor(max_workers=self.copy_workers)
+
+				if self.link is not None:
+					self.logger.debug("Copying file %s, it can't be linked", src)
+					copy = self.pool.submit(copy_file, src, dest, self.verify)
+				else:
+					self.logger.debug("Copying file %s across devices", src)
+					copy = self.pool.submit(copy_move, src, dest, self.verify)
+
+				self.pending.append((src, dest, copy, callback))
+
+				if len(self.pending) > self.copy_workers * COPY_QUEUE_DEPTH:
+					self._finish_oldest()
+
+	def add_view(self, src, dest_dir):
+		"""
+		Link a file already in place into another directory, keeping its name,
+		so it also shows up in another layout of the library. Never copies.
+
+		:param src: (str) Absolute path to file to link
+		:param dest_dir: (str) Absolute path to directory to link file into
+
+		:returns: (bool) True if the file was linked, False if it couldn't be
+						 or an earlier sort already linked it there
+		"""
+		result = False
+		dest = join(dest_dir, basename(src))
+
+		if already_linked(src, dest):
+			self.logger.debug("File %s is already linked at %s, skipping", src, dest)
+		else:
+			try:
+				link_file(src, dest, self.view_link)
+			except OSError as e:
+				self.logger.info("Could not link file %s into view %s: %s", src, dest_dir, e)
+			else:
+				result = True
+
+		return result
+
+	def finish(self):
+		"""
+		Wait for all background moves to complete.
+		"""
+		while self.pending:
+			self._finish_oldest()
+
+		if self.pool is not None:
+			self.pool.shutdown()
+			self.pool = None
@@ -0,0 +1,91 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import os
+
+from contextlib import contextmanager
+
+
+# Bytes at the start of a file worth reading ahead; enough for the tags of most
+# files without pulling in much of the audio that follows them
+TAG_REGION_SIZE = 256 * 1024
+
+
+def advise(fd, offset, length, advice):
+	"""
+	Tell the kernel how a file is about to be used, if the platform allows it.
+
+	:param fd: (int) Open file descriptor
+	:param offset: (int) Start of the region the advice is about
+	:param length: (int) Length of the region, 0 for the rest of the file
+	:param advice: (str) Name of the os.POSIX_FADV_* constant to give
+	"""
+	posix_fadvise = getattr(os, "posix_fadvise", None)
+
+	if posix_fadvise is not None:
+		try:
+			posix_fadvise(fd, offset, length, getattr(os, advice))
+		except OSError:
+			# Advice is only advice; some filesystems don't take it
+			pass
+
+
+@contextmanager
+def tag_read_hints(path, drop_cache=True):
+	"""
+	Context manager wrapping reading a file's tags: the start of the file is read
+	ahead before the wrapped reads, and its pages are dropped from the page cache
+	after them so scanning a library doesn't evict everything else on the host.
+
+	:param path: (str) Absolute path to music file
+	:param drop_cache: (bool) Whether or not to drop the file's pages afterwards
+	"""
+	try:
+		fd = os.open(path, os.O_RDONLY)
+	except OSError:
+		# Let reading the file report the problem
+		fd = None
+
+	if fd is not None:
+		advise(fd, 0, TAG_REGION_SIZE, "POSIX_FADV_WILLNEED")
+
+	try:
+		yield
+	finally:
+		if fd is not None:
+			if drop_cache:
+				advise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+
+			os.close(fd)
+
+
+def drop_pages(path, written=False):
+	"""
+	Drop a file's pages from the page cache, once nothing is going to read it again soon.
+
+	:param path: (str) Absolute path to file
+	:param written: (bool) Whether or not the file was just written to; pages not yet
+						   written back can't be dropped, so they're flushed first
+	"""
+	try:
+		fd = os.open(path, os.O_RDONLY)
+	except OSError:
+		fd = None
+
+	if fd is not None:
+		try:
+			if written and hasattr(os, "posix_fadvise"):
+				getattr(os, "fdatasync", os.fsync)(fd)
+
+			advise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+		except OSError:
+			# Flushing is only there for the advice to take
+			pass
+		finally:
+			os.close(fd)
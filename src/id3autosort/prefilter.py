@@ -0,0 +1,129 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from os.path import basename
+
+
+# Extensions of the audio formats Mutagen can read
+AUDIO_EXTENSIONS = frozenset([
+	"3g2", "aac", "ac3", "aif", "aifc", "aiff", "ape", "asf", "dff", "dsf",
+	"eac3", "flac", "m4a", "m4b", "m4p", "m4r", "mp+", "mp2", "mp3", "mp4",
+	"mpc", "ofr", "ofs", "oga", "ogg", "ogx", "opus", "spx", "tak", "tta",
+	"wav", "wma", "wv",
+	])
+
+# Leading bytes of the audio formats Mutagen can read
+AUDIO_MAGIC = (
+	b"ID3", b"fLaC", b"OggS", b"FORM", b"RIFF", b"RF64", b"MAC ", b"wvpk",
+	b"MPCK", b"MP+", b"TTA1", b"DSD ", b"FRM8", b"tBaK", b"OFR ", b"\x0b\x77",
+	b"\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c",
+	)
+
+SNIFF_SIZE = 16
+
+
+def sniff_audio(header):
+	"""
+	Determine if the given leading bytes of a file look like an audio format Mutagen can read.
+
+	:param header: (bytes) First bytes of a file
+
+	:returns: (bool) True if the file looks like audio, False otherwise
+	"""
+	header = bytearray(header)
+
+	# MP4 containers start with their size, then the file type atom;
+	# MPEG audio and ADTS streams may not have any tags in front of their first frame
+	return (header.startswith(AUDIO_MAGIC)
+			or header[4:8] == b"ftyp"
+			or (len(header) >= 2 and header[0] == 0xff and header[1] & 0xe0 == 0xe0))
+
+
+class PreFilter(object):
+	"""
+	Cheap checks ruling out files that can't be music before Mutagen is asked to parse them.
+	"""
+	def __init__(self, extensions=AUDIO_EXTENSIONS, sniff=False, max_size=None):
+		"""
+		:param extensions: (iterable/None) Lowercase extensions music files may have,
+										   None to allow any extension
+		:param sniff: (bool) Whether or not to require files start like a known audio format
+		:param max_size: (int/None) Size in bytes files must not exceed, None for no limit
+		"""
+		self.extensions = frozenset(extensions) if extensions is not None else None
+		self.sniff = sniff
+		self.max_size = max_size
+
+	@property
+	def needs_stat(self):
+		return self.max_size is not None
+
+	def accepts_name(self, logger, path):
+		"""
+		Check the file's extension against the allowlist.
+
+		:param logger: (Logger) Logging object
+		:param path: (str) Absolute path to possible music file
+
+		:returns: (bool) True if the file may be music, False otherwise
+		"""
+		result = True
+
+		if self.extensions is not None:
+			name = basename(path)
+			extension = name.rsplit(".", 1)[1].lower() if "." in name else ""
+
+			if extension not in self.extensions:
+				logger.debug("Skipping %s, extension is not allowed", path)
+				result = False
+
+		return result
+
+	def accepts_stat(self, logger, path, file_stat):
+		"""
+		Check the file's size against the limit.
+
+		:param logger: (Logger) Logging object
+		:param path: (str) Absolute path to possible music file
+		:param file_stat: (stat_result) Status of the file
+
+		:returns: (bool) True if the file may be music, False otherwise
+		"""
+		result = True
+
+		if self.max_size is not None and file_stat.st_size > self.max_size:
+			logger.debug("Skipping %s, larger than %d bytes", path, self.max_size)
+			result = False
+
+		return result
+
+	def accepts_content(self, logger, path):
+		"""
+		Check the first bytes of the file against known audio formats.
+
+		:param logger: (Logger) Logging object
+		:param path: (str) Absolute path to possible music file
+
+		:returns: (bool) True if the file may be music, False otherwise
+		"""
+		result = True
+
+		if self.sniff:
+			try:
+				with open(path, "rb") as music:
+					header = music.read(SNIFF_SIZE)
+			except EnvironmentError:
+				# Let reading the file report the problem
+				pass
+			else:
+				if not sniff_audio(header):
+					logger.debug("Skipping %s, contents don't look like audio", path)
+					result = False
+
+		return result
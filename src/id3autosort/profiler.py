@@ -0,0 +1,87 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from contextlib import contextmanager
+from cProfile import Profile
+from pstats import Stats
+from threading import local, Lock
+
+
+class RunProfiler(object):
+	"""
+	cProfile across every thread of a run; each thread profiles itself
+	and the profiles are combined into one pstats file at the end.
+	Work done in tag reading processes isn't included.
+	"""
+	def __init__(self):
+		self.lock = Lock()
+		self.local = local()
+		self.profiles = []
+
+	@contextmanager
+	def profiling(self):
+		"""
+		Profile the current thread for the duration of the block,
+		unless it's already being profiled by an enclosing block.
+		"""
+		profile = None
+
+		if not getattr(self.local, "active", False):
+			profile = Profile()
+
+			try:
+				profile.enable()
+			except ValueError:
+				# Python 3.12+ profiles every thread with the first profile enabled
+				profile = None
+
+		if profile is None:
+			yield
+		else:
+			self.local.active = True
+
+			try:
+				yield
+			finally:
+				profile.disable()
+				self.local.active = False
+
+				with self.lock:
+					self.profiles.append(profile)
+
+	def dump(self, path):
+		"""
+		Save everything profiled so far.
+
+		:param path: (str) Absolute path to pstats file to write
+		"""
+		with self.lock:
+			if self.profiles:
+				stats = Stats(self.profiles[0])
+
+				for profile in self.profiles[1:]:
+					stats.add(profile)
+
+				stats.dump_stats(path)
+
+
+@contextmanager
+def _unprofiled():
+	yield
+
+
+def profiling(profiler):
+	"""
+	Profile the current thread for the duration of the block, if the run is being profiled.
+
+	:param profiler: (RunProfiler/None) Profiler for the run
+
+	:returns: (context manager) Profiling for the block, or one doing nothing
+	"""
+	return profiler.profiling() if profiler is not None else _unprofiled()
@@ -0,0 +1,83 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+
+from os import stat
+from os.path import exists
+from threading import Lock
+
+
+class Quarantine(object):
+	"""
+	Append-only list of files that took too long to read or crashed the reader.
+	A quarantined file is skipped until it is modified. Safe to share between threads.
+	"""
+	def __init__(self, path):
+		"""
+		:param path: (str) Absolute path to the quarantine list, created if missing
+		"""
+		self.held = {}
+		self.lock = Lock()
+		line = "\n"
+
+		if exists(path):
+			with open(path, "r", encoding="utf-8") as quarantine:
+				for line in quarantine:
+					try:
+						(held_path, mtime, _) = json.loads(line)
+					except ValueError:
+						# Interrupted in the middle of writing this entry
+						continue
+
+					self.held[held_path] = mtime
+
+		self.quarantine = open(path, "a", encoding="utf-8")
+
+		# Start after whatever an interruption left of the last entry
+		if not line.endswith("\n"):
+			self.quarantine.write("\n")
+
+	def holds(self, path, file_stat):
+		"""
+		Check whether a file was quarantined and hasn't been modified since.
+
+		:param path: (str) Absolute path to file
+		:param file_stat: (stat_result) File's current stat
+
+		:returns: (bool) Whether or not the file should be skipped
+		"""
+		with self.lock:
+			result = self.held.get(path) == file_stat.st_mtime_ns
+
+		return result
+
+	def add(self, path, reason, file_stat=None):
+		"""
+		Quarantine a file as it is now.
+
+		:param path: (str) Absolute path to file
+		:param reason: (str) Why the file was quarantined
+		:param file_stat: (stat_result/None) File's stat, None to stat it now
+		"""
+		if file_stat is None:
+			try:
+				file_stat = stat(path)
+			except OSError:
+				# Gone or unreachable; there's nothing to tell a later version apart from
+				return
+
+		with self.lock:
+			self.quarantine.write(json.dumps([path, file_stat.st_mtime_ns, reason]) + "\n")
+			self.quarantine.flush()
+			self.held[path] = file_stat.st_mtime_ns
+
+	def close(self):
+		with self.lock:
+			self.quarantine.close()
@@ -0,0 +1,127 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import struct
+
+from os import stat
+
+try:
+	from fcntl import ioctl
+except ImportError:
+	ioctl = None
+
+
+WALK_ORDER = "walk"
+INODE_ORDER = "inode"
+EXTENT_ORDER = "extent"
+READ_ORDERS = (WALK_ORDER, INODE_ORDER, EXTENT_ORDER)
+
+# Files waiting to be read that are put in order at a time;
+# bounds how far reading can lag behind the walk
+DEFAULT_READ_WINDOW = 4096
+
+# Linux ioctl mapping a file's logical blocks to where they are on disk
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct("=QQLLLL")
+FIEMAP_EXTENT = struct.Struct("=QQQQQLLLL")
+
+
+def physical_offset(path):
+	"""
+	Find where on disk the start of the given file is stored.
+
+	:param path: (str) Absolute path to file
+
+	:returns: (int/None) Byte offset of the file's first extent on its device,
+						 None if the filesystem or platform can't say
+	"""
+	result = None
+
+	if ioctl is not None:
+		request = bytearray(FIEMAP_HEADER.pack(0, 2 ** 64 - 1, 0, 0, 1, 0) + b"\0" * FIEMAP_EXTENT.size)
+
+		try:
+			with open(path, "rb") as music:
+				ioctl(music.fileno(), FS_IOC_FIEMAP, request, True)
+		except EnvironmentError:
+			pass
+		else:
+			mapped_extents = FIEMAP_HEADER.unpack_from(request)[3]
+
+			if mapped_extents:
+				result = FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+	return result
+
+
+def read_order_key(order, path, file_stat=None):
+	"""
+	Determine where a file goes in the order files are read in.
+
+	:param order: (str) INODE_ORDER or EXTENT_ORDER
+	:param path: (str) Absolute path to file
+	:param file_stat: (stat_result/None) Status of the file, if already known
+
+	:returns: (tuple) Sort key; files whose extents can't be found go after the others, by inode
+	"""
+	offset = physical_offset(path) if order == EXTENT_ORDER else None
+
+	if offset is not None:
+		result = (0, offset)
+	else:
+		try:
+			result = (1, (file_stat or stat(path)).st_ino)
+		except OSError:
+			# Let reading the file report the problem
+			result = (2, 0)
+
+	return result
+
+
+def order_reads(logger, lookups, order, window=DEFAULT_READ_WINDOW):
+	"""
+	Reorder files waiting to have their tags read so a spinning disk
+	can read them in one sweep instead of seeking back and forth.
+
+	:param logger: (Logger) Logging object
+	:param lookups: (iterable) (path, FileStat/None, dict/None) tuples from screen_files()
+	:param order: (str) INODE_ORDER or EXTENT_ORDER
+	:param window: (int) Number of files waiting to be read to put in order at a time
+
+	:returns: (generator) The same tuples; ones with tags pass straight through,
+						  the rest come out ordered a window at a time
+	"""
+	waiting = []
+
+	def _flush():
+		logger.debug("Ordering %d files by %s before reading them", len(waiting), order)
+		waiting.sort(key=lambda entry: entry[0])
+
+		for (_, lookup) in waiting:
+			yield lookup
+
+		del waiting[:]
+
+
+	for lookup in lookups:
+		(path, file_stat, tags) = lookup
+
+		if tags is not None:
+			yield lookup
+			continue
+
+		waiting.append((read_order_key(order, path, file_stat), lookup))
+
+		if len(waiting) >= window:
+			for ordered in _flush():
+				yield ordered
+
+	if waiting:
+		for ordered in _flush():
+			yield ordered
@@ -0,0 +1,102 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from os import stat
+from os.path import join
+
+try:
+	from os import major, minor
+except ImportError:
+	major = minor = None
+
+
+# Processes and directory listing threads used per spinning disk by default;
+# more just makes the heads seek between files
+DEFAULT_ROTATIONAL_JOBS = 2
+
+SYS_BLOCK_DEVICES = "/sys/dev/block"
+
+
+def is_rotational(device):
+	"""
+	Determine whether the given device is a spinning disk.
+
+	:param device: (int) Device number, as in st_dev
+
+	:returns: (bool/None) True for spinning disks, False for solid state ones,
+						  None if the kind of disk can't be determined, like on Windows
+	"""
+	result = None
+	queues = []
+
+	# Device numbers can't be split up where there's no /sys to look them up in anyway
+	if major is not None:
+		block_device = join(SYS_BLOCK_DEVICES, "{0}:{1}".format(major(device), minor(device)))
+		# Partitions don't have queues of their own, the disks they're on do
+		queues = [join(block_device, "queue"), join(block_device, "..", "queue")]
+
+	for queue in queues:
+		try:
+			with open(join(queue, "rotational"), "r") as rotational:
+				result = rotational.read().strip() == "1"
+		except EnvironmentError:
+			continue
+		else:
+			break
+
+	return result
+
+
+def group_by_device(logger, paths):
+	"""
+	Group paths by the device they're on.
+
+	:param logger: (Logger) Logging object
+	:param paths: (iterable) Strings representing absolute paths
+
+	:returns: (list) (int/None, bool/None, list) tuples of each device number, whether it's
+					 a spinning disk and the paths on it, in the order the devices were first seen
+	"""
+	groups = OrderedDict()
+
+	for path in paths:
+		try:
+			device = stat(path).st_dev
+		except OSError as e:
+			# Let sorting the path report the problem
+			logger.debug("Could not find device of %s: %s", path, e)
+			device = None
+
+		groups.setdefault(device, []).append(path)
+
+	return [(device, is_rotational(device) if device is not None else None, device_paths)
+			for (device, device_paths) in groups.items()]
+
+
+def run_per_device(groups, work):
+	"""
+	Work on each device's paths at the same time as the other devices'.
+
+	:param groups: (list) (int/None, bool/None, list) tuples from group_by_device()
+	:param work: (callable) Called with whether a device is a spinning disk
+							and its paths, once per device
+
+	:returns: (list) What each call returned, in the order of the groups
+	"""
+	if len(groups) == 1:
+		(_, rotational, paths) = groups[0]
+		result = [work(rotational, paths)]
+	else:
+		with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+			futures = [pool.submit(work, rotational, paths) for (_, rotational, paths) in groups]
+			result = [future.result() for future in futures]
+
+	return result
@@ -9,19 +9,47 @@
 
 import re
 
-from os import makedirs, walk
-from os.path import isdir, join
-from shutil import move
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from os import makedirs, stat
+from os.path import basename, dirname, isdir, join, lexists, sep
+from string import Formatter
+from sys import intern
 from unicodedata import normalize
 
 from mutagen import File
 
+from id3autosort.logbuffer import BufferedLogger
+from id3autosort.mover import MoveEngine, remove_link
+from id3autosort.pagecache import tag_read_hints
+from id3autosort.readorder import order_reads, WALK_ORDER
+from id3autosort.stats import RunStats, timing
+from id3autosort.tagreader import read_tag_fields
+from id3autosort.walker import scan_files
+from id3autosort.watchdog import DONE, SKIPPED, TIMED_OUT, WatchdogPool
+
 
 PATH_CHARS = re.compile("[/\\\\]")
 WINDOWS_UNSAFE_CHARS = re.compile("[:<>\"\*\?\|]")
 
+# Distinct tag values whose normalized form is remembered
+NORMALIZE_CACHE_SIZE = 65536
+
+# Files each worker process parses per task when sorting with multiple jobs;
+# large enough to amortize IPC, small enough to keep the workers balanced
+JOB_CHUNK_SIZE = 16
+
+# Tasks queued per worker process before the walk waits for results,
+# which bounds how many files are in flight at once
+JOB_QUEUE_DEPTH = 2
+
+# Files gathered before they are moved, grouped by destination directory
+MOVE_BATCH_SIZE = 256
 
-def normalize_tags(logger, md, windows_safe):
+
+def normalize_tags(logger, md, windows_safe, fields=None):
 	"""
 	Modify or remove characters in tags that would cause issues when stored on a filesystem.
 	Additionally, handle formats Mutagen recognizes but does not have an easy-mode version for,
@@ -30,11 +58,10 @@ def normalize_tags(logger, md, windows_safe):
 	:param logger: (Logger) Logging object
 	:param md: Mutagen metadata structure
 	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fields: (iterable/None) Names of the tags needed, None to normalize every tag
 
 	:returns: (dict) A normalized dict of tags
 	"""
-	normalized = {}
-
 	def _structure_aiff_tags(tags):
 		structured = {}
 
@@ -71,13 +98,66 @@ def normalize_tags(logger, md, windows_safe):
 
 	# Mutagen doesn't have easy mode for all audio formats,
 	# convert those certain formats' tags to easy mode manually
-	unstructured_mimes = {"audio/aiff": _structure_aiff_tags, "audio/x-wma": _structure_wma_tags}
+	unstructured_mimes = {
+		"audio/aiff": _structure_aiff_tags,
+		"audio/wav": _structure_aiff_tags,
+		"audio/x-wma": _structure_wma_tags,
+		}
 	unstructured = list(filter(lambda m: m in md.mime, unstructured_mimes.keys()))
-	if unstructured:
+	if md.tags is None:
+		raw_tags = {}
+	elif unstructured:
 		raw_tags = unstructured_mimes[unstructured[0]](md.tags)
 	else:
 		raw_tags = md.tags
 
+	return normalize_tag_values(logger, raw_tags, windows_safe, fields)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_value(value, windows_safe):
+	"""
+	Modify or remove characters in a single tag value that would cause issues when stored on a filesystem.
+	Artist and album names repeat across whole libraries, so results are memoized.
+
+	:param value: (str) Tag value
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+
+	:returns: (str) The normalized value, which may be empty
+	"""
+	# Explicitly replace backslashes and forward slashes with underscores
+	# regardless of platform
+	value = PATH_CHARS.sub("_", value)
+
+	if windows_safe:
+		# Remove the other characters Windows doesn't like
+		value = WINDOWS_UNSAFE_CHARS.sub("", value)
+
+		# Convert characters the furriners use to good-ol' 'MURICAN letters
+		# NTFS is probably fine, but FAT32 ruins everything good in this world
+		value = normalize("NFD", value).encode("ascii", "ignore").decode("ascii")
+
+		# Unix-based OSs are fine with an NTFS directory ending with a period,
+		# but Windows will refuse to open them,
+		# so make sure directories don't end in a period for Windows-safety
+		if value.endswith("."):
+			value = value[:-1]
+
+	return value
+
+
+def normalize_tag_values(logger, raw_tags, windows_safe, fields=None):
+	"""
+	Modify or remove characters in easy-mode tags that would cause issues when stored on a filesystem.
+
+	:param logger: (Logger) Logging object
+	:param raw_tags: Easy-mode tags, mapping names to values or lists of values
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fields: (iterable/None) Names of the tags needed, None to normalize every tag
+
+	:returns: (dict) A normalized dict of tags
+	"""
+	normalized = {}
 
 	logger.debug("Original tags: %s", raw_tags)
 
@@ -86,55 +166,53 @@ def normalize_tags(logger, md, windows_safe):
 	# Just use the first value even if it is a multi-item tag
 	# Encode/decode combo because date value might not be a string
 	for (k, v) in raw_tags.items():
+		if fields is not None and k not in fields:
+			continue
+
 		if isinstance(v, list):
 			this_value = v[0].encode("utf-8").decode("utf-8")
 		else:
 			this_value = v.encode("utf-8").decode("utf-8")
 
+		this_value = normalize_value(this_value, windows_safe)
+
 		# Skip empty tags
 		if not this_value:
 			logger.debug("Skipping empty tag %s", k)
 			continue
 
-		# Explicitly replace backslashes and forward slashes with underscores
-		# regardless of platform
-		this_value = PATH_CHARS.sub("_", this_value)
-
-		if windows_safe:
-			# Remove the other characters Windows doesn't like
-			this_value = WINDOWS_UNSAFE_CHARS.sub("", this_value)
-
-			# Convert characters the furriners use to good-ol' 'MURICAN letters
-			# NTFS is probably fine, but FAT32 ruins everything good in this world
-			this_value = normalize("NFD", this_value).encode("ascii", "ignore").decode("ascii")
-
-			# Unix-based OSs are fine with an NTFS directory ending with a period,
-			# but Windows will refuse to open them,
-			# so make sure directories don't end in a period for Windows-safety
-			if this_value[-1] == ".":
-				this_value = this_value[:-1]
-
 		normalized[k] = this_value
 
 	logger.debug("Normalized tags: %s", normalized)
 	return normalized
 
 
-def get_music_files(logger, music_dir):
+def read_tags(logger, path, windows_safe, fields=None, drop_cache=False, stats=None):
 	"""
-	Obtain a list of all music files Mutagen can read metadata for inside the given directory.
+	Parse the given file and reduce it to the normalized tags used to build its new path.
+	If the needed fields are known, try reading just those before falling back to Mutagen.
 
-	:param logger: (logger) Logging object
-	:param music_dir: (str) Absolute path to directory to check for music files
+	:param logger: (Logger) Logging object
+	:param path: (str) Absolute path to possible music file
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fields: (iterable/None) Names of the tags needed, None to read every tag
+	:param drop_cache: (bool) Whether or not to drop the file from the page cache after reading it
+	:param stats: (RunStats/None) Stats to record time spent normalizing in
 
-	:returns: (list) All music files Mutagen can read metadata for inside the given directory
+	:returns: None if Mutagen could not read metadata for the file,
+			  a normalized dict of tags otherwise
 	"""
-	valid_files = []
+	tags = None
+
+	with tag_read_hints(path, drop_cache):
+		raw_tags = None if fields is None else read_tag_fields(path, fields)
 
-	for (basedir, dirs, basenames) in walk(music_dir):
-		maybe_valid = [join(basedir, name) for name in basenames]
+		if raw_tags is not None:
+			logger.debug("Read tags from %s without a full parse", path)
 
-		for path in maybe_valid:
+			with timing(stats, "normalize", path):
+				tags = normalize_tag_values(logger, raw_tags, windows_safe, fields)
+		else:
 			try:
 				logger.debug("Attempting to parse %s", path)
 				parsed_file = File(path, easy=True)
@@ -144,30 +222,350 @@ def get_music_files(logger, music_dir):
 				if parsed_file is None:
 					logger.debug("File %s has no music metadata", path)
 				else:
-					valid_files.append((path, parsed_file))
+					with timing(stats, "normalize", path):
+						tags = normalize_tags(logger, parsed_file, windows_safe, fields)
+
+	return tags
+
+
+def _read_tags_job(paths, windows_safe, fields, drop_cache, timed=False, slowest=0):
+	"""
+	Worker process entry point for read_tags(); log messages are
+	sent back alongside the tags instead of being emitted directly.
+
+	:param paths: (list) Absolute paths to possible music files
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fields: (iterable/None) Names of the tags needed, None to read every tag
+	:param drop_cache: (bool) Whether or not to drop files from the page cache after reading them
+	:param timed: (bool) Whether or not to keep stats on reading the files
+	:param slowest: (int) Number of slowest files to remember per stage when keeping stats
+
+	:returns: (tuple) List of (path, dict/None, BufferedLogger) tuples of normalized tags
+					  and log messages from parsing each file, and a RunStats snapshot or None
+	"""
+	stats = RunStats(slowest) if timed else None
+	results = []
+
+	for path in paths:
+		buffered = BufferedLogger()
+
+		with timing(stats, "parse", path, latency=True):
+			tags = read_tags(buffered, path, windows_safe, fields, drop_cache, stats)
+
+		results.append((path, tags, buffered))
+
+	return (results, stats.snapshot() if stats is not None else None)
+
+
+def _read_lookup_job(lookup, windows_safe, fields, drop_cache, timed=False, slowest=0):
+	"""
+	Watchdog worker entry point for reading the tags of one file screen_files() passed.
+
+	:param lookup: (tuple) (path, stat_result/None, dict/None) tuple from screen_files()
+
+	:returns: (tuple) Same as _read_tags_job() for the one file
+	"""
+	return _read_tags_job([lookup[0]], windows_safe, fields, drop_cache, timed, slowest)
+
+
+class FileStat(object):
+	"""
+	The parts of a file's stat that screening files, caching their tags and putting
+	reads in order use, standing in for a whole stat_result at a third of the size,
+	since thousands are held at once while reads are put in order or wait on workers.
+	"""
+	__slots__ = ("st_dev", "st_ino", "st_size", "st_mtime_ns")
+
+	def __init__(self, file_stat):
+		"""
+		:param file_stat: (stat_result) File's full stat
+		"""
+		self.st_dev = file_stat.st_dev
+		self.st_ino = file_stat.st_ino
+		self.st_size = file_stat.st_size
+		self.st_mtime_ns = file_stat.st_mtime_ns
+
+
+def intern_tags(tags):
+	"""
+	Share one copy of each tag name and value between every file that has it,
+	so tags held for many files cost little more than the distinct artists,
+	albums and so on among them.
+
+	:param tags: (dict/None) Normalized tags
+
+	:returns: (dict/None) The same tags with names and values interned
+	"""
+	result = tags
+
+	if tags is not None:
+		result = dict((intern(k), intern(v) if isinstance(v, str) else v) for (k, v) in tags.items())
+
+	return result
+
+
+def screen_files(logger, paths, windows_safe, fields, cache=None, prefilter=None, exclude=None, quarantine=None):
+	"""
+	Rule out files that can't be music and look up the rest in the metadata cache,
+	doing the cheapest checks first.
+
+	:param logger: (Logger) Logging object
+	:param paths: (iterable) Strings representing absolute paths to possible music files
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param fields: (iterable/None) Names of the tags needed, None to read every tag
+	:param cache: (MetadataCache/None) Cache of previously read tags
+	:param prefilter: (PreFilter/None) Checks files must pass before being read
+	:param exclude: (container/None) Absolute paths to files to pass over without reading
+	:param quarantine: (Quarantine/None) Files to pass over until they are modified
+
+	:returns: (generator) (path, FileStat/None, dict/None) tuples;
+						  the tags are None if the file has to be read
+	"""
+	need_stat = (cache is not None or quarantine is not None
+				 or (prefilter is not None and prefilter.needs_stat))
+
+	for path in paths:
+		file_stat = None
+		tags = None
+
+		if exclude is not None and path in exclude:
+			logger.debug("Skipping %s, already moved", path)
+			continue
+
+		if prefilter is not None and not prefilter.accepts_name(logger, path):
+			continue
+
+		if need_stat:
+			try:
+				file_stat = FileStat(stat(path))
+			except OSError:
+				# Let reading the file report the problem
+				pass
+
+		if file_stat is not None:
+			if quarantine is not None and quarantine.holds(path, file_stat):
+				logger.info("Skipping %s, quarantined", path)
+				continue
+
+			if prefilter is not None and not prefilter.accepts_stat(logger, path, file_stat):
+				continue
+
+			if cache is not None:
+				tags = intern_tags(cache.get(file_stat, windows_safe, fields))
+
+				if tags is not None:
+					logger.debug("Using cached tags for %s", path)
+
+		if tags is None and prefilter is not None and not prefilter.accepts_content(logger, path):
+			continue
+
+		yield (path, file_stat, tags)
+
+
+def get_music_files(logger, music_dir, windows_safe, *, jobs=1, fields=None, cache=None, prefilter=None,
+					walk_threads=1, exclude=None, read_order=WALK_ORDER, drop_cache=False, stats=None,
+					file_timeout=None, quarantine=None, files=None, snapshot=None):
+	"""
+	Generate all music files Mutagen can read metadata for inside the given directory,
+	parsing them as the directory walk finds them.
+
+	:param logger: (logger) Logging object
+	:param music_dir: (str) Absolute path to directory to check for music files
+	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param jobs: (int) Number of processes to parse files with
+	:param fields: (iterable/None) Names of the tags needed, None to read every tag
+	:param cache: (MetadataCache/None) Cache of previously read tags to consult and update
+	:param prefilter: (PreFilter/None) Checks files must pass before being read
+	:param walk_threads: (int) Number of directories to list at once
+	:param exclude: (container/None) Absolute paths to files to pass over without reading
+	:param read_order: (str) Order to read files in: as they're found, or by inode or physical location
+	:param drop_cache: (bool) Whether or not to drop files from the page cache after reading them
+	:param stats: (RunStats/None) Stats to record time spent walking, screening and reading files in
+	:param file_timeout: (float/None) Seconds a file may take to read before it is given up on,
+									  None to wait as long as it takes
+	:param quarantine: (Quarantine/None) Files to pass over until they are modified,
+										 given up on files are added to
+	:param files: (iterable/None) Absolute paths to the files in the directory to read,
+								  None to walk the directory for them
+	:param snapshot: (DirSnapshot/None) Directories as they were when last listed;
+										files in ones that haven't changed are passed over
+
+	:returns: (generator) (path, tags) tuples for all music files Mutagen
+						  can read metadata for inside the given directory
+	"""
+	paths = scan_files(logger, [music_dir], threads=walk_threads, snapshot=snapshot) if files is None else iter(files)
+
+	if stats is not None:
+		paths = stats.timed("walk", paths)
+
+	lookups = screen_files(logger, paths, windows_safe, fields, cache, prefilter, exclude, quarantine)
+
+	if read_order != WALK_ORDER:
+		lookups = order_reads(logger, lookups, read_order)
+
+	if stats is not None:
+		lookups = stats.timed("screen", lookups)
+
+	def _remember(path, file_stat, tags):
+		if tags is not None and file_stat is not None and cache is not None:
+			cache.put(file_stat, windows_safe, fields, tags)
+
+		return intern_tags(tags)
+
+	def _tally(cached):
+		if stats is not None:
+			stats.count("files")
+
+			if cached:
+				stats.count("cached")
+
+	if file_timeout is not None:
+		# Each file is read in a process of its own that can be killed if it runs over,
+		# so a hung or pathologically slow read costs the run no more than the timeout
+		job = partial(_read_lookup_job, windows_safe=windows_safe, fields=fields, drop_cache=drop_cache,
+					  timed=stats is not None, slowest=stats.slowest if stats is not None else 0)
+		results = WatchdogPool(jobs, file_timeout).imap(job, lookups, lambda lookup: lookup[2] is None)
+
+		if stats is not None:
+			results = stats.timed("wait", results)
+
+		for ((path, file_stat, tags), result, status) in results:
+			_tally(status == SKIPPED)
+
+			if status == DONE:
+				(((_, tags, buffered), ), worker_stats) = result
+				buffered.replay(logger)
+
+				if worker_stats is not None:
+					stats.merge(worker_stats)
+
+				tags = _remember(path, file_stat, tags)
+			elif status != SKIPPED:
+				if status == TIMED_OUT:
+					logger.warning("Gave up reading %s after %g seconds", path, file_timeout)
+				else:
+					logger.warning("Reading %s crashed its worker process", path)
+
+				if quarantine is not None:
+					quarantine.add(path, status, file_stat)
+
+				if stats is not None:
+					stats.count("abandoned")
+
+			if tags is not None:
+				yield (path, tags)
+	elif jobs > 1:
+		pending = deque()
+
+		def _finish_oldest():
+			(chunk, future) = pending.popleft()
+
+			with timing(stats, "wait"):
+				(results, worker_stats) = future.result() if future is not None else ([], None)
+
+			if worker_stats is not None:
+				stats.merge(worker_stats)
+
+			results = iter(results)
+
+			# Results are handed back in submission order,
+			# so log messages come out the same way they would serially
+			for (path, file_stat, tags) in chunk:
+				_tally(tags is not None)
+
+				if tags is None:
+					(_, tags, buffered) = next(results)
+					buffered.replay(logger)
+					tags = _remember(path, file_stat, tags)
+
+				if tags is not None:
+					yield (path, tags)
+
+		with ProcessPoolExecutor(max_workers=jobs) as pool:
+			chunk = list(islice(lookups, JOB_CHUNK_SIZE))
+
+			while chunk:
+				misses = [path for (path, file_stat, tags) in chunk if tags is None]
+				future = (pool.submit(_read_tags_job, misses, windows_safe, fields, drop_cache, stats is not None,
+									  stats.slowest if stats is not None else 0)
+						  if misses else None)
+				pending.append((chunk, future))
+
+				if len(pending) >= jobs * JOB_QUEUE_DEPTH:
+					for result in _finish_oldest():
+						yield result
+
+				chunk = list(islice(lookups, JOB_CHUNK_SIZE))
+
+			while pending:
+				for result in _finish_oldest():
+					yield result
+	else:
+		for (path, file_stat, tags) in lookups:
+			_tally(tags is not None)
 
-	return valid_files
+			if tags is None:
+				with timing(stats, "parse", path, latency=True):
+					tags = read_tags(logger, path, windows_safe, fields, drop_cache, stats)
 
+				tags = _remember(path, file_stat, tags)
 
-def get_new_path(logger, out_dir, structure, metadata, windows_safe):
+			if tags is not None:
+				yield (path, tags)
+
+
+class Structure(object):
+	"""
+	Directory structure template, parsed once so that building each file's
+	new location only needs to fill in the tags it uses.
+	"""
+	__slots__ = ("template", "parts", "fields")
+
+	def __init__(self, template):
+		"""
+		:param template: (str) Desired structure for music files inside root directory,
+							   with tag names in braces
+		"""
+		self.template = template
+		self.parts = tuple((literal, field) for (literal, field, _, _) in Formatter().parse(template))
+		self.fields = frozenset(field for (_, field) in self.parts if field)
+
+	def __str__(self):
+		return self.template
+
+	def __repr__(self):
+		return "Structure({0!r})".format(self.template)
+
+	def format(self, tags):
+		"""
+		Fill in the structure with the given tags.
+
+		:param tags: (dict) Normalized tags
+
+		:returns: (str) The filled in structure
+
+		:raises: KeyError if a tag the structure uses is missing
+		"""
+		return "".join(literal + tags[field] if field else literal for (literal, field) in self.parts)
+
+
+def get_new_path(logger, out_dir, structure, tags):
 	"""
 	Determine the new location the given file should be located,
 	based upon the file's metadata and the provided folder structure.
 
 	:param logger: (Logger) Logging object
 	:param out_dir: (str) Root directory the file should be moved to
-	:param structure: (str) Desired structure for music files inside root directory
-	:param metadata: Mutagen metadata structure for given file
-	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
+	:param structure: (Structure) Desired structure for music files inside root directory
+	:param tags: (dict) Normalized tags for given file
 
 	:returns: None if there was an error determining the new location,
 			  a string representing an absolute path otherwise.
 	"""
 	new_path = None
-	tags = normalize_tags(logger, metadata, windows_safe)
 
 	try:
-		new_path = join(out_dir, structure.format(**tags))
+		new_path = join(out_dir, structure.format(tags))
 	except Exception as e:
 		logger.debug("Error making new path: %s", e)
 	else:
@@ -176,43 +574,263 @@ def get_new_path(logger, out_dir, structure, metadata, windows_safe):
 	return new_path
 
 
-def sort(logger, in_dir, out_dir, structure, windows_safe, dry_run):
+def make_dir(logger, new_path, file_paths, ready_dirs):
+	"""
+	Make sure a destination directory exists, creating it unless it's already known to.
+
+	:param logger: (Logger) Logging object
+	:param new_path: (str) Absolute path to directory
+	:param file_paths: (list) Absolute paths to the files that will be moved into the directory
+	:param ready_dirs: (set) Absolute paths to directories known to exist; updated as directories are made
+
+	:returns: (bool) True if the directory exists, False otherwise
+	"""
+	if new_path not in ready_dirs:
+		try:
+			makedirs(new_path, 0o755)
+		except Exception as e:
+			# It's fine if the directory already exists
+			if getattr(e, "errno", None) != 17:
+				for file_path in file_paths:
+					logger.info("Could not create destination folders for file %s: %s",
+							 file_path, e)
+
+			if isdir(new_path):
+				ready_dirs.add(new_path)
+		else:
+			ready_dirs.add(new_path)
+
+	return new_path in ready_dirs
+
+
+def move_files(logger, batch, ready_dirs, engine, cache=None, journal=None, stats=None, views=None, placed=None):
+	"""
+	Move files into their new directories, creating each directory
+	at most once and moving every file bound for it in one go.
+
+	:param logger: (Logger) Logging object
+	:param batch: (OrderedDict) Lists of absolute paths to files, keyed by
+								the absolute path to the directory they belong in
+	:param ready_dirs: (set) Absolute paths to directories known to exist; updated as directories are made
+	:param engine: (MoveEngine) Engine moving files into place
+	:param cache: (MetadataCache/None) Cache of previously read tags to update as files move
+	:param journal: (MoveJournal/None) Journal to record moves in
+	:param stats: (RunStats/None) Stats to record time spent making directories and moving files in
+	:param views: (dict/None) Lists of absolute paths to the directories of other views each file
+							  is linked into once it is in place, keyed by the absolute path to the file
+	:param placed: (set/None) Absolute paths to files and view links put in place; updated as they land
+	"""
+	def _moved(file_path, old_stat, view_dirs):
+		def _record(new_file_path):
+			if old_stat is not None:
+				cache.move(old_stat, stat(new_file_path), engine.link is not None)
+
+			if placed is not None:
+				placed.add(new_file_path)
+
+			if journal is not None:
+				journal.done(file_path, new_file_path)
+
+			if stats is not None:
+				stats.count("moved")
+				stats.count("bytes_moved", stat(new_file_path).st_size)
+
+			for view_dir in view_dirs:
+				# Views link to the file where it ended up, and are undone along with it
+				if make_dir(logger, view_dir, [new_file_path], ready_dirs) and engine.add_view(new_file_path, view_dir):
+					if placed is not None:
+						placed.add(join(view_dir, basename(new_file_path)))
+
+					if journal is not None:
+						journal.done(new_file_path, join(view_dir, basename(new_file_path)))
+
+					if stats is not None:
+						stats.count("view_links")
+
+		return _record
+
+
+	if journal is not None:
+		journal.plan((file_path, join(new_path, basename(file_path)))
+					 for (new_path, file_paths) in batch.items() for file_path in file_paths)
+
+	for (new_path, file_paths) in batch.items():
+		with timing(stats, "makedirs"):
+			ready = make_dir(logger, new_path, file_paths, ready_dirs)
+
+		if ready:
+			for file_path in file_paths:
+				try:
+					callback = _moved(file_path, stat(file_path) if cache is not None else None,
+									  views.get(file_path, ()) if views is not None else ())
+				except Exception as e:
+					logger.info("Could not move file %s to new location: %s", file_path, e)
+				else:
+					with timing(stats, "move"):
+						engine.move(file_path, new_path, callback)
+
+
+def sort(logger, in_dir, out_dir, structure, windows_safe, dry_run, *, jobs=1, cache=None, prefilter=None,
+		 walk_threads=1, mover=None, journal=None, resume=False, read_order=WALK_ORDER, drop_cache=False, stats=None,
+		 file_timeout=None, quarantine=None, files=None, snapshot=None, views=None):
 	"""
 	Main function handling finding music, finding the location said music
-	should be moved to, and moving it.
+	should be moved to, and moving it. Other layouts of the library can be
+	built at the same time out of links, from the same reading of the tags.
 
 	:param logger: (Logger) Logging object
 	:param in_dir: (str) Absolute path to music source directory
 	:param out_dir: (str) Absolute path to music destination directory
+	:param structure: (Structure) Desired structure for music files inside root directory
 	:param windows_safe: (bool) Whether or not to perform extra normalization for Windows platforms
 	:param dry_run: (bool) Whether or not to perform actual movement of files
+	:param jobs: (int) Number of processes to parse files with
+	:param cache: (MetadataCache/None) Cache of previously read tags to consult and update
+	:param prefilter: (PreFilter/None) Checks files must pass before being read
+	:param walk_threads: (int) Number of directories to list at once
+	:param mover: (MoveEngine/None) Engine moving files into place, finished by the caller;
+								   None to use one finished before returning
+	:param journal: (MoveJournal/None) Journal to record moves in
+	:param resume: (bool) Whether or not to pass over files the journal shows were already moved
+	:param read_order: (str) Order to read files in: as they're found, or by inode or physical location
+	:param drop_cache: (bool) Whether or not to drop files from the page cache after reading them
+	:param stats: (RunStats/None) Stats to record time spent in each stage of sorting in
+	:param file_timeout: (float/None) Seconds a file may take to read before it is given up on,
+									  None to wait as long as it takes
+	:param quarantine: (Quarantine/None) Files to pass over until they are modified,
+										 given up on files are added to
+	:param files: (iterable/None) Absolute paths to the files in in_dir to sort,
+								  None to sort every file in it
+	:param snapshot: (DirSnapshot/None) Directories as they were when last listed;
+										files in ones that haven't changed are passed over
+	:param views: (list/None) Structures of other views of the library; files are linked into them
+							  once moved into place, and left out of ones they lack the tags for
 	"""
-	files_with_metadata = get_music_files(logger, in_dir)
-
-	if not len(files_with_metadata):
-		logger.info("No music files in %s", in_dir)
-
-	for (file_path, metadata) in files_with_metadata:
-		new_path = get_new_path(logger, out_dir, structure, metadata, windows_safe)
+	found_music = False
+	batch = OrderedDict()
+	batch_views = {}
+	batched = 0
+	ready_dirs = set()
+	views = views or []
+	engine = mover if mover is not None else MoveEngine(logger)
+	# Files put in place while the walk is still going are passed over if it reaches them,
+	# as it does when the destination is inside the source
+	moved = set()
+
+	if journal is not None and resume:
+		# Linked files stay where they were found, so it's their sources a walk turns up again
+		moved.update(src if engine.link is not None else dest for (src, dest) in journal.moves())
+
+	fields = structure.fields.union(*(view.fields for view in views))
+	music_files = get_music_files(logger, in_dir, windows_safe, jobs=jobs, fields=fields, cache=cache,
+								  prefilter=prefilter, walk_threads=walk_threads, exclude=moved,
+								  read_order=read_order, drop_cache=drop_cache, stats=stats,
+								  file_timeout=file_timeout, quarantine=quarantine, files=files, snapshot=snapshot)
+
+	for (file_path, tags) in music_files:
+		found_music = True
+
+		with timing(stats, "path_build"):
+			new_path = get_new_path(logger, out_dir, structure, tags)
 
 		if new_path is None:
 			logger.info("File %s does not have tags to fulfill specified structure, skipping",
 					 file_path)
 			continue
+		elif dirname(file_path) == new_path:
+			logger.debug("File %s is already in place, skipping", file_path)
+			continue
 		else:
 			logger.debug("Moving file %s to %s", file_path, new_path)
+			view_dirs = []
+
+			for view in views:
+				with timing(stats, "path_build"):
+					view_path = get_new_path(logger, out_dir, view, tags)
+
+				if view_path is None:
+					logger.debug("File %s does not have tags for view %s, leaving it out", file_path, view)
+				else:
+					logger.debug("Linking file %s into view %s", file_path, view_path)
+					view_dirs.append(view_path)
+
+			if not dry_run:
+				batch.setdefault(new_path, []).append(file_path)
+				batched += 1
+
+				if view_dirs:
+					batch_views[file_path] = view_dirs
+
+				if batched >= MOVE_BATCH_SIZE:
+					move_files(logger, batch, ready_dirs, engine, cache, journal, stats, batch_views, moved)
+					batch = OrderedDict()
+					batch_views = {}
+					batched = 0
+
+	move_files(logger, batch, ready_dirs, engine, cache, journal, stats, batch_views, moved)
+
+	if mover is None:
+		with timing(stats, "move"):
+			engine.finish()
+
+	if not found_music:
+		logger.info("No music files in %s", in_dir)
+
+
+def undo(logger, journal, in_dirs, out_dir, dry_run, mover=None):
+	"""
+	Move files back to where they were before sorting, newest moves first.
+	Files linked rather than moved still have their originals in place, so only the links are removed.
+
+	:param logger: (Logger) Logging object
+	:param journal: (MoveJournal) Journal the moves were recorded in
+	:param in_dirs: (list) Absolute paths to music source directories; moves out of others are left alone
+	:param out_dir: (str) Absolute path to music destination directory; moves into others are left alone
+	:param dry_run: (bool) Whether or not to perform actual movement of files
+	:param mover: (MoveEngine/None) Engine moving files into place, finished by the caller;
+								   None to use one finished before returning
+	"""
+	def _undone(src, dest):
+		return lambda new_file_path: journal.undone(src, dest)
+
+
+	def _inside(path, directory):
+		return path.startswith(directory.rstrip(sep) + sep)
+
+
+	undid_moves = False
+	ready_dirs = set()
+	engine = mover if mover is not None else MoveEngine(logger)
+	moves = journal.moves()
+	# Views link to sorted files, so they go along with the files they link to
+	sorted_files = set(dest for (src, dest) in moves
+					   if _inside(dest, out_dir) and any(_inside(src, in_dir) for in_dir in in_dirs))
+
+	for (src, dest) in reversed(moves):
+		if not _inside(dest, out_dir) or not (src in sorted_files or any(_inside(src, in_dir) for in_dir in in_dirs)):
+			continue
+
+		undid_moves = True
+
+		if lexists(src):
+			logger.debug("Removing file %s linked from %s", dest, src)
 
 			if not dry_run:
 				try:
-					makedirs(new_path, 0o755)
+					remove_link(src, dest)
 				except Exception as e:
-					# It's fine if the directory already exists
-					if getattr(e, "errno", None) != 17:
-						logger.info("Could not create destination folders for file %s: %s",
-								 file_path, e)
-
-				if isdir(new_path):
-					try:
-						move(file_path, new_path)
-					except Exception as e:
-						logger.info("Could not move file %s to new location: %s", file_path, e)
+					logger.info("Could not remove file %s: %s", dest, e)
+				else:
+					journal.undone(src, dest)
+		else:
+			logger.debug("Moving file %s back to %s", dest, src)
+
+			# Files keep their names when moved, so they go back under the same ones
+			if not dry_run and make_dir(logger, dirname(src), [dest], ready_dirs):
+				engine.move(dest, dirname(src), _undone(src, dest))
+
+	if mover is None:
+		engine.finish()
+
+	if not undid_moves:
+		logger.info("No moves from %s to undo", ", ".join(in_dirs))
@@ -0,0 +1,448 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import json
+import time
+
+from collections import OrderedDict
+from heapq import heappush, heapreplace
+from importlib import import_module
+from math import ceil
+from os import stat
+from os.path import splitext
+from threading import local, Lock
+
+try:
+	from resource import getrusage, RUSAGE_CHILDREN
+except ImportError:
+	getrusage = None
+
+
+# Per-process I/O counters on Linux
+PROC_IO = "/proc/self/io"
+
+PERCENTILES = (50, 95, 99)
+
+# Stages are timed on the thread doing them; Python 3.6 can only time the whole process
+thread_time = getattr(time, "thread_time", time.process_time)
+
+
+def io_counters():
+	"""
+	Find how much this process has read and written so far.
+
+	:returns: (tuple/None) Bytes read and bytes written,
+						   None if the platform doesn't keep count
+	"""
+	result = None
+
+	try:
+		with open(PROC_IO) as counters:
+			fields = dict(line.split(":", 1) for line in counters if ":" in line)
+	except EnvironmentError:
+		pass
+	else:
+		result = (int(fields["rchar"]), int(fields["wchar"]))
+
+	return result
+
+
+def children_cpu():
+	"""
+	:returns: (float) CPU seconds used by finished child processes, like tag reading workers
+	"""
+	result = 0.0
+
+	if getrusage is not None:
+		usage = getrusage(RUSAGE_CHILDREN)
+		result = usage.ru_utime + usage.ru_stime
+
+	return result
+
+
+def percentile(ordered, percent):
+	"""
+	Pick the value a given percentage of values are at or below.
+
+	:param ordered: (list) Values, sorted
+	:param percent: (float) Percentage of values to be at or below the result
+
+	:returns: (float/None) Nearest-rank percentile, None if there are no values
+	"""
+	result = None
+
+	if ordered:
+		result = ordered[max(0, int(ceil(percent / 100.0 * len(ordered))) - 1)]
+
+	return result
+
+
+class StageHook(object):
+	"""
+	Base class for code that wants to know when each stage of a run starts and finishes,
+	e.g. to trace it; override whichever methods are needed.
+	Hooks are called on the thread doing the work, in the process keeping the stats.
+	"""
+	def start(self, stage, path):
+		"""
+		Called as a stage starts.
+
+		:param stage: (str) Name of the stage
+		:param path: (str/None) Absolute path to the file the stage is working on, if it's about one file
+		"""
+		pass
+
+	def finish(self, stage, path, wall, cpu):
+		"""
+		Called as a stage finishes, whether or not it succeeded.
+
+		:param stage: (str) Name of the stage
+		:param path: (str/None) Absolute path to the file the stage worked on, if it was about one file
+		:param wall: (float) Seconds the stage took, including stages started inside it
+		:param cpu: (float) CPU seconds the stage's thread used, including stages started inside it
+		"""
+		pass
+
+
+def load_hook(spec):
+	"""
+	Create a hook from a "module:name" spec, where name is a StageHook subclass
+	or anything else that makes a hook when called without arguments.
+
+	:param spec: (str) Module to import and name inside it to call
+
+	:returns: (StageHook) The new hook
+
+	:raises: ValueError if the spec is malformed or doesn't name something that can be called
+	"""
+	(module_name, _, name) = spec.partition(":")
+
+	if not module_name or not name:
+		raise ValueError("Hooks must be given as module:name, not {0}".format(spec))
+
+	try:
+		factory = getattr(import_module(module_name), name)
+	except (ImportError, AttributeError) as e:
+		raise ValueError("Could not load hook {0}: {1}".format(spec, e))
+
+	if not callable(factory):
+		raise ValueError("Hook {0} can't be called".format(spec))
+
+	return factory()
+
+
+class _Timing(object):
+	"""
+	Context manager timing one stage on the current thread. Time spent in stages
+	started inside it is left out, so each stage only counts its own work.
+	"""
+	__slots__ = ("stats", "stage", "path", "latency", "wall", "cpu", "child_wall", "child_cpu")
+
+	def __init__(self, stats, stage, path, latency):
+		self.stats = stats
+		self.stage = stage
+		self.path = path
+		self.latency = latency
+		self.child_wall = 0.0
+		self.child_cpu = 0.0
+
+	def __enter__(self):
+		for hook in self.stats.hooks:
+			hook.start(self.stage, self.path)
+
+		self.stats._stack().append(self)
+		self.cpu = thread_time()
+		self.wall = time.perf_counter()
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		wall = time.perf_counter() - self.wall
+		cpu = thread_time() - self.cpu
+		stack = self.stats._stack()
+		stack.pop()
+
+		if stack:
+			stack[-1].child_wall += wall
+			stack[-1].child_cpu += cpu
+
+		self.stats._add(self.stage, wall - self.child_wall, cpu - self.child_cpu, wall, self.path, self.latency)
+
+		for hook in self.stats.hooks:
+			hook.finish(self.stage, self.path, wall, cpu)
+
+
+class _NoTiming(object):
+	"""
+	Stand-in for _Timing when stats aren't being kept.
+	"""
+	__slots__ = ()
+
+	def __enter__(self):
+		pass
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		pass
+
+
+NO_TIMING = _NoTiming()
+
+
+def timing(stats, stage, path=None, latency=False):
+	"""
+	Time a stage of the run, if stats are being kept.
+
+	:param stats: (RunStats/None) Stats to record the time in
+	:param stage: (str) Name of the stage
+	:param path: (str/None) Absolute path to the file the stage works on, to track the slowest files by
+	:param latency: (bool) Whether or not the stage is the one counted towards per-file latency
+
+	:returns: (context manager) Timing for the stage, or one doing nothing
+	"""
+	return stats.timing(stage, path, latency) if stats is not None else NO_TIMING
+
+
+class RunStats(object):
+	"""
+	Wall and CPU time spent in each stage of a run, with counts of files and bytes handled
+	and, optionally, the slowest files in each stage.
+	Can be shared between threads; worker processes keep their own and send a snapshot back.
+	"""
+	def __init__(self, slowest=0, hooks=()):
+		"""
+		:param slowest: (int) Number of slowest files to remember per stage
+		:param hooks: (iterable) StageHooks to call as stages start and finish
+		"""
+		self.lock = Lock()
+		self.local = local()
+		self.slowest = slowest
+		self.hooks = tuple(hooks)
+		self.stages = OrderedDict()
+		self.counters = OrderedDict()
+		self.latencies = []
+		self.slow = OrderedDict()
+		self.merged_io = [0, 0]
+		self.started_io = io_counters()
+		self.started_cpu = time.process_time() + children_cpu()
+		self.started = time.perf_counter()
+
+	def _stack(self):
+		stack = getattr(self.local, "stack", None)
+
+		if stack is None:
+			stack = self.local.stack = []
+
+		return stack
+
+	def _add(self, stage, wall, cpu, total=0.0, path=None, latency=False, count=1):
+		with self.lock:
+			totals = self.stages.get(stage)
+
+			if totals is None:
+				totals = self.stages[stage] = [0, 0.0, 0.0]
+
+			totals[0] += count
+			totals[1] += wall
+			totals[2] += cpu
+
+			if latency:
+				self.latencies.append(total)
+
+			if path is not None and self.slowest:
+				slow = self.slow.setdefault(stage, [])
+
+				if len(slow) < self.slowest or total > slow[0][0]:
+					self._remember_slow(slow, (total, wall, path) + _describe(path))
+
+	def _remember_slow(self, slow, entry):
+		if len(slow) < self.slowest:
+			heappush(slow, entry)
+		elif entry > slow[0]:
+			heapreplace(slow, entry)
+
+	def timing(self, stage, path=None, latency=False):
+		"""
+		Time a stage of the run.
+
+		:param stage: (str) Name of the stage
+		:param path: (str/None) Absolute path to the file the stage works on, to track the slowest files by
+		:param latency: (bool) Whether or not the stage is the one counted towards per-file latency
+
+		:returns: (context manager) Timing for the stage
+		"""
+		return _Timing(self, stage, path, latency)
+
+	def timed(self, stage, iterable):
+		"""
+		Time how long each item of an iterable takes to produce.
+
+		:param stage: (str) Name of the stage
+		:param iterable: (iterable) Items to time
+
+		:returns: (generator) The same items
+		"""
+		iterator = iter(iterable)
+
+		while True:
+			with self.timing(stage):
+				try:
+					item = next(iterator)
+				except StopIteration:
+					break
+
+			yield item
+
+	def count(self, counter, amount=1):
+		"""
+		Add to one of the run's counts.
+
+		:param counter: (str) Name of the count, like "files" or "bytes_moved"
+		:param amount: (int) Amount to add
+		"""
+		with self.lock:
+			self.counters[counter] = self.counters.get(counter, 0) + amount
+
+	def snapshot(self):
+		"""
+		Capture everything recorded so far, to send from a worker process to the parent.
+
+		:returns: (dict) Stages, counters, latencies, slowest files and bytes read and written
+		"""
+		io = io_counters()
+
+		with self.lock:
+			result = {
+				"stages": OrderedDict((stage, list(totals)) for (stage, totals) in self.stages.items()),
+				"counters": OrderedDict(self.counters),
+				"latencies": list(self.latencies),
+				"slow": OrderedDict((stage, list(slow)) for (stage, slow) in self.slow.items()),
+				"io": (io[0] - self.started_io[0], io[1] - self.started_io[1]) if io and self.started_io else None,
+				}
+
+		return result
+
+	def merge(self, snapshot):
+		"""
+		Add a snapshot taken by a worker process to this run.
+
+		:param snapshot: (dict) Result of snapshot()
+		"""
+		for (stage, (count, wall, cpu)) in snapshot["stages"].items():
+			self._add(stage, wall, cpu, count=count)
+
+		with self.lock:
+			for (counter, amount) in snapshot["counters"].items():
+				self.counters[counter] = self.counters.get(counter, 0) + amount
+
+			self.latencies.extend(snapshot["latencies"])
+
+			if self.slowest:
+				for (stage, entries) in snapshot["slow"].items():
+					slow = self.slow.setdefault(stage, [])
+
+					for entry in entries:
+						self._remember_slow(slow, tuple(entry))
+
+			if snapshot["io"] is not None:
+				self.merged_io[0] += snapshot["io"][0]
+				self.merged_io[1] += snapshot["io"][1]
+
+	def report(self):
+		"""
+		Summarize the run so far.
+
+		:returns: (dict) Wall and CPU time, files per second, per-file latency percentiles,
+						 bytes read and written, counters, each stage's totals
+						 and the slowest files in each stage, slowest first
+		"""
+		wall = time.perf_counter() - self.started
+		cpu = time.process_time() + children_cpu() - self.started_cpu
+		io = io_counters()
+		snapshot = self.snapshot()
+		latencies = sorted(snapshot["latencies"])
+		files = snapshot["counters"].get("files", 0)
+		(bytes_read, bytes_written) = (None, None)
+
+		if io is not None and self.started_io is not None:
+			bytes_read = io[0] - self.started_io[0] + self.merged_io[0]
+			bytes_written = io[1] - self.started_io[1] + self.merged_io[1]
+
+		return {
+			"wall": wall,
+			"cpu": cpu,
+			"files": files,
+			"files_per_sec": files / wall if wall > 0 else 0.0,
+			"latency": OrderedDict(("p{0}".format(percent), percentile(latencies, percent))
+								   for percent in PERCENTILES),
+			"bytes_read": bytes_read,
+			"bytes_written": bytes_written,
+			"counters": snapshot["counters"],
+			"stages": OrderedDict((stage, {"count": count, "wall": stage_wall, "cpu": stage_cpu})
+								  for (stage, (count, stage_wall, stage_cpu)) in snapshot["stages"].items()),
+			"slowest": OrderedDict((stage, [{"path": path, "format": fmt, "size": size, "wall": total, "own": own}
+											for (total, own, path, fmt, size) in sorted(slow, reverse=True)])
+								   for (stage, slow) in snapshot["slow"].items()),
+			}
+
+
+def _describe(path):
+	"""
+	:returns: (tuple) Format, going by the extension, and size in bytes or None of the given file
+	"""
+	try:
+		size = stat(path).st_size
+	except OSError:
+		size = None
+
+	return (splitext(path)[1].lstrip(".").lower() or None, size)
+
+
+def _megabytes(amount):
+	return "unknown" if amount is None else "{0:.1f} MB".format(amount / 1e6)
+
+
+def _milliseconds(seconds):
+	return "n/a" if seconds is None else "{0:.2f}ms".format(seconds * 1000)
+
+
+def log_report(logger, report):
+	"""
+	Log a summary of a run.
+
+	:param logger: (Logger) Logging object
+	:param report: (dict) Result of RunStats.report()
+	"""
+	logger.info("Handled %d files in %.2fs (%.1f files/s) using %.2fs of CPU",
+				report["files"], report["wall"], report["files_per_sec"], report["cpu"])
+	logger.info("Per-file latency: %s",
+				", ".join("{0} {1}".format(name, _milliseconds(value)) for (name, value) in report["latency"].items()))
+	logger.info("Read %s, wrote %s", _megabytes(report["bytes_read"]), _megabytes(report["bytes_written"]))
+
+	for (stage, totals) in report["stages"].items():
+		logger.info("%-12s %9.3fs wall %9.3fs CPU %8d calls", stage, totals["wall"], totals["cpu"], totals["count"])
+
+	for (counter, amount) in report["counters"].items():
+		if counter != "files":
+			logger.info("%-12s %d", counter, amount)
+
+	for (stage, slow) in report["slowest"].items():
+		logger.info("Slowest files in %s:", stage)
+
+		for entry in slow:
+			logger.info("%10s total %10s in %s  %s, %s  %s", _milliseconds(entry["wall"]), _milliseconds(entry["own"]),
+						stage, entry["format"] or "unknown format", _megabytes(entry["size"]), entry["path"])
+
+
+def write_report(path, report):
+	"""
+	Save a run's summary as JSON.
+
+	:param path: (str) Absolute path to file to write
+	:param report: (dict) Result of RunStats.report()
+	"""
+	with open(path, "w") as report_file:
+		json.dump(report, report_file, indent=2)
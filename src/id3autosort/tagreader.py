@@ -0,0 +1,605 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import re
+
+from collections import deque
+from io import SEEK_CUR, SEEK_END
+from itertools import zip_longest
+from struct import error as StructError, unpack
+
+from mutagen.id3 import ID3TimeStamp, TCON
+
+
+# Frames holding the easy-mode fields;
+# v2.2 IDs are translated to their v2.3 equivalents before lookup
+ID3_FRAMES = {"TPE1": "artist", "TALB": "album", "TCON": "genre", "TDRC": "date"}
+ID3V22_FRAMES = {"TP1": "TPE1", "TAL": "TALB", "TCO": "TCON", "TYE": "TYER", "TDA": "TDAT", "TIM": "TIME"}
+ID3_OLD_DATE_FRAMES = ["TYER", "TDAT", "TIME"]
+ID3_FRAME_ID = re.compile(b"^[A-Z0-9]+$")
+ID3_TEXT_ENCODINGS = ["latin1", "utf-16", "utf-16-be", "utf-8"]
+
+MP4_ITEMS = {b"\xa9ART": "artist", b"\xa9alb": "album", b"\xa9day": "date", b"\xa9gen": "genre"}
+
+ASF_HEADER = b"\x30\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c"
+ASF_CONTENT_DESCRIPTION = b"\x33\x26\xb2\x75\x8e\x66\xcf\x11\xa6\xd9\x00\xaa\x00\x62\xce\x6c"
+ASF_EXTENDED_CONTENT_DESCRIPTION = b"\x40\xa4\xd0\xd2\x07\xe3\xd2\x11\x97\xf0\x00\xa0\xc9\x5e\xa8\x50"
+ASF_CONTENT_NAMES = ["Title", "Author", "Copyright", "Description", "Rating"]
+ASF_FIELDS = {"Author": "artist", "WM/AlbumTitle": "album", "WM/Genre": "genre", "year": "date"}
+
+# Comments longer than this are only read in full if their key is wanted
+VORBIS_KEY_PEEK = 64
+
+
+class NeedsMutagen(Exception):
+	"""
+	The file holds something the lightweight readers don't handle,
+	so it has to be parsed by Mutagen instead.
+	"""
+
+
+class _FileReader(object):
+	"""
+	Exact-size reads and forward seeks over a regular file.
+	"""
+	def __init__(self, fileobj):
+		self.fileobj = fileobj
+
+	def read(self, size):
+		data = self.fileobj.read(size)
+
+		if len(data) != size:
+			raise NeedsMutagen("Unexpected end of file")
+
+		return data
+
+	def skip(self, size):
+		self.fileobj.seek(size, SEEK_CUR)
+
+
+class _OggPacketReader(object):
+	"""
+	Exact-size reads and forward seeks over one packet of the first logical stream
+	in an Ogg file, pulling in pages only as the packet's data is needed.
+	"""
+	def __init__(self, fileobj, index):
+		self.fileobj = fileobj
+		self.serial = None
+		self.lacing = deque()
+
+		for _ in range(index):
+			while True:
+				(length, last) = self._next_segment()
+				self.fileobj.seek(length, SEEK_CUR)
+
+				if last:
+					break
+
+		self.remaining = 0
+		self.ended = False
+
+	def _next_segment(self):
+		while not self.lacing:
+			header = self.fileobj.read(27)
+
+			if len(header) != 27 or header[:4] != b"OggS":
+				raise NeedsMutagen("Invalid Ogg page")
+
+			(serial,) = unpack("<I", header[14:18])
+
+			if self.serial is None:
+				self.serial = serial
+			elif serial != self.serial:
+				raise NeedsMutagen("Multiplexed Ogg streams")
+
+			self.lacing.extend(bytearray(self.fileobj.read(bytearray(header)[26])))
+
+		length = self.lacing.popleft()
+		return (length, length < 255)
+
+	def _consume(self, size, keep):
+		chunks = []
+
+		while size:
+			if not self.remaining:
+				if self.ended:
+					raise NeedsMutagen("Unexpected end of Ogg packet")
+
+				(self.remaining, self.ended) = self._next_segment()
+				continue
+
+			step = min(size, self.remaining)
+
+			if keep:
+				chunks.append(self.fileobj.read(step))
+
+				if len(chunks[-1]) != step:
+					raise NeedsMutagen("Unexpected end of file")
+			else:
+				self.fileobj.seek(step, SEEK_CUR)
+
+			self.remaining -= step
+			size -= step
+
+		return b"".join(chunks)
+
+	def read(self, size):
+		return self._consume(size, True)
+
+	def skip(self, size):
+		self._consume(size, False)
+
+
+def _decode_id3_text(data):
+	"""
+	Split the body of an ID3v2 text frame into its values.
+
+	:param data: (bytes) Frame body, starting with the encoding byte
+
+	:returns: (list) Strings stored in the frame
+	"""
+	encoding = bytearray(data[:1])[0]
+
+	if encoding >= len(ID3_TEXT_ENCODINGS):
+		raise NeedsMutagen("Unknown text encoding")
+
+	if encoding in (1, 2):
+		values = []
+		start = 1
+
+		# UTF-16 terminators are only valid on even offsets
+		for offset in range(1, len(data) - 1, 2):
+			if data[offset:offset + 2] == b"\x00\x00":
+				values.append(data[start:offset])
+				start = offset + 2
+
+		values.append(data[start:])
+	else:
+		values = data[1:].split(b"\x00")
+
+	# A trailing terminator doesn't start a new value
+	if len(values) > 1 and not values[-1]:
+		values.pop()
+
+	return [v.decode(ID3_TEXT_ENCODINGS[encoding]) for v in values]
+
+
+def _combine_id3_dates(frames):
+	"""
+	Merge pre-v2.4 date frames into timestamps the same way Mutagen does
+	when it upgrades them to TDRC.
+
+	:param frames: (dict) Decoded values of the TYER, TDAT and TIME frames found
+
+	:returns: (list) Strings representing timestamps
+	"""
+	timestamps = []
+	old_frames = [frames.get(frame_id, []) for frame_id in ID3_OLD_DATE_FRAMES]
+
+	for (year, day, time) in zip_longest(*old_frames, fillvalue=""):
+		year_match = re.match(r"([0-9]{4})(-[0-9]{2}-[0-9]{2})?\Z", year)
+		day_match = re.match(r"([0-9]{2})([0-9]{2})\Z", day)
+		time_match = re.match(r"([0-9]{2})([0-9]{2})\Z", time)
+		timestamp = ""
+
+		if year_match:
+			(timestamp, month_day) = year_match.groups()
+
+			if day_match:
+				month_day = "-%s-%s" % day_match.groups()[::-1]
+
+			if month_day:
+				timestamp += month_day
+
+				if time_match:
+					timestamp += "T%s:%s:00" % time_match.groups()
+
+		if timestamp:
+			timestamps.append(timestamp)
+
+	return timestamps
+
+
+def read_id3_fields(fileobj, fields):
+	"""
+	Read the given fields from the ID3v2 tag at the start of the file,
+	seeking past frames that aren't needed.
+
+	:param fileobj: (file) Music file opened in binary mode
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	reader = _FileReader(fileobj)
+	header = bytearray(reader.read(10))
+
+	if header[:3] != b"ID3" or header[3] not in (2, 3, 4):
+		raise NeedsMutagen("No supported ID3v2 header")
+
+	# Unsynchronised and extended headers are rare enough to leave to Mutagen
+	if header[5] & 0xc0:
+		raise NeedsMutagen("Unsupported ID3v2 header flags")
+
+	version = header[3]
+	header_size = 6 if version == 2 else 10
+	remaining = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+	frames = {}
+
+	# Older date frames only matter if there's no TDRC, but there's no telling
+	# whether there is one until the whole tag has been looked through
+	required = set(frame_id for (frame_id, field) in ID3_FRAMES.items() if field in fields)
+	wanted = required | set(ID3_OLD_DATE_FRAMES) if "date" in fields else required
+
+	while remaining >= header_size and not required <= set(frames):
+		frame_header = bytearray(reader.read(header_size))
+		remaining -= header_size
+
+		if version == 2:
+			frame_id = bytes(frame_header[:3])
+			size = (frame_header[3] << 16) | (frame_header[4] << 8) | frame_header[5]
+			flags = 0
+		elif version == 3:
+			frame_id = bytes(frame_header[:4])
+			size = unpack(">I", bytes(frame_header[4:8]))[0]
+			flags = frame_header[9] & 0xe0
+		else:
+			frame_id = bytes(frame_header[:4])
+			size = (frame_header[4] << 21) | (frame_header[5] << 14) | (frame_header[6] << 7) | frame_header[7]
+			flags = frame_header[9] & 0x4f
+
+		# Padding
+		if not frame_id.strip(b"\x00"):
+			break
+
+		if not ID3_FRAME_ID.match(frame_id) or size > remaining:
+			raise NeedsMutagen("Invalid ID3v2 frame")
+
+		frame_id = frame_id.decode("ascii")
+		frame_id = ID3V22_FRAMES.get(frame_id, frame_id) if version == 2 else frame_id
+		remaining -= size
+
+		if frame_id in wanted and frame_id not in frames:
+			# Compressed, encrypted, grouped or unsynchronised frames
+			if flags:
+				raise NeedsMutagen("Unsupported ID3v2 frame flags")
+
+			frames[frame_id] = _decode_id3_text(reader.read(size)) if size else []
+		else:
+			reader.skip(size)
+
+	if "date" in fields and "TDRC" not in frames:
+		frames["TDRC"] = _combine_id3_dates(frames)
+
+	tags = {}
+
+	for (frame_id, field) in ID3_FRAMES.items():
+		values = frames.get(frame_id)
+
+		if not values or field not in fields:
+			continue
+
+		if field == "genre":
+			values = TCON(encoding=3, text=values).genres
+		elif field == "date":
+			values = [ID3TimeStamp(v).text for v in values]
+
+		if values:
+			tags[field] = values
+
+	return tags
+
+
+def read_vorbis_comment(reader, fields):
+	"""
+	Read the given fields from a Vorbis comment block,
+	stopping as soon as all of them have been found.
+
+	:param reader: Exact-size reader positioned at the start of the block
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	tags = {}
+	(vendor_length,) = unpack("<I", reader.read(4))
+	reader.skip(vendor_length)
+	(count,) = unpack("<I", reader.read(4))
+
+	for _ in range(count):
+		if len(tags) == len(fields):
+			break
+
+		(length,) = unpack("<I", reader.read(4))
+		head = reader.read(min(length, VORBIS_KEY_PEEK))
+		(key, separator, value) = head.partition(b"=")
+		key = key.decode("utf-8", "replace").lower()
+
+		if separator and key in fields and key not in tags:
+			value += reader.read(length - len(head))
+			tags[key] = [value.decode("utf-8", "replace")]
+		else:
+			reader.skip(length - len(head))
+
+	return tags
+
+
+def read_flac_fields(fileobj, fields):
+	"""
+	Read the given fields from the Vorbis comment metadata block of a FLAC file,
+	seeking past blocks that aren't needed.
+
+	:param fileobj: (file) Music file opened in binary mode
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	reader = _FileReader(fileobj)
+
+	if reader.read(4) != b"fLaC":
+		raise NeedsMutagen("No FLAC header")
+
+	last = False
+
+	while not last:
+		header = bytearray(reader.read(4))
+		last = bool(header[0] & 0x80)
+		size = unpack(">I", b"\x00" + bytes(header[1:]))[0]
+
+		if header[0] & 0x7f == 4:
+			return read_vorbis_comment(reader, fields)
+
+		reader.skip(size)
+
+	return {}
+
+
+def read_ogg_fields(fileobj, fields):
+	"""
+	Read the given fields from the comment header of an Ogg Vorbis or Opus file.
+
+	:param fileobj: (file) Music file opened in binary mode
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	identification = _OggPacketReader(fileobj, 0).read(8)
+
+	if identification[:7] == b"\x01vorbis":
+		magic = b"\x03vorbis"
+	elif identification == b"OpusHead":
+		magic = b"OpusTags"
+	else:
+		raise NeedsMutagen("Unsupported Ogg codec")
+
+	fileobj.seek(0)
+	reader = _OggPacketReader(fileobj, 1)
+
+	if reader.read(len(magic)) != magic:
+		raise NeedsMutagen("Missing Ogg comment header")
+
+	return read_vorbis_comment(reader, fields)
+
+
+def _mp4_atoms(fileobj, end):
+	"""
+	Generate the atoms between the current position and the given offset,
+	seeking to the start of the next one each time the caller moves on.
+
+	:returns: (generator) (name, data start, data end) tuples
+	"""
+	reader = _FileReader(fileobj)
+	offset = fileobj.tell()
+
+	while offset + 8 <= end:
+		fileobj.seek(offset)
+		(size, name) = unpack(">I4s", reader.read(8))
+		start = offset + 8
+
+		if size == 1:
+			(size,) = unpack(">Q", reader.read(8))
+			start += 8
+		elif size == 0:
+			size = end - offset
+
+		if size < start - offset or offset + size > end:
+			raise NeedsMutagen("Invalid MP4 atom")
+
+		yield (name, start, offset + size)
+		offset += size
+
+
+def _find_mp4_atom(fileobj, end, path):
+	"""
+	Descend through the given chain of nested atoms,
+	leaving the file positioned at the first child of the last one.
+
+	:returns: None if the chain doesn't exist,
+			  the offset the last atom ends at otherwise
+	"""
+	for name in path:
+		for (atom, start, atom_end) in _mp4_atoms(fileobj, end):
+			if atom == name:
+				# meta is a full atom, with version and flags before its children
+				fileobj.seek(start + 4 if name == b"meta" else start)
+				end = atom_end
+				break
+		else:
+			return None
+
+	return end
+
+
+def read_mp4_fields(fileobj, fields):
+	"""
+	Read the given fields from the ilst atom of an MP4 file,
+	seeking past atoms that aren't needed.
+
+	:param fileobj: (file) Music file opened in binary mode
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	tags = {}
+	reader = _FileReader(fileobj)
+
+	if reader.read(8)[4:] != b"ftyp":
+		raise NeedsMutagen("No MP4 file type atom")
+
+	file_size = fileobj.seek(0, SEEK_END)
+	fileobj.seek(0)
+	end = _find_mp4_atom(fileobj, file_size, [b"moov", b"udta", b"meta", b"ilst"])
+
+	if end is None:
+		return tags
+
+	wanted = dict((item, field) for (item, field) in MP4_ITEMS.items() if field in fields)
+
+	for (item, start, item_end) in _mp4_atoms(fileobj, end):
+		if len(tags) == len(wanted):
+			break
+
+		# Numeric genres are translated by Mutagen
+		if item == b"gnre" and "genre" in fields:
+			raise NeedsMutagen("Numeric MP4 genre")
+
+		if item not in wanted or wanted[item] in tags:
+			continue
+
+		values = []
+
+		for (atom, data_start, data_end) in _mp4_atoms(fileobj, item_end):
+			if atom != b"data":
+				continue
+
+			(flags,) = unpack(">I", reader.read(4))
+
+			if flags & 0xffffff != 1:
+				raise NeedsMutagen("Non-text MP4 item")
+
+			reader.skip(4)
+			values.append(reader.read(data_end - data_start - 8).decode("utf-8", "replace"))
+
+		if values:
+			tags[wanted[item]] = values
+
+	return tags
+
+
+def read_asf_fields(fileobj, fields):
+	"""
+	Read the given fields from the content description objects in an ASF header,
+	seeking past values that aren't needed.
+
+	:param fileobj: (file) Music file opened in binary mode
+	:param fields: (frozenset) Easy-mode names of the fields to read
+
+	:returns: (dict) Lists of strings for each field found
+	"""
+	reader = _FileReader(fileobj)
+	(guid, size, count) = unpack("<16sQI", reader.read(28))
+	reader.skip(2)
+
+	if guid != ASF_HEADER:
+		raise NeedsMutagen("No ASF header")
+
+	wanted = dict((name, field) for (name, field) in ASF_FIELDS.items() if field in fields)
+	described = {}
+	extended = {}
+	offset = 30
+
+	for _ in range(count):
+		fileobj.seek(offset)
+		(guid, object_size) = unpack("<16sQ", reader.read(24))
+
+		if object_size < 24 or offset + object_size > size:
+			raise NeedsMutagen("Invalid ASF object")
+
+		if guid == ASF_CONTENT_DESCRIPTION:
+			lengths = unpack("<5H", reader.read(10))
+
+			for (name, length) in zip(ASF_CONTENT_NAMES, lengths):
+				if name in wanted and length:
+					described[name] = reader.read(length).decode("utf-16-le").strip("\x00")
+				else:
+					reader.skip(length)
+
+		elif guid == ASF_EXTENDED_CONTENT_DESCRIPTION:
+			(descriptors,) = unpack("<H", reader.read(2))
+
+			for _ in range(descriptors):
+				(name_length,) = unpack("<H", reader.read(2))
+				name = reader.read(name_length).decode("utf-16-le").strip("\x00")
+				(value_type, value_length) = unpack("<HH", reader.read(4))
+
+				if name in wanted and name not in extended:
+					if value_type != 0:
+						raise NeedsMutagen("Non-text ASF attribute")
+
+					extended[name] = reader.read(value_length).decode("utf-16-le").strip("\x00")
+				else:
+					reader.skip(value_length)
+
+		offset += object_size
+
+	tags = {}
+
+	# Mutagen lists content description values ahead of extended ones
+	for (name, field) in wanted.items():
+		if name in described:
+			tags[field] = [described[name]]
+		elif name in extended:
+			tags[field] = [extended[name]]
+
+	return tags
+
+
+READERS = {
+	"mp3": read_id3_fields,
+	"flac": read_flac_fields,
+	"ogg": read_ogg_fields,
+	"oga": read_ogg_fields,
+	"opus": read_ogg_fields,
+	"m4a": read_mp4_fields,
+	"m4b": read_mp4_fields,
+	"mp4": read_mp4_fields,
+	"asf": read_asf_fields,
+	"wma": read_asf_fields,
+	}
+
+# Formats whose readers can't rule out a field existing somewhere they don't look,
+# such as an ID3v1 tag at the end of the file or an ASF metadata library object
+INCONCLUSIVE_READERS = [read_id3_fields, read_asf_fields]
+
+
+def read_tag_fields(path, fields):
+	"""
+	Read only the given easy-mode fields from the tag container of the given file,
+	without parsing its audio stream or the parts of its tags that aren't needed.
+
+	:param path: (str) Absolute path to music file
+	:param fields: (iterable) Easy-mode names of the fields to read
+
+	:returns: None if the file has to be parsed by Mutagen,
+			  a dict of lists of strings for each field otherwise
+	"""
+	tags = None
+	fields = frozenset(fields)
+	reader = READERS.get(path.rsplit(".", 1)[-1].lower())
+
+	if reader is not None:
+		try:
+			with open(path, "rb") as music:
+				tags = reader(music, fields)
+		except (NeedsMutagen, EnvironmentError, StructError, UnicodeDecodeError):
+			tags = None
+
+		# Let Mutagen have the final word on whether a field is really missing
+		if tags is not None and len(tags) != len(fields) and reader in INCONCLUSIVE_READERS:
+			tags = None
+
+	return tags
@@ -0,0 +1,178 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from os import fsdecode, scandir, stat
+from os.path import abspath
+
+
+# Directory listings queued per thread; bounds how far
+# the walk can run ahead of whatever is consuming its paths
+WALK_QUEUE_DEPTH = 4
+
+# Bytes of a file list read at a time
+FILE_LIST_CHUNK_SIZE = 64 * 1024
+
+
+def list_dir(path):
+	"""
+	List the files and subdirectories directly inside the given directory,
+	using the type information the directory listing already provides.
+
+	:param path: (str) Absolute path to directory
+
+	:returns: (tuple) (list, list) Absolute paths to the files and subdirectories;
+						symbolic links to directories are not followed
+	"""
+	files = []
+	subdirs = []
+
+	with scandir(path) as entries:
+		for entry in entries:
+			try:
+				if entry.is_dir(follow_symlinks=False):
+					subdirs.append(entry.path)
+				elif entry.is_file():
+					files.append(entry.path)
+			except OSError:
+				# Entries that vanish or can't be inspected mid-listing aren't files we can use
+				pass
+
+	return (files, subdirs)
+
+
+def list_changed(path, snapshot=None):
+	"""
+	List the files and subdirectories directly inside the given directory,
+	unless the snapshot shows it hasn't changed since it was last listed.
+
+	:param path: (str) Absolute path to directory
+	:param snapshot: (DirSnapshot/None) Directories as they were when last listed
+
+	:returns: (tuple) (list, list) Absolute paths to the files, only those new or changed
+						if the directory was listed before, and the subdirectories
+	"""
+	def _changed(file_path, since):
+		try:
+			changed = stat(file_path).st_ctime_ns > since
+		except OSError:
+			# Let reading the file report the problem
+			changed = True
+
+		return changed
+
+
+	if snapshot is None:
+		result = list_dir(path)
+	else:
+		dir_stat = stat(path)
+		(subdirs, since) = snapshot.check(path, dir_stat)
+
+		if subdirs is not None:
+			result = ([], subdirs)
+		else:
+			(files, subdirs) = list_dir(path)
+			snapshot.record(path, dir_stat, subdirs)
+
+			# Renaming or copying a file in sets its ctime, even when its mtime is kept
+			if since is not None:
+				files = [file_path for file_path in files if _changed(file_path, since)]
+
+			result = (files, subdirs)
+
+	return result
+
+
+def scan_files(logger, tops, recursive=True, threads=1, snapshot=None):
+	"""
+	Generate the paths of all files inside the given directories as they are found.
+	With a single thread directories are walked depth-first in listing order,
+	like os.walk(); with more, directories are listed concurrently and files
+	come back in whatever order their listings finish.
+
+	:param logger: (Logger) Logging object
+	:param tops: (iterable) Strings representing absolute paths to directories
+	:param recursive: (bool) Whether or not to descend into subdirectories
+	:param threads: (int) Number of directories to list at once
+	:param snapshot: (DirSnapshot/None) Directories as they were when last listed, updated as
+										they're listed again; files in unchanged ones are passed over
+
+	:returns: (generator) Strings representing absolute paths to files
+	"""
+	if threads <= 1:
+		waiting = list(reversed(list(tops)))
+
+		while waiting:
+			path = waiting.pop()
+
+			try:
+				(files, subdirs) = list_changed(path, snapshot)
+			except OSError as e:
+				logger.info("Could not list directory %s: %s", path, e)
+				continue
+
+			for file_path in files:
+				yield file_path
+
+			if recursive:
+				waiting.extend(reversed(subdirs))
+	else:
+		waiting = deque(tops)
+		running = {}
+
+		with ThreadPoolExecutor(max_workers=threads) as pool:
+			while waiting or running:
+				while waiting and len(running) < threads * WALK_QUEUE_DEPTH:
+					path = waiting.popleft()
+					running[pool.submit(list_changed, path, snapshot)] = path
+
+				(done, _) = wait(list(running), return_when=FIRST_COMPLETED)
+
+				for future in done:
+					path = running.pop(future)
+
+					try:
+						(files, subdirs) = future.result()
+					except OSError as e:
+						logger.info("Could not list directory %s: %s", path, e)
+						continue
+
+					for file_path in files:
+						yield file_path
+
+					if recursive:
+						waiting.extend(subdirs)
+
+
+def read_file_list(stream, chunk_size=FILE_LIST_CHUNK_SIZE):
+	"""
+	Read a list of file paths separated by NUL characters, like find -print0
+	writes, handing each one over as soon as it has arrived in full.
+
+	:param stream: (file) Binary stream the list is read from
+	:param chunk_size: (int) Most bytes to read at a time
+
+	:returns: (generator) Strings representing absolute paths to the listed files;
+						  relative paths are taken to be relative to the current directory
+	"""
+	# Return whatever has arrived rather than waiting for a whole chunk, for lists written as they're made
+	read = getattr(stream, "read1", stream.read)
+	pending = b""
+
+	for chunk in iter(lambda: read(chunk_size), b""):
+		entries = (pending + chunk).split(b"\0")
+		pending = entries.pop()
+
+		for entry in entries:
+			if entry:
+				yield abspath(fsdecode(entry))
+
+	if pending:
+		yield abspath(fsdecode(pending))
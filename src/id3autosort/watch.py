@@ -0,0 +1,291 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import ctypes
+import os
+import struct
+
+from collections import OrderedDict
+from os.path import dirname, join
+from select import select
+from sys import platform
+from time import monotonic, sleep
+
+from id3autosort.walker import list_dir, scan_files
+
+
+# Seconds nothing in a directory has to change before the files that arrived in it are handed over
+DEFAULT_SETTLE = 2.0
+
+# Seconds between scans when polling for changes instead of using inotify
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Longest wait for changes between checks of whether watching should stop
+WATCH_STOP_INTERVAL = 1.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher(object):
+	"""
+	Files under a set of directories as the kernel reports them being written
+	and closed or moved in. New subdirectories are watched as they appear.
+	Linux only; raises OSError elsewhere or when inotify can't be used.
+	"""
+	def __init__(self, logger, tops):
+		"""
+		:param logger: (Logger) Logging object
+		:param tops: (iterable) Strings representing absolute paths to directories to watch
+		"""
+		self.logger = logger
+		self.tops = list(tops)
+		self.dirs = {}
+
+		if not platform.startswith("linux"):
+			raise OSError("inotify is only available on Linux")
+
+		self.libc = ctypes.CDLL(None, use_errno=True)
+		self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+
+		if self.fd < 0:
+			errno = ctypes.get_errno()
+			raise OSError(errno, os.strerror(errno))
+
+		for top in self.tops:
+			self._watch_tree(top)
+
+	def _watch(self, path):
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+
+		if wd < 0:
+			self.logger.info("Could not watch directory %s: %s", path, os.strerror(ctypes.get_errno()))
+		else:
+			self.dirs[wd] = path
+
+	def _watch_tree(self, top):
+		"""
+		Watch a directory and every directory under it.
+
+		:param top: (str) Absolute path to directory
+
+		:returns: (list) Absolute paths to the files already inside,
+						 which may have arrived before they could be watched
+		"""
+		result = []
+		waiting = [top]
+
+		while waiting:
+			path = waiting.pop()
+			self._watch(path)
+
+			try:
+				(files, subdirs) = list_dir(path)
+			except OSError as e:
+				self.logger.info("Could not list directory %s: %s", path, e)
+				continue
+
+			result.extend(files)
+			waiting.extend(subdirs)
+
+		return result
+
+	def changes(self, timeout=None):
+		"""
+		Wait for files to change.
+
+		:param timeout: (float/None) Most seconds to wait, None to wait until something changes
+
+		:returns: (list) (str, bool) Absolute path to each file that changed, and whether
+						 it was finished being written or moved in rather than written to
+		"""
+		result = []
+		(ready, _, _) = select([self.fd], [], [], timeout)
+
+		if ready:
+			events = os.read(self.fd, INOTIFY_READ_SIZE)
+			offset = 0
+
+			while offset < len(events):
+				(wd, mask, _, length) = INOTIFY_EVENT.unpack_from(events, offset)
+				name = events[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+				offset += INOTIFY_EVENT.size + length
+
+				if mask & IN_Q_OVERFLOW:
+					# Too many changes at once for the kernel to keep; look at everything again
+					self.logger.warning("Missed changes to watched directories, rescanning them")
+
+					for top in self.tops:
+						result.extend((path, True) for path in self._watch_tree(top))
+				elif mask & IN_IGNORED:
+					self.dirs.pop(wd, None)
+				elif name and wd in self.dirs:
+					path = join(self.dirs[wd], os.fsdecode(name))
+
+					if mask & IN_ISDIR:
+						if mask & (IN_CREATE | IN_MOVED_TO):
+							result.extend((file_path, True) for file_path in self._watch_tree(path))
+					elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+						result.append((path, True))
+					elif mask & IN_MODIFY:
+						result.append((path, False))
+
+		return result
+
+	def close(self):
+		os.close(self.fd)
+
+
+class PollingWatcher(object):
+	"""
+	Files under a set of directories, found by rescanning them at an interval
+	and comparing sizes and modification times. A file counts as finished
+	once it hasn't changed between two scans. Works on any platform and
+	filesystem, including network filesystems inotify can't see changes on.
+	"""
+	def __init__(self, logger, tops, interval=DEFAULT_POLL_INTERVAL):
+		"""
+		:param logger: (Logger) Logging object
+		:param tops: (iterable) Strings representing absolute paths to directories to watch
+		:param interval: (float) Seconds between scans
+		"""
+		self.logger = logger
+		self.tops = list(tops)
+		self.interval = interval
+		self.unsettled = set()
+		self.seen = self._scan()
+		self.scanned = monotonic()
+
+	def _scan(self):
+		result = {}
+
+		for path in scan_files(self.logger, self.tops):
+			try:
+				file_stat = os.stat(path)
+			except OSError:
+				continue
+
+			result[path] = (file_stat.st_size, file_stat.st_mtime_ns)
+
+		return result
+
+	def changes(self, timeout=None):
+		"""
+		Wait for files to change.
+
+		:param timeout: (float/None) Most seconds to wait, None to wait until the next scan
+
+		:returns: (list) (str, bool) Absolute path to each file that changed, and whether
+						 it was finished being written or is still changing
+		"""
+		result = []
+		wait = self.scanned + self.interval - monotonic()
+
+		if timeout is not None and timeout < wait:
+			sleep(max(0.0, timeout))
+		else:
+			sleep(max(0.0, wait))
+			seen = self._scan()
+			self.scanned = monotonic()
+
+			for (path, state) in seen.items():
+				if self.seen.get(path) != state:
+					self.unsettled.add(path)
+					result.append((path, False))
+				elif path in self.unsettled:
+					self.unsettled.discard(path)
+					result.append((path, True))
+
+			self.unsettled &= set(seen)
+			self.seen = seen
+
+		return result
+
+	def close(self):
+		pass
+
+
+def make_watcher(logger, tops, poll_interval=None):
+	"""
+	Watch directories with inotify where it's available, falling back to polling.
+
+	:param logger: (Logger) Logging object
+	:param tops: (iterable) Strings representing absolute paths to directories to watch
+	:param poll_interval: (float/None) Seconds between scans to poll instead of using inotify,
+									   None to poll only if inotify can't be used
+
+	:returns: (InotifyWatcher/PollingWatcher) Watcher for the directories
+	"""
+	result = None
+
+	if poll_interval is None:
+		try:
+			result = InotifyWatcher(logger, tops)
+		except OSError as e:
+			logger.info("Could not use inotify, polling for changes instead: %s", e)
+
+	if result is None:
+		result = PollingWatcher(logger, tops, poll_interval if poll_interval is not None else DEFAULT_POLL_INTERVAL)
+
+	return result
+
+
+def watch(logger, watcher, handle, settle=DEFAULT_SETTLE, stop=None):
+	"""
+	Hand over files as they arrive, a directory at a time once nothing
+	in the directory has changed for the settle time, so partly written
+	files and the rest of an album still being copied are waited for.
+
+	:param logger: (Logger) Logging object
+	:param watcher: (InotifyWatcher/PollingWatcher) Watcher reporting changed files
+	:param handle: (callable) Called with the absolute path to a directory
+							  and a list of absolute paths to the files that arrived in it
+	:param settle: (float) Seconds a directory has to be unchanged before its files are handed over
+	:param stop: (Event/None) Set to stop watching, None to watch until interrupted
+	"""
+	arrived = OrderedDict()
+	changed = {}
+
+	while stop is None or not stop.is_set():
+		now = monotonic()
+
+		for (directory, changed_at) in list(changed.items()):
+			if now - changed_at >= settle:
+				del changed[directory]
+				files = arrived.pop(directory, None)
+
+				if files:
+					logger.debug("Handling %d new files in %s", len(files), directory)
+					handle(directory, list(files))
+
+		timeout = max(0.0, settle - (now - min(changed.values()))) if changed else None
+
+		if stop is not None:
+			timeout = min(timeout, WATCH_STOP_INTERVAL) if timeout is not None else WATCH_STOP_INTERVAL
+
+		for (path, finished) in watcher.changes(timeout):
+			directory = dirname(path)
+			changed[directory] = monotonic()
+			files = arrived.setdefault(directory, OrderedDict())
+
+			if finished:
+				files[path] = True
+			else:
+				files.pop(path, None)
@@ -0,0 +1,177 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#                      Sort audio files based on metadata                      #
+#                    (C)2009-10, 2015, 2019-20 Jeremy Brown                    #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+import signal
+
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from os import kill
+from time import monotonic
+
+
+DONE = "done"
+SKIPPED = "skipped"
+TIMED_OUT = "timed out"
+CRASHED = "crashed"
+
+# Finished items held back per worker while an earlier, slower one is still being worked on
+WATCHDOG_QUEUE_DEPTH = 32
+
+
+def _work(conn, job):
+	"""
+	Worker process loop: run the job on each item sent until told to stop.
+
+	:param conn: (Connection) Worker's end of the pipe to the parent
+	:param job: (callable) Called with each item; its result is sent back
+	"""
+	while True:
+		try:
+			item = conn.recv()
+		except EOFError:
+			break
+
+		if item is None:
+			break
+
+		conn.send(job(item))
+
+
+class _Worker(object):
+	"""
+	One worker process and the parent's end of the pipe to it.
+	"""
+	__slots__ = ("conn", "process")
+
+	def __init__(self, job):
+		(self.conn, child_conn) = Pipe()
+		self.process = Process(target=_work, args=(child_conn, job))
+		self.process.daemon = True
+		self.process.start()
+		child_conn.close()
+
+	def stop(self, grace=None):
+		"""
+		:param grace: (float/None) Seconds to let the worker exit on its own before killing it,
+								   None to kill it right away; a worker stuck in the kernel,
+								   e.g. on a dead NFS server, is left to die rather than waited for
+		"""
+		if grace is not None:
+			# Workers started later hold copies of this end of the pipe,
+			# so closing it doesn't reach the worker as the end of its input
+			try:
+				self.conn.send(None)
+			except OSError:
+				pass
+
+			self.process.join(grace)
+
+		if self.process.is_alive():
+			# Unlike SIGTERM, SIGKILL can't be caught by anything the worker inherited,
+			# which would otherwise keep it around for the interpreter to wait on at exit
+			if hasattr(signal, "SIGKILL"):
+				kill(self.process.pid, signal.SIGKILL)
+			else:
+				self.process.terminate()
+
+		self.conn.close()
+
+
+class WatchdogPool(object):
+	"""
+	Worker processes that each work on one item at a time; a worker taking longer
+	than the time budget on an item is killed and replaced, so one pathological
+	input can't hold up the items after it.
+	"""
+	def __init__(self, workers, budget):
+		"""
+		:param workers: (int) Number of worker processes
+		:param budget: (float) Seconds a worker may spend on one item
+		"""
+		self.workers = workers
+		self.budget = budget
+
+	def imap(self, job, items, wanted=None):
+		"""
+		Run a job on each item in the worker processes.
+
+		:param job: (callable) Module-level function or partial of one, called with each item
+		:param items: (iterable) Items to run the job on
+		:param wanted: (callable/None) Called with each item to decide whether to run the job on it
+									   or pass it straight through; None to run the job on every item
+
+		:returns: (generator) (item, result, status) tuples in the order items were given;
+							  the result is None unless the status is DONE
+		"""
+		items = iter(items)
+		idle = []
+		busy = {}
+		finished = {}
+		given = 0
+		returned = 0
+		exhausted = False
+
+		try:
+			while True:
+				# Keep every worker busy, without letting finished items pile up behind a slow one
+				while not exhausted and len(finished) < self.workers * WATCHDOG_QUEUE_DEPTH:
+					if len(busy) >= self.workers:
+						break
+
+					try:
+						item = next(items)
+					except StopIteration:
+						exhausted = True
+						break
+
+					if wanted is not None and not wanted(item):
+						finished[given] = (item, None, SKIPPED)
+					else:
+						worker = idle.pop() if idle else _Worker(job)
+						worker.conn.send(item)
+						busy[worker.conn] = (worker, given, item, monotonic())
+
+					given += 1
+
+				while returned in finished:
+					yield finished.pop(returned)
+					returned += 1
+
+				if not busy:
+					if exhausted and not finished:
+						break
+
+					continue
+
+				deadline = min(started for (_, _, _, started) in busy.values()) + self.budget
+
+				for conn in wait(list(busy), max(0.0, deadline - monotonic())):
+					(worker, index, item, _) = busy.pop(conn)
+
+					try:
+						finished[index] = (item, conn.recv(), DONE)
+					except (EOFError, OSError):
+						worker.stop()
+						finished[index] = (item, None, CRASHED)
+					else:
+						idle.append(worker)
+
+				now = monotonic()
+
+				for (conn, (worker, index, item, started)) in list(busy.items()):
+					if now - started >= self.budget:
+						del busy[conn]
+						worker.stop()
+						finished[index] = (item, None, TIMED_OUT)
+		finally:
+			for worker in idle:
+				worker.stop(self.budget)
+
+			for (worker, _, _, _) in busy.values():
+				worker.stop()
@@ -7,9 +7,12 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
+import json
+
 from argparse import ArgumentTypeError, Namespace
 from mock import Mock, patch
 from os.path import abspath, dirname, getsize, join
+from shutil import copy
 
 import pytest
 
@@ -108,11 +111,18 @@ def test_main(mock_logger, mock_parse_args, mock_extract, mock_insert, action):
 		"dry_run": False,
 		"extract_music": join(APIC_TOOL_DATA, "test_extract.mp3"),
 		"extract_pic": None,
+		"file_timeout": None,
 		"force": False,
 		"insert_files": [join(APIC_TOOL_DATA, "test_extract.mp3")],
 		"insert_dirs": None,
 		"insert_pic": join(APIC_TOOL_DATA, "test_cover.png"),
 		"keep_pic": True,
+		"hooks": None,
+		"profile": None,
+		"quarantine": None,
+		"slowest": 0,
+		"stats": False,
+		"stats_json": None,
 		"verbose": False,
 		}
 
@@ -124,7 +134,8 @@ def test_main(mock_logger, mock_parse_args, mock_extract, mock_insert, action):
 											 args_dict["extract_music"],
 											 args_dict["extract_pic"],
 											 args_dict["dry_run"],
-											 args_dict["force"])
+											 args_dict["force"],
+											 None)
 	else:
 		mock_insert.assert_called_once_with(mock_logger,
 											args_dict["insert_pic"],
@@ -132,4 +143,49 @@ def test_main(mock_logger, mock_parse_args, mock_extract, mock_insert, action):
 											args_dict["insert_files"],
 											args_dict["keep_pic"],
 											args_dict["dry_run"],
-											args_dict["force"])
+											args_dict["force"],
+											stats=None,
+											file_timeout=None,
+											quarantine=None)
+
+
+@pytest.mark.parametrize("action", ["insert", "extract"], ids=["insert-action", "extract-action"])
+@patch("apic_tool.cli.logger")
+def test_main_stats(mock_logger, action, tmpdir):
+	music_path = str(tmpdir.join("test_extract.mp3"))
+	stats_path = tmpdir.join("stats.json")
+	profile_path = tmpdir.join("run.pstats")
+	copy(join(APIC_TOOL_DATA, "test_extract.mp3"), music_path)
+
+	if action == "extract":
+		argv = ["--stats", "--stats-json", str(stats_path), "--slowest", "1", "--profile", str(profile_path),
+				"extract", music_path]
+	else:
+		argv = ["--stats", "--stats-json", str(stats_path), "--slowest", "1", "--profile", str(profile_path),
+				"--force", "insert", "-k", "-f", music_path, "-p", join(APIC_TOOL_DATA, "test_cover.png")]
+
+	with patch("apic_tool.cli.parse_args", return_value=parse_args(argv=argv)):
+		main()
+
+	report = json.loads(stats_path.read())
+	assert report["files"] == 1
+	assert set(report["stages"]) >= ({"extract", "write"} if action == "extract" else {"check", "save"})
+	assert report["latency"]["p50"] is not None
+	assert [entry["path"] for entry in report["slowest"]["extract" if action == "extract" else "save"]] == [music_path]
+	assert profile_path.check()
+	assert any(c[0][0].startswith("Handled %d files") for c in mock_logger.info.call_args_list)
+
+
+@patch("apic_tool.cli.insert_image")
+@patch("apic_tool.cli.logger")
+def test_main_quarantine(mock_logger, mock_insert, tmpdir):
+	quarantine_path = tmpdir.join("quarantine")
+	argv = ["insert", "--file-timeout", "2.5", "--quarantine", str(quarantine_path),
+			"-f", join(APIC_TOOL_DATA, "test_insert.mp3"), "-p", join(APIC_TOOL_DATA, "test_cover.png")]
+
+	with patch("apic_tool.cli.parse_args", return_value=parse_args(argv=argv)):
+		main()
+
+	assert mock_insert.call_args[1]["file_timeout"] == 2.5
+	assert mock_insert.call_args[1]["quarantine"].quarantine.closed
+	assert quarantine_path.check()
@@ -7,18 +7,31 @@
 #       Released under version 3.0 of the Non-Profit Open Source License       #
 ################################################################################
 
-from mock import call, Mock
+from mock import call, Mock, patch
 from os.path import abspath, dirname, getsize, join
 from shutil import copy
+from time import sleep
 
 import pytest
 
-from apic_tool.insertion import get_music_files, insert_image
+from apic_tool.insertion import _check_job, get_music_files, insert_image
+from id3autosort.quarantine import Quarantine
 
 
 APIC_TOOL_DATA = abspath(join(dirname(__file__), "data"))
 AUTOSORT_AUDIO = abspath(join(dirname(dirname(__file__)), "id3autosort", "audio"))
 
+# File checking hangs on in _hanging_check_job()
+HUNG_AUDIO = join(AUTOSORT_AUDIO, "test_mp3.mp3")
+
+
+def _hanging_check_job(path, forced):
+	# Module level so worker processes import it however they're started, not just when forked
+	if path == HUNG_AUDIO:
+		sleep(60)
+
+	return _check_job(path, forced)
+
 
 def test_get_music_files():
 	mock_logger = Mock()
@@ -48,10 +61,31 @@ def test_insert_image(tmpdir):
 	cover_size = getsize(cover_path)
 	assert len(tmpdir.listdir()) == 2
 
-	insert_image(mock_logger, cover_path, None, [music_path], False, False, False)
+	with patch("apic_tool.insertion.drop_pages") as mock_drop:
+		insert_image(mock_logger, cover_path, None, [music_path], False, False, False)
+
+	mock_drop.assert_called_once_with(music_path, written=True)
 	assert len(tmpdir.listdir()) == 1
 	assert getsize(music_path) >= orig_size + cover_size
 	mock_logger.debug.assert_any_call("Writing image %s to file %s", cover_path, music_path)
 	mock_logger.info.assert_has_calls([
 		call("Deleting image file %s", cover_path)
 		], any_order=True)
+
+
+def test_get_music_files_timeout(tmpdir):
+	mock_logger = Mock()
+	quarantine = Quarantine(str(tmpdir.join("quarantine")))
+	hung = HUNG_AUDIO
+	file_list = [hung, join(APIC_TOOL_DATA, "test_insert.mp3")]
+
+	with patch("apic_tool.insertion._check_job", _hanging_check_job):
+		assert get_music_files(mock_logger, file_list, None, True, file_timeout=1,
+							   quarantine=quarantine) == file_list[1:]
+		mock_logger.warning.assert_called_once_with("Gave up checking %s after %g seconds", hung, 1)
+
+		# Later runs skip the file without trying it again
+		assert get_music_files(mock_logger, file_list, None, True, quarantine=quarantine) == file_list[1:]
+		mock_logger.info.assert_any_call("Skipping %s, quarantined", hung)
+
+	quarantine.close()
@@ -63,6 +63,17 @@ def test_load_file(mock_mp3, scenario):
 		mock_logger.info.assert_called_once_with("Error trying to load %s as MP3 file: %s", path, "can't sync to MPEG frame")
 
 
+def test_load_file_page_cache():
+	mock_logger = Mock()
+	path = join(APIC_TOOL_DATA, "test_extract.mp3")
+
+	with patch("apic_tool.workers.mp3worker.tag_read_hints") as mock_hints:
+		assert isinstance(mp3worker.MP3Worker.load_file(mock_logger, path), MP3)
+
+	mock_hints.assert_called_once_with(path, drop_cache=False)
+	assert mock_hints.return_value.__exit__.called
+
+
 @pytest.mark.parametrize("scenario", ["good", "missing", "unclean", "tagless"],
 						 ids=["happy-path", "missing-metadata", "sketchy-load", "tagless-file"])
 def test_get_image_data(scenario):
@@ -119,10 +130,14 @@ def test_can_insert_image(scenario):
 		mock_load.info.sketchy = False
 		mock_load.tags = {}
 
-	result = mp3worker.MP3Worker.can_insert_image(mock_logger, path, force)
+	with patch("apic_tool.workers.mp3worker.drop_pages") as mock_drop:
+		result = mp3worker.MP3Worker.can_insert_image(mock_logger, path, force)
 
 	assert result is (True if scenario == "good" or force else False)
 
+	# Files about to be written to stay cached for the write
+	assert mock_drop.called is not result
+
 	if scenario == "unclean":
 		mock_logger.warning.assert_called_once_with("Couldn't load file %s cleanly, skipping", path)
 	elif scenario == "tagless":
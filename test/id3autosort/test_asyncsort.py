@@ -0,0 +1,110 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+import asyncio
+
+from os.path import abspath, dirname, join
+from shutil import copytree
+
+import py
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.asyncsort import async_sort
+from id3autosort.cache import MetadataCache
+from id3autosort.journal import MoveJournal
+from id3autosort.sorter import get_music_files, sort, Structure
+
+
+TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
+
+
+def _run(coroutine):
+	loop = asyncio.new_event_loop()
+
+	try:
+		return loop.run_until_complete(coroutine)
+	finally:
+		loop.close()
+
+
+def _tree(path):
+	return sorted(p.relto(path) for p in path.visit() if p.check(file=True))
+
+
+@pytest.mark.parametrize("read_limit, move_limit", [[1, 1], [3, 2]], ids=["serial", "concurrent"])
+def test_async_sort(tmpdir, read_limit, move_limit):
+	source = tmpdir.join("source")
+	expected = tmpdir.join("expected")
+	copytree(TEST_AUDIO, str(source))
+	copytree(TEST_AUDIO, str(tmpdir.join("serial")))
+	structure = Structure("{artist}/{album}")
+
+	sort(Mock(), str(tmpdir.join("serial")), str(expected), structure, True, False)
+	_run(async_sort(Mock(), str(source), str(tmpdir.join("dest")), structure, True, False,
+					read_limit=read_limit, move_limit=move_limit))
+
+	assert _tree(tmpdir.join("dest")) == _tree(expected)
+	assert _tree(source) == _tree(tmpdir.join("serial"))
+
+
+def test_async_sort_dry_run(tmpdir):
+	mock_logger = Mock()
+	source = tmpdir.join("source")
+	copytree(TEST_AUDIO, str(source))
+
+	_run(async_sort(mock_logger, str(source), str(tmpdir.join("dest")), Structure("{artist}"), True, True))
+	assert _tree(source) == _tree(py.path.local(TEST_AUDIO))
+	assert not tmpdir.join("dest").check()
+	assert mock_logger.debug.call_count > 0
+
+	_run(async_sort(mock_logger, str(tmpdir.mkdir("empty")), str(tmpdir), Structure("{artist}"), True, False))
+	mock_logger.info.assert_called_with("No music files in %s", str(tmpdir.join("empty")))
+
+
+def test_async_sort_cache_journal(tmpdir):
+	mock_logger = Mock()
+	library = tmpdir.join("library")
+	copytree(TEST_AUDIO, str(library))
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	structure = Structure("{artist}")
+
+	_run(async_sort(mock_logger, str(library), str(library), structure, True, False, cache=cache, journal=journal))
+	moves = journal.moves()
+	assert len(moves) == 7
+
+	# Moved files are found in the cache, and a resumed sort doesn't even look them up
+	with patch("id3autosort.sorter.read_tags") as mock_read_tags:
+		assert len(list(get_music_files(mock_logger, str(library), True, fields=structure.fields, cache=cache))) == 7
+		assert not mock_read_tags.called
+
+	with patch("id3autosort.asyncsort.read_tags") as mock_read_tags:
+		_run(async_sort(mock_logger, str(library), str(library), structure, True, False, cache=cache,
+						journal=journal, resume=True))
+		assert all(c[0][1] not in set(dest for (_, dest) in moves) for c in mock_read_tags.call_args_list)
+
+	assert journal.moves() == moves
+	journal.close()
+	cache.close()
+
+
+def test_async_sort_failure(tmpdir):
+	source = tmpdir.join("source")
+	copytree(TEST_AUDIO, str(source))
+
+	with patch("id3autosort.asyncsort.get_new_path", side_effect=RuntimeError("Broken")):
+		with pytest.raises(RuntimeError):
+			_run(async_sort(Mock(), str(source), str(tmpdir.join("dest")), Structure("{artist}"), True, False,
+							read_limit=1))
+
+	assert _tree(source) == _tree(py.path.local(TEST_AUDIO))
@@ -0,0 +1,117 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mock import patch
+
+from id3autosort.cache import MetadataCache
+
+
+FakeStat = namedtuple("FakeStat", ["st_dev", "st_ino", "st_size", "st_mtime_ns"])
+TAGS = {"artist": "Track Artist", "album": "Track Album"}
+
+
+def test_get_put(tmpdir):
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	file_stat = FakeStat(1, 2, 3, 4)
+
+	assert cache.get(file_stat, True, None) is None
+
+	cache.put(file_stat, True, None, TAGS)
+	assert cache.get(file_stat, True, None) == TAGS
+	assert cache.get(file_stat, True, ["artist"]) == TAGS
+	assert cache.get(file_stat, False, None) is None
+	assert cache.get(FakeStat(1, 2, 3, 5), True, None) is None
+	assert cache.get(FakeStat(1, 2, 6, 4), True, None) is None
+	cache.close()
+
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	assert cache.get(file_stat, True, None) == TAGS
+	cache.close()
+
+
+def test_partial_fields(tmpdir):
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	file_stat = FakeStat(1, 2, 3, 4)
+
+	cache.put(file_stat, True, ["artist", "album", "date"], TAGS)
+	assert cache.get(file_stat, True, ["artist", "date"]) == TAGS
+	assert cache.get(file_stat, True, ["artist", "genre"]) is None
+	assert cache.get(file_stat, True, None) is None
+	cache.close()
+
+
+def test_move(tmpdir):
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	old_stat = FakeStat(1, 2, 3, 4)
+	new_stat = FakeStat(5, 6, 3, 7)
+
+	cache.put(old_stat, True, None, TAGS)
+	cache.put(old_stat, False, None, TAGS)
+	cache.move(old_stat, old_stat)
+	assert cache.get(old_stat, True, None) == TAGS
+
+	cache.move(old_stat, new_stat)
+	assert cache.get(old_stat, True, None) is None
+	assert cache.get(new_stat, True, None) == TAGS
+	assert cache.get(new_stat, False, None) == TAGS
+
+	# Linked files keep the original's entries as well
+	linked_stat = FakeStat(5, 8, 3, 7)
+	cache.move(new_stat, linked_stat, True)
+	assert cache.get(new_stat, True, None) == TAGS
+	assert cache.get(linked_stat, True, None) == TAGS
+	cache.close()
+
+
+@patch("id3autosort.cache.COMMIT_INTERVAL", 5)
+def test_threads(tmpdir):
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	stats = [FakeStat(1, ino, 3, 4) for ino in range(200)]
+
+	def _use(file_stat):
+		cache.put(file_stat, True, None, TAGS)
+		return cache.get(file_stat, True, None)
+
+	with ThreadPoolExecutor(max_workers=8) as pool:
+		assert list(pool.map(_use, stats)) == [TAGS] * len(stats)
+
+	cache.close()
+
+
+@patch("id3autosort.cache.COMMIT_INTERVAL", 2)
+@patch("id3autosort.cache.time")
+def test_eviction(mock_time, tmpdir):
+	path = str(tmpdir.join("cache.db"))
+	stats = [FakeStat(1, ino, 3, 4) for ino in range(4)]
+
+	mock_time.return_value = 100
+	cache = MetadataCache(path, max_entries=3)
+
+	for file_stat in stats:
+		cache.put(file_stat, True, None, TAGS)
+
+	cache.close()
+
+	# Oldest entries go first, but using an entry keeps it around
+	mock_time.return_value = 200
+	cache = MetadataCache(path, max_entries=2)
+	assert cache.get(stats[0], True, None) is None
+	assert cache.get(stats[1], True, None) == TAGS
+	cache.close()
+
+	cache = MetadataCache(path)
+	assert [cache.get(s, True, None) is not None for s in stats] == [False, True, False, True]
+	cache.close()
@@ -0,0 +1,59 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from os import stat, utime
+
+from id3autosort.dirsnapshot import DirSnapshot
+
+
+def test_dir_snapshot(tmpdir):
+	path = str(tmpdir.join("snapshot"))
+	library = tmpdir.mkdir("library")
+	album = library.mkdir("album")
+	snapshot = DirSnapshot(path)
+
+	assert snapshot.check(str(library), stat(str(library))) == (None, None)
+	snapshot.record(str(library), stat(str(library)), [str(album)])
+	assert snapshot.check(str(library), stat(str(library))) == ([str(album)], stat(str(library)).st_ctime_ns)
+	snapshot.save()
+
+	snapshot = DirSnapshot(path)
+	assert snapshot.check(str(library), stat(str(library)))[0] == [str(album)]
+
+	# Setting the modification time back doesn't hide a change
+	dir_stat = stat(str(library))
+	library.join("new.mp3").ensure()
+	utime(str(library), ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+	assert snapshot.check(str(library), stat(str(library))) == (None, dir_stat.st_ctime_ns)
+
+
+def test_dir_snapshot_removed(tmpdir):
+	path = str(tmpdir.join("snapshot"))
+	snapshot = DirSnapshot(path)
+	dir_stat = stat(str(tmpdir))
+
+	snapshot.record("/in", dir_stat, ["/in/a", "/in/b"])
+	snapshot.record("/in/a", dir_stat, ["/in/a/1"])
+	snapshot.record("/in/a/1", dir_stat, [])
+	snapshot.record("/in/b", dir_stat, [])
+	snapshot.record("/in/ab", dir_stat, [])
+	snapshot.save()
+
+	# Directories that are gone are forgotten along with everything under them
+	snapshot = DirSnapshot(path)
+	snapshot.record("/in", dir_stat, ["/in/b"])
+	snapshot.save()
+	assert sorted(DirSnapshot(path).dirs) == ["/in", "/in/ab", "/in/b"]
+
+
+def test_dir_snapshot_unreadable(tmpdir):
+	tmpdir.join("snapshot").write("{")
+	assert DirSnapshot(str(tmpdir.join("snapshot"))).dirs == {}
@@ -0,0 +1,98 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from collections import Counter
+from os import stat
+from os.path import abspath, dirname, getsize, join
+from random import Random
+from shutil import copy
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.estimate import estimate, estimate_distinct, log_estimate
+from id3autosort.sorter import Structure
+from id3autosort.walker import scan_files
+
+
+TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
+
+
+@pytest.fixture
+def library(tmpdir):
+	source = tmpdir.mkdir("source")
+
+	for name in ["test_mp3.mp3", "test_flac.flac", "test_ogg.ogg"]:
+		copy(join(TEST_AUDIO, name), str(source))
+
+	source.join("notes.txt").write("not music")
+	return source
+
+
+@pytest.mark.parametrize("cross_device", [True, False], ids=["cross-device", "same-device"])
+def test_estimate_everything(tmpdir, library, cross_device):
+	mock_logger = Mock()
+	out_dir = tmpdir.mkdir("out")
+	music_size = sum(getsize(str(library.join(name))) for name in ["test_mp3.mp3", "test_flac.flac", "test_ogg.ogg"])
+	out_dev = -1 if cross_device else stat(str(library)).st_dev
+
+	with patch("id3autosort.estimate.stat", side_effect=lambda path: Mock(st_dev=out_dev) if path == str(out_dir)
+			   else stat(path)):
+		report = estimate(mock_logger, scan_files(mock_logger, [str(library)]), str(out_dir), Structure("{artist}"),
+						  True, fraction=1.0)
+
+	# Reading every file makes every estimate exact
+	assert report["files"] == report["sampled"] == 4
+	assert report["sorted"] == [3, 3, 3]
+	assert report["skip_rate"] == [0.25, 0.25, 0.25]
+	assert report["directories"] == [3, 3, 3]
+	assert report["cross_device_bytes"] == [music_size if cross_device else 0] * 3
+	assert (report["copy_rate"] is not None) == cross_device
+	assert report["wall"][0] >= report["walk_time"]
+
+	log_estimate(mock_logger, report)
+	mock_logger.info.assert_any_call("Files sorted: %.0f (%.0f-%.0f)", 3, 3, 3)
+
+
+def test_estimate_sample(tmpdir, library):
+	mock_logger = Mock()
+	paths = [str(library.join("test_mp3.mp3"))] * 200
+
+	with patch("id3autosort.estimate.read_tags", return_value={"artist": "Artist"}) as mock_read_tags:
+		report = estimate(mock_logger, paths, str(tmpdir), Structure("{artist}"), True, fraction=0.1, seed=1)
+
+	assert report["files"] == 200
+	assert report["sampled"] == mock_read_tags.call_count
+	assert 0 < report["sampled"] < 60
+	assert report["sorted"] == [200, 200, 200]
+
+	# Too few files to pick any
+	report = estimate(mock_logger, paths[:1], str(tmpdir), Structure("{artist}"), True, fraction=0.001, seed=1)
+	assert report["sampled"] == 0
+	assert mock_logger.warning.called
+
+
+@pytest.mark.parametrize("fraction", [0.02, 0.1, 0.5])
+@pytest.mark.parametrize("per_value", [3, 12], ids=["small", "large"])
+def test_estimate_distinct(fraction, per_value):
+	random = Random(0)
+	counts = Counter()
+
+	for value in range(5000):
+		for _ in range(per_value):
+			if random.random() < fraction:
+				counts[value] += 1
+
+	(result, low, high) = estimate_distinct(counts, fraction)
+	assert low <= 5000 <= high
+	assert low >= len(counts)
+	assert estimate_distinct(counts, 1.0) == [len(counts)] * 3
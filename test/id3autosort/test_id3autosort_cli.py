@@ -9,15 +9,25 @@
 
 from __future__ import unicode_literals
 
+import json
+
 from argparse import Namespace
-from os import sep
+from os import fdopen, pipe, sep
 from os.path import abspath, dirname, join
+from threading import Timer
 
 import pytest
 
 from mock import Mock, patch
 
 from id3autosort.cli import main, parse_args
+from id3autosort.estimate import DEFAULT_SAMPLE_FRACTION
+from id3autosort.mover import DEFAULT_COPY_WORKERS
+from id3autosort.scheduler import DEFAULT_ROTATIONAL_JOBS
+from id3autosort.stats import StageHook
+from id3autosort.prefilter import AUDIO_EXTENSIONS
+from id3autosort.quarantine import Quarantine
+from id3autosort.walker import scan_files
 
 
 TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
@@ -59,30 +69,450 @@ def test_parse_args(tmpdir, windows_safe, verbose, dry_run, structure, source_di
 		assert args.verbose == verbose
 		assert args.dry_run == dry_run
 		assert args.windows_safe == windows_safe
-		assert args.structure == output_structure
+		assert args.structure.template == output_structure
+		assert args.structure.fields == frozenset(["artist", "album", "date"] if structure else ["artist", "album"])
+		assert args.views == []
 		assert args.src_paths == [TEST_AUDIO]
 		assert args.dest_path == str(tmpdir)
+		assert args.jobs == 1
+		assert args.cache is None
+		assert args.extensions is None
+		assert not args.sniff
+		assert args.max_size is None
+		assert args.walk_threads == 1
+
+
+@pytest.mark.parametrize("raw_size, size", [("100", 100), ("2k", 2048), ("500M", 500 * 1024 ** 2), ("1GB", 1024 ** 3)],
+						 ids=["bytes", "kilobytes", "megabytes", "gigabytes"])
+def test_parse_args_prefilter(tmpdir, raw_size, size):
+	args = parse_args(argv=["--sniff", "--max-size", raw_size, "-e", "MP3, .flac", TEST_AUDIO, str(tmpdir)])
+
+	assert args.sniff
+	assert args.max_size == size
+	assert args.extensions == frozenset(["mp3", "flac"])
+	assert parse_args(argv=["-e", "*", TEST_AUDIO, str(tmpdir)]).extensions is None
+	assert parse_args(argv=["-e", "Audio", TEST_AUDIO, str(tmpdir)]).extensions == AUDIO_EXTENSIONS
+
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--max-size", "lots", TEST_AUDIO, str(tmpdir)])
+
+
+def test_parse_args_cache(tmpdir):
+	args = parse_args(argv=["--cache", str(tmpdir.join("cache.db")), "--cache-size", "50", TEST_AUDIO, str(tmpdir)])
+
+	assert args.cache == str(tmpdir.join("cache.db"))
+	assert args.cache_size == 50
+
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--cache", str(tmpdir), TEST_AUDIO, str(tmpdir)])
+
+
+def test_parse_args_rotational_jobs(tmpdir):
+	assert parse_args(argv=["--rotational-jobs", "3", TEST_AUDIO, str(tmpdir)]).rotational_jobs == 3
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).rotational_jobs == DEFAULT_ROTATIONAL_JOBS
+
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--rotational-jobs", "0", TEST_AUDIO, str(tmpdir)])
+
+
+def test_parse_args_read_order(tmpdir):
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).read_order == "walk"
+	assert parse_args(argv=["--read-order", "extent", TEST_AUDIO, str(tmpdir)]).read_order == "extent"
+
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--read-order", "random", TEST_AUDIO, str(tmpdir)])
+
+
+def test_parse_args_page_cache(tmpdir):
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).drop_cache
+	assert not parse_args(argv=["--keep-page-cache", TEST_AUDIO, str(tmpdir)]).drop_cache
+
+
+def test_parse_args_mover(tmpdir):
+	args = parse_args(argv=["--copy-workers", "8", "--verify", TEST_AUDIO, str(tmpdir)])
+
+	assert args.copy_workers == 8
+	assert args.verify
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).copy_workers == DEFAULT_COPY_WORKERS
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).link is None
+	assert parse_args(argv=["--link", "reflink", TEST_AUDIO, str(tmpdir)]).link == "reflink"
+
+	for argv in [["--copy-workers", "0"], ["--link", "copy"]]:
+		with pytest.raises(SystemExit):
+			parse_args(argv=argv + [TEST_AUDIO, str(tmpdir)])
+
+
+def test_parse_args_views(tmpdir):
+	args = parse_args(argv=["-s", sep.join(["r", "l"]), "-s", sep.join(["GENRES", "g", "d"]), "--view-link", "hard",
+							TEST_AUDIO, str(tmpdir)])
+
+	assert args.structure.template == sep.join(["{artist}", "{album}"])
+	assert [view.template for view in args.views] == [sep.join(["GENRES", "{genre}", "{date}"])]
+	assert args.view_link == "hard"
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).view_link == "symlink"
+
+
+def test_parse_args_journal(tmpdir):
+	args = parse_args(argv=["--journal", str(tmpdir.join("journal")), "--resume", TEST_AUDIO, str(tmpdir)])
+
+	assert args.journal == str(tmpdir.join("journal"))
+	assert args.resume
+	assert not args.undo
+
+	for flag in ["--resume", "--undo"]:
+		with pytest.raises(SystemExit):
+			parse_args(argv=[flag, TEST_AUDIO, str(tmpdir)])
+
 
+@pytest.mark.parametrize("jobs", ["0", "-2", "many"], ids=["zero", "negative", "non-integer"])
+def test_parse_args_bad_jobs(tmpdir, jobs):
+	with pytest.raises(SystemExit):
+		parse_args(argv=["-j", jobs, TEST_AUDIO, str(tmpdir)])
 
+
+@pytest.mark.parametrize("cache", [True, False], ids=["cache", "no-cache"])
+@pytest.mark.parametrize("journal, undo", [[False, False], [True, False], [True, True]],
+						 ids=["no-journal", "journal", "undo"])
+@pytest.mark.parametrize("rotational", [True, False], ids=["spinning", "solid-state"])
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.undo")
+@patch("id3autosort.cli.MoveJournal")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.PreFilter")
+@patch("id3autosort.cli.MetadataCache")
 @patch("id3autosort.cli.sort")
 @patch("id3autosort.cli.parse_args")
 @patch("id3autosort.cli.logger")
-def test_main(mock_logger, mock_parse_args, mock_sort):
+def test_main(mock_logger, mock_parse_args, mock_sort, mock_cache, mock_prefilter, mock_mover, mock_journal, mock_undo,
+			  mock_group, rotational, cache, journal, undo):
 	args_dict = {
+		"cache": "/tmp/cache.db" if cache else None,
+		"cache_size": 10,
+		"copy_workers": 3,
 		"dest_path": "/tmp",
+		"dir_snapshot": None,
+		"drop_cache": True,
 		"dry_run": False,
+		"estimate": False,
+		"extensions": frozenset(["mp3"]),
+		"file_timeout": None,
+		"files_from": None,
+		"jobs": 4,
+		"journal": "/tmp/journal" if journal else None,
+		"link": "hard",
+		"max_size": 1024,
+		"poll": None,
+		"read_order": "auto",
+		"resume": journal,
+		"sample": 0.01,
+		"rotational_jobs": 1,
+		"settle": 2.0,
+		"sniff": True,
+		"hooks": None,
+		"profile": None,
+		"quarantine": None,
+		"slowest": 0,
+		"stats": False,
+		"stats_json": None,
+		"verify": True,
+		"view_link": "symlink",
+		"views": [],
+		"walk_threads": 2,
 		"src_paths": [TEST_AUDIO],
 		"structure": "{artist}/{album}",
+		"undo": undo,
 		"verbose": False,
+		"watch": False,
 		"windows_safe": True,
 		}
 
 	mock_parse_args.return_value = Namespace(**args_dict)
+	mock_group.return_value = [(1, rotational, args_dict["src_paths"])]
+	main()
+
+	journal_obj = mock_journal.return_value if journal else None
+
+	if undo:
+		assert not mock_sort.called
+		mock_undo.assert_called_once_with(mock_logger,
+										  journal_obj,
+										  args_dict["src_paths"],
+										  args_dict["dest_path"],
+										  args_dict["dry_run"],
+										  mock_mover.return_value)
+	else:
+		assert not mock_undo.called
+		mock_sort.assert_called_once_with(mock_logger,
+										  args_dict["src_paths"][0],
+										  args_dict["dest_path"],
+										  args_dict["structure"],
+										  args_dict["windows_safe"],
+										  args_dict["dry_run"],
+										  jobs=1 if rotational else args_dict["jobs"],
+										  cache=mock_cache.return_value if cache else None,
+										  prefilter=mock_prefilter.return_value,
+										  walk_threads=1 if rotational else args_dict["walk_threads"],
+										  mover=mock_mover.return_value,
+										  journal=journal_obj,
+										  resume=args_dict["resume"],
+										  read_order="extent" if rotational else "walk",
+										  drop_cache=args_dict["drop_cache"],
+										  stats=None,
+										  file_timeout=None,
+										  quarantine=None,
+										  snapshot=None,
+										  views=[])
+
+	mock_prefilter.assert_called_once_with(args_dict["extensions"], args_dict["sniff"], args_dict["max_size"])
+
+	if undo:
+		# Undoing moves files back rather than linking them
+		mock_mover.assert_called_once_with(mock_logger, args_dict["copy_workers"], args_dict["verify"])
+	else:
+		mock_mover.assert_called_once_with(mock_logger, args_dict["copy_workers"], args_dict["verify"],
+										   args_dict["link"], args_dict["view_link"])
+
+	mock_mover.return_value.finish.assert_called_once_with()
+
+	if cache:
+		mock_cache.assert_called_once_with(args_dict["cache"], args_dict["cache_size"])
+		mock_cache.return_value.close.assert_called_once_with()
+	else:
+		assert not mock_cache.called
+
+	if journal:
+		mock_journal.assert_called_once_with(args_dict["journal"])
+		mock_journal.return_value.close.assert_called_once_with()
+	else:
+		assert not mock_journal.called
+
+
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_devices(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_group, tmpdir):
+	args = parse_args(argv=["-j", "4", "--rotational-jobs", "2", "--read-order", "inode",
+							TEST_AUDIO, str(tmpdir), str(tmpdir)])
+	mock_parse_args.return_value = args
+	mock_group.return_value = [(1, True, [TEST_AUDIO, str(tmpdir)]), (2, False, [str(tmpdir)])]
 	main()
 
-	mock_sort.assert_called_once_with(mock_logger,
-									  args_dict["src_paths"][0],
-									  args_dict["dest_path"],
-									  args_dict["structure"],
-									  args_dict["windows_safe"],
-									  args_dict["dry_run"])
+	# Each disk gets its own mover and is sorted with its own limits
+	assert mock_mover.call_count == 2
+	assert mock_mover.return_value.finish.call_count == 2
+	assert sorted((c[0][1], c[1]["jobs"], c[1]["read_order"]) for c in mock_sort.call_args_list) == sorted([
+		(TEST_AUDIO, 2, "inode"), (str(tmpdir), 2, "inode"), (str(tmpdir), 4, "inode")])
+
+
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_stats(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_group, tmpdir):
+	stats_path = tmpdir.join("stats.json")
+	profile_path = tmpdir.join("run.pstats")
+	mock_parse_args.return_value = parse_args(argv=["--stats", "--stats-json", str(stats_path), "--slowest", "3",
+													"--profile", str(profile_path), "--hook", "id3autosort.stats:StageHook",
+													TEST_AUDIO, str(tmpdir)])
+	mock_group.return_value = [(1, False, [TEST_AUDIO])]
+	main()
+
+	stats = mock_sort.call_args[1]["stats"]
+	assert "move" in stats.stages
+	assert stats.slowest == 3
+	assert [type(hook) for hook in stats.hooks] == [StageHook]
+	assert profile_path.check()
+	assert any(c[0][0].startswith("Handled %d files") for c in mock_logger.info.call_args_list)
+	assert set(json.loads(stats_path.read())) >= {"wall", "cpu", "files_per_sec", "latency", "stages"}
+
+
+def test_parse_args_hook(tmpdir):
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--hook", "id3autosort.noexist:Hook", TEST_AUDIO, str(tmpdir)])
+
+
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_quarantine(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_group, tmpdir):
+	quarantine_path = tmpdir.join("quarantine")
+	mock_parse_args.return_value = parse_args(argv=["--file-timeout", "2.5", "--quarantine", str(quarantine_path),
+													TEST_AUDIO, str(tmpdir)])
+	mock_group.return_value = [(1, False, [TEST_AUDIO])]
+	main()
+
+	assert mock_sort.call_args[1]["file_timeout"] == 2.5
+	assert isinstance(mock_sort.call_args[1]["quarantine"], Quarantine)
+	assert quarantine_path.check()
+
+
+@pytest.mark.parametrize("timeout", ["0", "-1", "soon"], ids=["zero", "negative", "non-number"])
+def test_parse_args_bad_file_timeout(tmpdir, timeout):
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--file-timeout", timeout, TEST_AUDIO, str(tmpdir)])
+
+
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.make_watcher")
+@patch("id3autosort.cli.watch")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_watch(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_watch, mock_make_watcher, mock_group, tmpdir):
+	arrivals = [join(TEST_AUDIO, "test_mp3.mp3"), join(TEST_AUDIO, "test_flac.flac")]
+	mock_parse_args.return_value = parse_args(argv=["--watch", "--poll", "10", "--settle", "0.5", "-j", "4",
+													TEST_AUDIO, str(tmpdir)])
+	mock_group.return_value = [(1, False, [TEST_AUDIO])]
+
+	def _watch(logger, watcher, handle, settle):
+		assert settle == 0.5
+		handle(TEST_AUDIO, arrivals)
+		raise KeyboardInterrupt
+
+	mock_watch.side_effect = _watch
+	main()
+
+	mock_make_watcher.assert_called_once_with(mock_logger, [TEST_AUDIO], 10)
+	mock_make_watcher.return_value.close.assert_called_once_with()
+	mock_logger.info.assert_any_call("Stopped watching")
+
+	# The first sort covers everything, later ones only what arrived
+	assert mock_sort.call_count == 2
+	assert mock_sort.call_args[0][1] == TEST_AUDIO
+	assert mock_sort.call_args[1]["jobs"] == 2
+	assert mock_sort.call_args[1]["files"] == arrivals
+	assert mock_mover.return_value.finish.call_count == 2
+
+
+def test_parse_args_watch_undo(tmpdir):
+	with pytest.raises(SystemExit):
+		parse_args(argv=["--watch", "--undo", "--journal", str(tmpdir.join("journal")), TEST_AUDIO, str(tmpdir)])
+
+
+@pytest.mark.parametrize("dry_run", [True, False], ids=["dry-run", "no-dry-run"])
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_dir_snapshot(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_group, dry_run, tmpdir):
+	snapshot_path = tmpdir.join("snapshot")
+	mock_parse_args.return_value = parse_args(argv=["--dir-snapshot", str(snapshot_path)] + (["-n"] if dry_run else [])
+											  + [TEST_AUDIO, str(tmpdir)])
+	mock_group.return_value = [(1, False, [TEST_AUDIO])]
+	main()
+
+	assert mock_sort.call_args[1]["snapshot"].path == str(snapshot_path)
+
+	# A dry run doesn't sort anything, so the next run has to look at everything again
+	assert snapshot_path.check() != dry_run
+
+
+@patch("id3autosort.cli.group_by_device")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_files_from(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_group, tmpdir):
+	inner = tmpdir.mkdir("inner")
+	other = tmpdir.mkdir("other")
+	listing = tmpdir.join("listing")
+	listing.write_binary(b"\0".join(path.encode("utf-8") for path in [
+		str(tmpdir.join("a.mp3")), str(inner.join("b.mp3")), "/elsewhere/c.mp3", str(other.join("d.mp3"))]))
+	mock_parse_args.return_value = parse_args(argv=["--files-from", str(listing), str(tmpdir), str(inner),
+													str(other), TEST_AUDIO])
+	mock_group.side_effect = lambda logger, paths: [(1, False, paths[:2]), (2, False, paths[2:])]
+	sorted_files = []
+	mock_sort.side_effect = lambda logger, in_dir, *args, **kwargs: sorted_files.append((in_dir, list(kwargs["files"])))
+	main()
+
+	# Nothing is walked; each device gets one stream of the files listed in any of its input paths
+	assert sorted_files == [(str(tmpdir), [str(tmpdir.join("a.mp3")), str(inner.join("b.mp3"))]),
+							(str(other), [str(other.join("d.mp3"))])]
+	mock_logger.warning.assert_called_once_with("Skipping %s, not inside any input path", "/elsewhere/c.mp3")
+
+
+@patch("id3autosort.cli.stdin")
+@patch("id3autosort.cli.MoveEngine")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_files_from_stream(mock_logger, mock_parse_args, mock_sort, mock_mover, mock_stdin, tmpdir):
+	(read_fd, write_fd) = pipe()
+	writer = fdopen(write_fd, "wb")
+	mock_stdin.buffer = fdopen(read_fd, "rb")
+	mock_parse_args.return_value = parse_args(argv=["--from-stdin", str(tmpdir), str(tmpdir)])
+	first = str(tmpdir.join("a.mp3"))
+	sorted_files = []
+
+	def _sort(logger, in_dir, *args, **kwargs):
+		files = kwargs["files"]
+		sorted_files.append(next(files))
+		assert not writer.closed
+		writer.write(b"\0" + str(tmpdir.join("b.mp3")).encode("utf-8"))
+		writer.close()
+		sorted_files.extend(files)
+
+	writer.write(first.encode("utf-8") + b"\0")
+	writer.flush()
+	mock_sort.side_effect = _sort
+
+	# Don't hang if the first file only turns up once the list is finished
+	closer = Timer(5, writer.close)
+	closer.start()
+
+	try:
+		main()
+	finally:
+		closer.cancel()
+		mock_stdin.buffer.close()
+
+	# The first file is sorted while the list is still being written
+	assert sorted_files == [first, str(tmpdir.join("b.mp3"))]
+
+
+def test_parse_args_files_from(tmpdir):
+	listing = tmpdir.join("listing")
+	listing.write_binary(b"")
+
+	assert parse_args(argv=["--from-stdin", TEST_AUDIO, str(tmpdir)]).files_from == "-"
+	assert parse_args(argv=["--files-from", str(listing), TEST_AUDIO, str(tmpdir)]).files_from == str(listing)
+	assert parse_args(argv=[TEST_AUDIO, str(tmpdir)]).files_from is None
+
+	for argv in [["--files-from", str(tmpdir.join("missing"))], ["--files-from", str(listing), "--from-stdin"],
+				 ["--from-stdin", "--watch"]]:
+		with pytest.raises(SystemExit):
+			parse_args(argv=argv + [TEST_AUDIO, str(tmpdir)])
+
+
+
+@patch("id3autosort.cli.log_estimate")
+@patch("id3autosort.cli.estimate")
+@patch("id3autosort.cli.sort")
+@patch("id3autosort.cli.parse_args")
+@patch("id3autosort.cli.logger")
+def test_main_estimate(mock_logger, mock_parse_args, mock_sort, mock_estimate, mock_log_estimate, tmpdir):
+	mock_parse_args.return_value = parse_args(argv=["--estimate", "--sample", "0.5", "-j", "3", TEST_AUDIO, str(tmpdir)])
+	main()
+
+	# Only estimated, never sorted
+	assert not mock_sort.called
+	assert sorted(mock_estimate.call_args[0][1]) == sorted(scan_files(mock_logger, [TEST_AUDIO]))
+	assert (mock_estimate.call_args[1]["fraction"], mock_estimate.call_args[1]["jobs"]) == (0.5, 3)
+	mock_log_estimate.assert_called_once_with(mock_logger, mock_estimate.return_value)
+
+
+def test_parse_args_estimate(tmpdir):
+	assert parse_args(argv=["--estimate", TEST_AUDIO, str(tmpdir)]).sample == DEFAULT_SAMPLE_FRACTION
+	assert parse_args(argv=["--estimate", "--sample", "0.25", TEST_AUDIO, str(tmpdir)]).sample == 0.25
+	assert not parse_args(argv=[TEST_AUDIO, str(tmpdir)]).estimate
+
+	for argv in [["--sample", "0"], ["--sample", "1.5"], ["--estimate", "--watch"], ["--estimate", "--undo"]]:
+		with pytest.raises(SystemExit):
+			parse_args(argv=argv + [TEST_AUDIO, str(tmpdir)])
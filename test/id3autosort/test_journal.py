@@ -0,0 +1,67 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from mock import patch
+
+from id3autosort.journal import MoveJournal
+
+
+def test_journal(tmpdir):
+	path = str(tmpdir.join("journal"))
+	journal = MoveJournal(path)
+
+	journal.plan([("/in/1.mp3", "/out/1.mp3"), ("/in/2.mp3", "/out/2.mp3"), ("/in/3.mp3", "/out/3.mp3")])
+	journal.done("/in/2.mp3", "/out/2.mp3")
+	journal.done("/in/1.mp3", "/out/1.mp3")
+	journal.close()
+
+	# An entry cut off partway through is ignored
+	with open(path, "a") as raw:
+		raw.write('["done", "/in/3.mp3"')
+
+	journal = MoveJournal(path)
+	assert journal.moves() == [("/in/2.mp3", "/out/2.mp3"), ("/in/1.mp3", "/out/1.mp3")]
+
+	journal.undone("/in/1.mp3", "/out/1.mp3")
+	journal.close()
+	assert MoveJournal(path).moves() == [("/in/2.mp3", "/out/2.mp3")]
+
+
+def test_journal_lost_completion(tmpdir):
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	moved = tmpdir.join("moved.mp3")
+	waiting = tmpdir.join("waiting.mp3")
+	moved.write("")
+	waiting.write("")
+
+	# Moves that finished without saying so are noticed from where the files are
+	journal.plan([("/in/moved.mp3", str(moved)), (str(waiting), "/out/waiting.mp3")])
+	assert journal.moves() == [("/in/moved.mp3", str(moved))]
+
+	journal.undone("/in/moved.mp3", str(moved))
+	assert journal.moves() == []
+	journal.close()
+
+
+@patch("id3autosort.journal.JOURNAL_SYNC_INTERVAL", 2)
+@patch("id3autosort.journal.fsync")
+def test_journal_sync(mock_fsync, tmpdir):
+	journal = MoveJournal(str(tmpdir.join("journal")))
+
+	journal.plan([("/in/{0}.mp3".format(i), "/out/{0}.mp3".format(i)) for i in range(3)])
+	assert mock_fsync.call_count == 1
+
+	for i in range(3):
+		journal.done("/in/{0}.mp3".format(i), "/out/{0}.mp3".format(i))
+
+	assert mock_fsync.call_count == 2
+	journal.close()
+	assert mock_fsync.call_count == 3
@@ -0,0 +1,35 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+import pickle
+
+from logging import DEBUG, INFO, WARNING
+
+from mock import call, Mock
+
+from id3autosort.logbuffer import BufferedLogger
+
+
+def test_buffered_logger():
+	mock_logger = Mock()
+	buffered = BufferedLogger()
+	buffered.info("Reading %s", "a.mp3")
+	buffered.debug("Tags: %s", {"artist": "Artist"})
+	buffered.warning("Couldn't load file %s cleanly", "a.mp3")
+
+	assert not mock_logger.log.called
+
+	# Messages cross back from worker processes pickled
+	pickle.loads(pickle.dumps(buffered)).replay(mock_logger)
+	assert mock_logger.log.call_args_list == [
+		call(INFO, "Reading %s", "a.mp3"),
+		call(DEBUG, "Tags: %s", {"artist": "Artist"}),
+		call(WARNING, "Couldn't load file %s cleanly", "a.mp3")]
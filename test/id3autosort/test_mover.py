@@ -0,0 +1,267 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from errno import EXDEV
+from os import stat, symlink, utime
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.mover import already_linked, checksum, copy_move, move_file, MoveEngine, remove_link
+
+
+DATA = b"\x00\x01" * 100000
+
+
+@pytest.fixture
+def source(tmpdir):
+	path = tmpdir.mkdir("source").join("track.mp3")
+	path.write_binary(DATA)
+	utime(str(path), (1000000000, 1000000000))
+	return path
+
+
+@pytest.mark.parametrize("kernel_copies", [
+						 ["copy_file_range", "sendfile"],
+						 ["sendfile"],
+						 []],
+						 ids=["copy_file_range", "sendfile", "userspace"])
+@pytest.mark.parametrize("verify", [True, False], ids=["verify", "no-verify"])
+def test_copy_move(tmpdir, source, kernel_copies, verify):
+	dest = tmpdir.mkdir("dest").join("track.mp3")
+
+	with patch("id3autosort.mover.os", Mock(wraps=__import__("os"), spec=["fstat"] + kernel_copies)):
+		copy_move(str(source), str(dest), verify)
+
+	assert not source.check()
+	assert dest.read_binary() == DATA
+	assert stat(str(dest)).st_mtime == 1000000000
+	assert tmpdir.join("dest").listdir() == [dest]
+
+
+def test_copy_move_mismatch(tmpdir, source):
+	dest = tmpdir.mkdir("dest").join("track.mp3")
+
+	with patch("id3autosort.mover.checksum", side_effect=[b"a", b"b"]):
+		with pytest.raises(IOError):
+			copy_move(str(source), str(dest), True)
+
+	assert source.read_binary() == DATA
+	assert tmpdir.join("dest").listdir() == []
+
+
+def test_checksum(tmpdir, source):
+	other = tmpdir.join("other.mp3")
+	other.write_binary(DATA[:-1] + b"\x02")
+
+	assert checksum(str(source)) == checksum(str(source))
+	assert checksum(str(source)) != checksum(str(other))
+
+
+def test_move_same_device(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	engine = MoveEngine(mock_logger)
+
+	with patch("id3autosort.mover.copy_move") as mock_copy_move:
+		engine.move(str(source), str(dest), mock_callback)
+		engine.finish()
+
+	assert not mock_copy_move.called
+	assert dest.join("track.mp3").read_binary() == DATA
+	mock_callback.assert_called_once_with(str(dest.join("track.mp3")))
+
+
+def test_move_cross_device(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	engine = MoveEngine(mock_logger, copy_workers=1, verify=True)
+	engine.devices[str(dest)] = -1
+
+	engine.move(str(source), str(dest), mock_callback)
+	assert not mock_callback.called
+	engine.finish()
+
+	assert dest.join("track.mp3").read_binary() == DATA
+	assert not source.check()
+	mock_callback.assert_called_once_with(str(dest.join("track.mp3")))
+	assert engine.pool is None
+
+
+def test_move_cross_mount(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	engine = MoveEngine(mock_logger)
+
+	# Renames between mount points of one device fail too, and so does putting the copy in place
+	with patch("id3autosort.mover.rename", side_effect=OSError(EXDEV, "Invalid cross-device link")):
+		engine.move(str(source), str(dest), mock_callback)
+		engine.finish()
+
+	assert source.read_binary() == DATA
+	assert dest.listdir() == []
+	assert not mock_callback.called
+	assert mock_logger.info.call_args[0][:2] == ("Could not move file %s to new location: %s", str(source))
+
+
+@patch("id3autosort.mover.COPY_QUEUE_DEPTH", 1)
+def test_move_bounded(tmpdir):
+	mock_logger = Mock()
+	dest = tmpdir.mkdir("dest")
+	sources = [tmpdir.join("track{0}.mp3".format(i)) for i in range(5)]
+	engine = MoveEngine(mock_logger, copy_workers=2)
+	engine.devices[str(dest)] = -1
+
+	for path in sources:
+		path.write_binary(DATA)
+		engine.move(str(path), str(dest))
+		assert len(engine.pending) <= 2
+
+	engine.finish()
+	assert sorted(p.basename for p in dest.listdir()) == [p.basename for p in sources]
+
+
+def test_move_existing(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	dest.join("track.mp3").write_binary(b"other")
+	engine = MoveEngine(mock_logger)
+
+	engine.move(str(source), str(dest), mock_callback)
+	engine.finish()
+
+	assert source.read_binary() == DATA
+	assert dest.join("track.mp3").read_binary() == b"other"
+	assert not mock_callback.called
+	assert mock_logger.info.call_args[0][:2] == ("Could not move file %s to new location: %s", str(source))
+
+
+@pytest.mark.parametrize("cross_device", [True, False], ids=["cross-device", "same-device"])
+def test_move_file(tmpdir, source, cross_device):
+	dest = tmpdir.mkdir("dest")
+	devices = {str(dest): -1} if cross_device else {}
+
+	with patch("id3autosort.mover.copy_move", wraps=copy_move) as mock_copy_move:
+		assert move_file(str(source), str(dest), devices=devices) == str(dest.join("track.mp3"))
+
+	assert mock_copy_move.called == cross_device
+	assert dest.join("track.mp3").read_binary() == DATA
+	assert not source.check()
+
+	with pytest.raises(OSError):
+		move_file(str(dest.join("track.mp3")), str(dest))
+
+
+@pytest.mark.parametrize("link", ["hard", "symlink"])
+def test_move_link(tmpdir, source, link):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	engine = MoveEngine(mock_logger, link=link)
+
+	engine.move(str(source), str(dest), mock_callback)
+	engine.finish()
+
+	assert source.read_binary() == DATA
+	assert dest.join("track.mp3").read_binary() == DATA
+	assert dest.join("track.mp3").islink() == (link == "symlink")
+	assert stat(str(dest.join("track.mp3"))).st_ino == stat(str(source)).st_ino
+	mock_callback.assert_called_once_with(str(dest.join("track.mp3")))
+
+	# Linking again leaves the link alone without counting it as moved
+	mock_callback.reset_mock()
+	engine.move(str(source), str(dest), mock_callback)
+	engine.finish()
+
+	assert not mock_callback.called
+	assert not mock_logger.info.called
+
+
+def test_move_link_unsupported(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	second = tmpdir.join("second.mp3")
+	second.write_binary(DATA)
+	engine = MoveEngine(mock_logger, link="reflink")
+
+	with patch("id3autosort.mover.ioctl", side_effect=OSError(EXDEV, "Invalid cross-device link")) as mock_ioctl:
+		engine.move(str(source), str(dest), mock_callback)
+		engine.move(str(second), str(dest), mock_callback)
+		engine.finish()
+
+	# Copied instead, trying to link only once and leaving the originals
+	assert mock_ioctl.call_count == 1
+	assert mock_logger.info.call_count == 1
+	assert dest.join("track.mp3").read_binary() == DATA
+	assert dest.join("second.mp3").read_binary() == DATA
+	assert not dest.join("track.mp3").islink()
+	assert stat(str(dest.join("track.mp3"))).st_mtime_ns == stat(str(source)).st_mtime_ns
+	assert source.read_binary() == DATA
+	assert second.read_binary() == DATA
+	assert mock_callback.call_count == 2
+
+
+def test_move_link_existing(tmpdir, source):
+	mock_logger = Mock()
+	mock_callback = Mock()
+	dest = tmpdir.mkdir("dest")
+	dest.join("track.mp3").write_binary(b"other")
+	engine = MoveEngine(mock_logger, link="hard")
+
+	engine.move(str(source), str(dest), mock_callback)
+	engine.finish()
+
+	assert dest.join("track.mp3").read_binary() == b"other"
+	assert not mock_callback.called
+	assert mock_logger.info.call_args[0][:2] == ("Could not move file %s to new location: %s", str(source))
+
+
+def test_remove_link(tmpdir, source):
+	link = tmpdir.join("link.mp3")
+	symlink(str(source), str(link))
+	assert already_linked(str(source), str(link))
+
+	remove_link(str(source), str(link))
+	assert not link.check(link=True)
+	assert source.read_binary() == DATA
+
+	# Anything that isn't the same file or a copy of it is kept
+	link.write_binary(DATA[:-1] + b"\xff")
+	utime(str(link), (1000000000, 1000000000))
+	assert already_linked(str(source), str(link))
+
+	with pytest.raises(IOError):
+		remove_link(str(source), str(link))
+
+	assert link.check()
+
+
+def test_add_view(tmpdir, source):
+	mock_logger = Mock()
+	view = tmpdir.mkdir("view")
+	engine = MoveEngine(mock_logger, view_link="hard")
+
+	assert engine.add_view(str(source), str(view))
+	assert view.join("track.mp3").samefile(source)
+	assert not engine.add_view(str(source), str(view))
+
+	# Views are never copied into
+	with patch("id3autosort.mover.os.link", side_effect=OSError(EXDEV, "Invalid cross-device link")):
+		assert not engine.add_view(str(source), str(tmpdir.mkdir("other")))
+
+	assert tmpdir.join("other").listdir() == []
+	assert mock_logger.info.call_args[0][0] == "Could not link file %s into view %s: %s"
@@ -0,0 +1,96 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+import os
+
+from os.path import abspath, dirname, join
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.pagecache import advise, drop_pages, tag_read_hints, TAG_REGION_SIZE
+
+
+TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
+
+
+def test_advise():
+	with patch("id3autosort.pagecache.os") as mock_os:
+		advise(3, 0, 10, "POSIX_FADV_WILLNEED")
+		mock_os.posix_fadvise.assert_called_once_with(3, 0, 10, mock_os.POSIX_FADV_WILLNEED)
+
+		mock_os.posix_fadvise.side_effect = OSError("Not supported")
+		advise(3, 0, 10, "POSIX_FADV_WILLNEED")
+
+	with patch("id3autosort.pagecache.os", Mock(spec=[])):
+		advise(3, 0, 10, "POSIX_FADV_WILLNEED")
+
+
+@pytest.mark.parametrize("drop_cache", [True, False], ids=["drop", "keep"])
+def test_tag_read_hints(drop_cache):
+	path = join(TEST_AUDIO, "test_mp3.mp3")
+
+	with patch("id3autosort.pagecache.advise") as mock_advise:
+		with tag_read_hints(path, drop_cache):
+			(fd, offset, length, advice) = mock_advise.call_args[0]
+			assert (offset, length, advice) == (0, TAG_REGION_SIZE, "POSIX_FADV_WILLNEED")
+			assert os.fstat(fd).st_ino == os.stat(path).st_ino
+
+		assert mock_advise.call_count == (2 if drop_cache else 1)
+
+		if drop_cache:
+			assert mock_advise.call_args[0][1:] == (0, 0, "POSIX_FADV_DONTNEED")
+
+	with pytest.raises(OSError):
+		os.fstat(fd)
+
+
+def test_tag_read_hints_missing(tmpdir):
+	with patch("id3autosort.pagecache.advise") as mock_advise:
+		with pytest.raises(IOError):
+			with tag_read_hints(str(tmpdir.join("missing.mp3"))):
+				open(str(tmpdir.join("missing.mp3")), "rb")
+
+	assert not mock_advise.called
+
+
+def test_drop_pages(tmpdir):
+	path = join(TEST_AUDIO, "test_mp3.mp3")
+
+	with patch("id3autosort.pagecache.advise") as mock_advise:
+		drop_pages(path)
+		(fd, offset, length, advice) = mock_advise.call_args[0]
+		assert (offset, length, advice) == (0, 0, "POSIX_FADV_DONTNEED")
+
+		with pytest.raises(OSError):
+			os.fstat(fd)
+
+		mock_advise.reset_mock()
+		drop_pages(str(tmpdir.join("missing.mp3")))
+		assert not mock_advise.called
+
+
+@pytest.mark.parametrize("written", [True, False], ids=["written", "read"])
+def test_drop_pages_flush(written):
+	path = join(TEST_AUDIO, "test_mp3.mp3")
+
+	with patch("id3autosort.pagecache.advise") as mock_advise, \
+		 patch("id3autosort.pagecache.os.fdatasync", create=True) as mock_sync, \
+		 patch("id3autosort.pagecache.os.posix_fadvise", create=True):
+		drop_pages(path, written)
+
+	assert mock_sync.called is written
+	assert mock_advise.called
+
+	with patch("id3autosort.pagecache.advise") as mock_advise, \
+		 patch("id3autosort.pagecache.os.fdatasync", create=True, side_effect=OSError("Not supported")):
+		drop_pages(path, True)
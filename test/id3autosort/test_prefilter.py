@@ -0,0 +1,75 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from os import listdir
+from os.path import abspath, dirname, join
+
+import pytest
+
+from mock import Mock
+
+from id3autosort.prefilter import PreFilter, sniff_audio
+
+
+TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
+APIC_TOOL_DATA = abspath(join(dirname(dirname(__file__)), "apic_tool", "data"))
+
+FakeStat = namedtuple("FakeStat", ["st_size"])
+
+
+@pytest.mark.parametrize("name", sorted(listdir(TEST_AUDIO)))
+def test_sniff_audio(name):
+	with open(join(TEST_AUDIO, name), "rb") as music:
+		assert sniff_audio(music.read(16))
+
+
+@pytest.mark.parametrize("header", [b"", b"\x89PNG\r\n\x1a\n", b"BM", b"REM GENRE Rock", b"\xff\xd8\xff\xe0"],
+						 ids=["empty", "png", "bmp", "cue", "jpeg"])
+def test_sniff_not_audio(header):
+	assert not sniff_audio(header)
+
+
+def test_accepts_name():
+	mock_logger = Mock()
+	default = PreFilter()
+	custom = PreFilter(extensions=["flac"])
+	anything = PreFilter(extensions=None)
+
+	assert default.accepts_name(mock_logger, "/music/Track.MP3")
+	assert not default.accepts_name(mock_logger, "/music/cover.jpg")
+	assert not default.accepts_name(mock_logger, "/music.d/README")
+	mock_logger.debug.assert_called_with("Skipping %s, extension is not allowed", "/music.d/README")
+
+	assert custom.accepts_name(mock_logger, "/music/track.flac")
+	assert not custom.accepts_name(mock_logger, "/music/track.mp3")
+	assert anything.accepts_name(mock_logger, "/music/cover.jpg")
+
+
+def test_accepts_stat():
+	mock_logger = Mock()
+
+	assert not PreFilter().needs_stat
+	assert PreFilter(max_size=10).needs_stat
+	assert PreFilter().accepts_stat(mock_logger, "/music/track.mp3", FakeStat(2 ** 40))
+	assert PreFilter(max_size=10).accepts_stat(mock_logger, "/music/track.mp3", FakeStat(10))
+	assert not PreFilter(max_size=10).accepts_stat(mock_logger, "/music/track.mp3", FakeStat(11))
+
+
+def test_accepts_content(tmpdir):
+	mock_logger = Mock()
+	mislabeled = join(APIC_TOOL_DATA, "test_cover.png")
+
+	assert PreFilter().accepts_content(mock_logger, mislabeled)
+	assert not PreFilter(sniff=True).accepts_content(mock_logger, mislabeled)
+	assert PreFilter(sniff=True).accepts_content(mock_logger, join(TEST_AUDIO, "test_ogg.ogg"))
+	assert PreFilter(sniff=True).accepts_content(mock_logger, str(tmpdir.join("noexist.mp3")))
+	mock_logger.debug.assert_called_once_with("Skipping %s, contents don't look like audio", mislabeled)
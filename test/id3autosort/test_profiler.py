@@ -0,0 +1,52 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from pstats import Stats
+from threading import Thread
+
+from id3autosort.profiler import profiling, RunProfiler
+
+
+def _busy():
+	return sum(range(1000))
+
+
+def test_profiling(tmpdir):
+	profiler = RunProfiler()
+	profile_path = str(tmpdir.join("run.pstats"))
+
+	with profiling(profiler):
+		# Blocks inside an already profiled one don't start another profile
+		with profiling(profiler):
+			_busy()
+
+		# Other threads get their own
+		worker = Thread(target=_profiled_busy, args=(profiler,))
+		worker.start()
+		worker.join()
+
+	assert len(profiler.profiles) == 2
+
+	profiler.dump(profile_path)
+	assert any(name == "_busy" for (_, _, name) in Stats(profile_path).stats)
+
+
+def _profiled_busy(profiler):
+	with profiling(profiler):
+		_busy()
+
+
+def test_profiling_disabled(tmpdir):
+	with profiling(None):
+		_busy()
+
+	RunProfiler().dump(str(tmpdir.join("run.pstats")))
+	assert not tmpdir.join("run.pstats").check()
@@ -0,0 +1,47 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from os import stat, utime
+
+from id3autosort.quarantine import Quarantine
+
+
+def test_quarantine(tmpdir):
+	path = str(tmpdir.join("quarantine"))
+	music = tmpdir.join("slow.mp3")
+	music.write("")
+	quarantine = Quarantine(path)
+
+	assert not quarantine.holds(str(music), stat(str(music)))
+	quarantine.add(str(music), "timed out")
+	assert quarantine.holds(str(music), stat(str(music)))
+	quarantine.close()
+
+	# An entry cut off partway through is ignored
+	with open(path, "a") as raw:
+		raw.write('["/in/other.mp3", 1')
+
+	quarantine = Quarantine(path)
+	assert quarantine.holds(str(music), stat(str(music)))
+
+	# Modifying a file lets it be tried again
+	music_stat = stat(str(music))
+	utime(str(music), ns=(music_stat.st_atime_ns, music_stat.st_mtime_ns + 1000000000))
+	assert not quarantine.holds(str(music), stat(str(music)))
+	quarantine.close()
+
+
+def test_quarantine_missing(tmpdir):
+	quarantine = Quarantine(str(tmpdir.join("quarantine")))
+
+	quarantine.add(str(tmpdir.join("gone.mp3")), "crashed")
+	assert quarantine.held == {}
+	quarantine.close()
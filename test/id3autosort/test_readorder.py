@@ -0,0 +1,67 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+from os.path import abspath, dirname, join
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.readorder import (
+	EXTENT_ORDER,
+	INODE_ORDER,
+	order_reads,
+	physical_offset,
+	read_order_key,
+	)
+
+
+TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
+
+FakeStat = namedtuple("FakeStat", ["st_ino"])
+
+
+def test_physical_offset(tmpdir):
+	offset = physical_offset(join(TEST_AUDIO, "test_mp3.mp3"))
+	assert offset is None or offset >= 0
+
+	assert physical_offset(str(tmpdir.join("missing"))) is None
+
+	with patch("id3autosort.readorder.ioctl", None):
+		assert physical_offset(join(TEST_AUDIO, "test_mp3.mp3")) is None
+
+
+@patch("id3autosort.readorder.physical_offset")
+def test_read_order_key(mock_offset, tmpdir):
+	mock_offset.side_effect = lambda path: 42 if path.endswith(".mp3") else None
+
+	assert read_order_key(EXTENT_ORDER, "/music/a.mp3") == (0, 42)
+	assert read_order_key(EXTENT_ORDER, "/music/a.ogg", FakeStat(7)) == (1, 7)
+	assert read_order_key(INODE_ORDER, "/music/a.mp3", FakeStat(7)) == (1, 7)
+	assert read_order_key(INODE_ORDER, str(tmpdir)) == (1, tmpdir.stat().ino)
+	assert read_order_key(INODE_ORDER, str(tmpdir.join("missing"))) == (2, 0)
+
+
+@pytest.mark.parametrize("window, expected", [
+						 [10, ["cached", "a", "b", "c", "d", "e"]],
+						 [2, ["d", "e", "cached", "b", "c", "a"]]],
+						 ids=["one-window", "small-window"])
+def test_order_reads(window, expected):
+	mock_logger = Mock()
+	inodes = {"a": 1, "b": 2, "c": 3, "d": 4, "e": 5}
+	lookups = [("e", None, None), ("d", None, None), ("cached", None, {"artist": "X"}),
+			   ("c", None, None), ("b", None, None), ("a", None, None)]
+
+	with patch("id3autosort.readorder.read_order_key", side_effect=lambda order, path, file_stat: inodes[path]):
+		ordered = [path for (path, _, _) in order_reads(mock_logger, lookups, INODE_ORDER, window)]
+
+	assert ordered == expected
@@ -0,0 +1,85 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+import os
+
+from os import stat, symlink
+from sys import platform
+from threading import Barrier, current_thread
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.scheduler import group_by_device, is_rotational, run_per_device
+
+
+@pytest.fixture
+def sys_block(tmpdir):
+	disk = tmpdir.mkdir("devices").mkdir("sda")
+	disk.mkdir("queue").join("rotational").write("1\n")
+	disk.mkdir("sda1")
+	nvme = tmpdir.join("devices").mkdir("nvme0n1")
+	nvme.mkdir("queue").join("rotational").write("0\n")
+
+	links = tmpdir.mkdir("block")
+	symlink(str(disk), str(links.join("8:0")))
+	symlink(str(disk.join("sda1")), str(links.join("8:1")))
+	symlink(str(nvme), str(links.join("259:0")))
+
+	with patch("id3autosort.scheduler.SYS_BLOCK_DEVICES", str(links)):
+		yield
+
+
+@pytest.mark.skipif(platform == "win32", reason="No device numbers or /sys on Windows")
+@pytest.mark.parametrize("device, rotational", [
+						 [(8, 0), True],
+						 [(8, 1), True],
+						 [(259, 0), False],
+						 [(0, 42), None]],
+						 ids=["disk", "partition", "solid-state", "unknown"])
+def test_is_rotational(sys_block, device, rotational):
+	assert is_rotational(os.makedev(*device)) == rotational
+
+	# Without a way to split up device numbers, nothing is known about any disk
+	with patch("id3autosort.scheduler.major", None):
+		assert is_rotational(os.makedev(*device)) is None
+
+
+@pytest.mark.skipif(platform == "win32", reason="No /proc on Windows")
+
+@patch("id3autosort.scheduler.is_rotational")
+def test_group_by_device(mock_rotational, tmpdir):
+	mock_logger = Mock()
+	mock_rotational.side_effect = lambda device: device == stat(str(tmpdir)).st_dev
+	paths = [str(tmpdir.mkdir("one")), "/proc", str(tmpdir.mkdir("two")), str(tmpdir.join("missing"))]
+
+	assert group_by_device(mock_logger, paths) == [
+		(stat(str(tmpdir)).st_dev, True, [paths[0], paths[2]]),
+		(stat("/proc").st_dev, False, [paths[1]]),
+		(None, None, [paths[3]])]
+	assert mock_logger.debug.call_count == 1
+
+
+def test_run_per_device():
+	groups = [(1, True, ["/a", "/b"]), (2, False, ["/c"]), (3, None, ["/d"])]
+	barrier = Barrier(len(groups), timeout=5)
+
+	# Every device has to be worked on at once for all of them to get past the barrier
+	def _work(rotational, paths):
+		barrier.wait()
+		return (rotational, paths)
+
+	assert run_per_device(groups, _work) == [(True, ["/a", "/b"]), (False, ["/c"]), (None, ["/d"])]
+	assert run_per_device(groups[:1], lambda rotational, paths: current_thread().name) == [current_thread().name]
+
+	with pytest.raises(RuntimeError):
+		run_per_device(groups, Mock(side_effect=RuntimeError("Broken")))
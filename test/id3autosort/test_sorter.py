@@ -9,25 +9,57 @@
 
 from __future__ import unicode_literals
 
-from errno import EACCES
-from os import sep
+import pickle
+
+from collections import OrderedDict
+from errno import EACCES, EEXIST
+from os import sep, stat
 from os.path import abspath, dirname, join
+from shutil import copy
+from time import sleep
+from types import GeneratorType
 
 import pytest
 
 from mock import Mock, patch
 from mutagen import File
 
+from id3autosort.cache import MetadataCache
+from id3autosort.journal import MoveJournal
+from id3autosort.mover import HARD_LINK, MoveEngine
+from id3autosort.pagecache import tag_read_hints
+from id3autosort.prefilter import PreFilter
+from id3autosort.quarantine import Quarantine
+from id3autosort.readorder import order_reads
 from id3autosort.sorter import (
+	_read_lookup_job,
+	FileStat,
 	get_music_files,
 	get_new_path,
+	move_files,
+	normalize_value,
 	normalize_tags,
-	sort
+	read_tags,
+	sort,
+	Structure,
+	undo
 	)
+from id3autosort.stats import RunStats
 
 
 TEST_AUDIO = abspath(join(dirname(__file__), "audio"))
 
+# File reading tags from hangs in _hanging_read_job()
+HUNG_AUDIO = join(TEST_AUDIO, "test_mp3.mp3")
+
+
+def _hanging_read_job(lookup, *args, **kwargs):
+	# Module level so worker processes import it however they're started, not just when forked
+	if lookup[0] == HUNG_AUDIO:
+		sleep(60)
+
+	return _read_lookup_job(lookup, *args, **kwargs)
+
 
 @pytest.mark.parametrize("audio_path", [
 	join(TEST_AUDIO, "test_aac.m4a"),
@@ -96,49 +128,469 @@ def test_get_music_files(mock_file):
 
 	mock_file.side_effect = _middle
 
-	result = get_music_files(mock_logger, TEST_AUDIO)
-	assert len(result) == 5
+	result = get_music_files(mock_logger, TEST_AUDIO, True)
+	assert isinstance(result, GeneratorType)
+
+	result = list(result)
+	assert len(result) == 6
+	assert all(isinstance(tags, dict) for (path, tags) in result)
 
 
-@patch("id3autosort.sorter.normalize_tags")
-def test_get_new_path(mock_normalize, tmpdir):
+@patch("id3autosort.sorter.JOB_CHUNK_SIZE", 1)
+def test_get_music_files_parallel():
 	mock_logger = Mock()
-	tags = {"artist": "Track Artist", "album": "Track Album", "date": "1017"}
-	valid_structure = sep.join(["{artist}", "{album} ({date})"])
-	invalid_structure = sep.join(["{genre}", "{artist}", "{album}"])
 
-	mock_normalize.return_value = tags
+	serial = list(get_music_files(mock_logger, TEST_AUDIO, True))
+	serial_logs = mock_logger.method_calls
+	mock_logger.reset_mock()
+
+	parallel = list(get_music_files(mock_logger, TEST_AUDIO, True, jobs=2))
+
+	assert parallel == serial
+	assert [c[0][1:] for c in mock_logger.log.call_args_list] == [c[1] for c in serial_logs]
+
+
+def test_get_music_files_cached(tmpdir):
+	mock_logger = Mock()
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	fields = ["artist", "album"]
+
+	first = list(get_music_files(mock_logger, TEST_AUDIO, True, fields=fields, cache=cache))
+
+	with patch("id3autosort.sorter.read_tags") as mock_read_tags:
+		assert list(get_music_files(mock_logger, TEST_AUDIO, True, fields=fields, cache=cache)) == first
+		assert list(get_music_files(mock_logger, TEST_AUDIO, True, jobs=2, fields=fields, cache=cache)) == first
+		assert not mock_read_tags.called
+
+	mock_logger.debug.assert_any_call("Using cached tags for %s", join(TEST_AUDIO, "test_mp3.mp3"))
+	cache.close()
+
+
+def test_get_music_files_interned():
+	parallel = list(get_music_files(Mock(), TEST_AUDIO, True, jobs=2, fields=["artist", "album"]))
+
+	# Files read in other processes share their tags' strings all the same
+	albums = set(id(tags["album"]) for (_, tags) in parallel)
+	assert len(parallel) > 1
+	assert len(albums) == len(set(tags["album"] for (_, tags) in parallel))
+
+
+def test_file_stat(tmpdir):
+	path = tmpdir.join("track.mp3")
+	path.write_binary(b"ID3")
+	file_stat = stat(str(path))
+	compact = FileStat(file_stat)
+
+	assert (compact.st_dev, compact.st_ino, compact.st_size, compact.st_mtime_ns) == (
+		file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+	assert not hasattr(compact, "__dict__")
+	assert pickle.loads(pickle.dumps(compact)).st_ino == file_stat.st_ino
+
+
+def test_get_music_files_prefilter(tmpdir):
+	mock_logger = Mock()
+	big = tmpdir.join("big.mp3")
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(tmpdir.join("small.mp3")))
+	copy(join(TEST_AUDIO, "test_ogg.ogg"), str(tmpdir.join("renamed.flac")))
+	big.write_binary(b"ID3" + b"\x00" * 1024 * 1024)
+	tmpdir.join("cover.jpg").write_binary(b"\xff\xd8\xff\xe0")
+	prefilter = PreFilter(sniff=True, max_size=1024 * 1024)
+
+	with patch("id3autosort.sorter.read_tags") as mock_read_tags:
+		mock_read_tags.return_value = {}
+		result = list(get_music_files(mock_logger, str(tmpdir), True, prefilter=prefilter))
+
+	assert sorted(path for (path, tags) in result) == sorted([str(tmpdir.join("small.mp3")),
+															  str(tmpdir.join("renamed.flac"))])
+	assert mock_read_tags.call_count == 2
+
+
+def test_read_tags(tmpdir):
+	mock_logger = Mock()
+	not_music = tmpdir.join("cover.jpg")
+	not_music.write("not really a jpeg")
+
+	assert read_tags(mock_logger, join(TEST_AUDIO, "test_mp3.mp3"), True)["title"] == "Test MP3"
+	assert read_tags(mock_logger, str(not_music), True) is None
+	assert read_tags(mock_logger, str(tmpdir.join("noexist.mp3")), True) is None
+	mock_logger.debug.assert_any_call("File %s has no music metadata", str(not_music))
+
+
+def test_read_tags_fields():
+	mock_logger = Mock()
+	mp3_path = join(TEST_AUDIO, "test_mp3.mp3")
+	aiff_path = join(TEST_AUDIO, "test_aiff.aiff")
+
+	assert read_tags(mock_logger, mp3_path, True, ["artist", "album"]) == {"artist": "TestMP3",
+																		   "album": "_id3autosort_testing_"}
+	mock_logger.debug.assert_any_call("Read tags from %s without a full parse", mp3_path)
+
+	assert read_tags(mock_logger, aiff_path, True, ["artist"])["artist"] == "TestAIFF"
+	mock_logger.debug.assert_any_call("Attempting to parse %s", aiff_path)
+
+
+def test_structure():
+	structure = Structure(sep.join(["{artist}", "{album} ({date})"]))
+
+	assert structure.fields == frozenset(["artist", "album", "date"])
+	assert structure.format({"artist": "A", "album": "B", "date": "1", "genre": "G"}) == sep.join(["A", "B (1)"])
+	assert str(structure) == structure.template
+	assert Structure("static").fields == frozenset()
+	assert Structure("static").format({}) == "static"
+
+	with pytest.raises(KeyError):
+		structure.format({"artist": "A"})
+
+
+@pytest.mark.parametrize("value, windows_safe, expected", [
+	("AC/DC", False, "AC_DC"),
+	("Sigur R\u00f3s", True, "Sigur Ros"),
+	("What?", True, "What"),
+	("Mr.", True, "Mr"),
+	("\u30a2", True, ""),
+	], ids=["path-chars", "ascii", "unsafe-chars", "trailing-period", "no-ascii"])
+def test_normalize_value(value, windows_safe, expected):
+	normalize_value.cache_clear()
+
+	assert normalize_value(value, windows_safe) == expected
+	assert normalize_value(value, windows_safe) == expected
+	assert normalize_value.cache_info().hits == 1
+
+
+def test_normalize_tags_fields():
+	mock_logger = Mock()
+	data = File(join(TEST_AUDIO, "test_aac.m4a"), easy=True)
+
+	assert normalize_tags(mock_logger, data, True, ["artist", "album"]) == {"artist": "TestAAC",
+																			"album": "_id3autosort_testing_"}
+
+
+def test_get_new_path(tmpdir):
+	mock_logger = Mock()
+	tags = {"artist": "Track Artist", "album": "Track Album", "date": "1017"}
+	valid_structure = Structure(sep.join(["{artist}", "{album} ({date})"]))
+	invalid_structure = Structure(sep.join(["{genre}", "{artist}", "{album}"]))
 
 	assert join(str(tmpdir),
 				"Track Artist",
 				"Track Album (1017)") == get_new_path(mock_logger,
 													  str(tmpdir),
 													  valid_structure,
-													  None,
-													  True)
-	assert None == get_new_path(mock_logger, str(tmpdir), invalid_structure, None, True)
+													  tags)
+	assert None == get_new_path(mock_logger, str(tmpdir), invalid_structure, tags)
 
 
 @patch("id3autosort.sorter.isdir")
 @patch("id3autosort.sorter.makedirs")
-@patch("id3autosort.sorter.move")
-def test_sort(mock_move, mock_makedirs, mock_isdir, tmpdir):
+@patch("id3autosort.sorter.MoveEngine")
+def test_sort(mock_engine, mock_makedirs, mock_isdir, tmpdir):
 	mock_logger = Mock()
+	mock_mover = Mock()
 
 	def _makedirs_middle(path, permissions):
 		if path.contains("AIFF"):
 			raise OSError(EACCES, "Permission Denied")
 
-	def _move_middle(from_path, to_path):
-		if from_path.contains(".mp3"):
-			raise OSError(EACCES, "Permission Denied")
-
 	mock_isdir.side_effect = lambda path: False if path.find("AIFF") != -1 else True
 	mock_makedirs.side_effect = _makedirs_middle
-	mock_move.side_effect = _move_middle
 
-	sort(mock_logger, TEST_AUDIO, "/tmp", "{artist}/{album} ({date})", True, False)
-	sort(mock_logger, str(tmpdir), "/tmp", "{artist}/{album} ({date})", True, False)
+	sort(mock_logger, TEST_AUDIO, "/tmp", Structure("{artist}/{album} ({date})"), True, False)
+	sort(mock_logger, str(tmpdir), "/tmp", Structure("{artist}/{album} ({date})"), True, False)
 
+	mock_logger.info.assert_called_with("No music files in %s", str(tmpdir))
 	assert mock_makedirs.call_count == 3
-	assert mock_move.call_count == 2
+	assert mock_engine.return_value.move.call_count == 2
+	assert mock_engine.return_value.finish.call_count == 2
+
+	# Engines handed in are left for the caller to finish
+	sort(mock_logger, TEST_AUDIO, "/tmp", Structure("{artist}"), True, False, mover=mock_mover)
+	assert mock_mover.move.called
+	assert not mock_mover.finish.called
+
+
+@patch("id3autosort.sorter.isdir")
+@patch("id3autosort.sorter.makedirs")
+def test_move_files(mock_makedirs, mock_isdir):
+	mock_logger = Mock()
+	mock_engine = Mock()
+	ready_dirs = set(["/out/ready"])
+
+	def _makedirs(path, permissions):
+		if path != "/out/new":
+			raise OSError(EEXIST if path == "/out/existing" or path == "/out/blocked" else EACCES, "Error")
+
+	mock_makedirs.side_effect = _makedirs
+	mock_isdir.side_effect = lambda path: path == "/out/existing"
+
+	batch = OrderedDict([
+		("/out/ready", ["/in/1.mp3"]),
+		("/out/new", ["/in/2.mp3", "/in/3.mp3"]),
+		("/out/existing", ["/in/4.mp3"]),
+		("/out/blocked", ["/in/5.mp3"]),
+		("/out/denied", ["/in/6.mp3", "/in/7.mp3"]),
+		])
+
+	with patch("id3autosort.sorter.stat"):
+		move_files(mock_logger, batch, ready_dirs, mock_engine)
+
+	assert [c[0][0] for c in mock_makedirs.call_args_list] == ["/out/new", "/out/existing", "/out/blocked", "/out/denied"]
+	assert [c[0][0] for c in mock_isdir.call_args_list] == ["/out/existing", "/out/blocked", "/out/denied"]
+	assert ready_dirs == set(["/out/ready", "/out/new", "/out/existing"])
+	assert [c[0][:2] for c in mock_engine.move.call_args_list] == [
+		("/in/1.mp3", "/out/ready"), ("/in/2.mp3", "/out/new"), ("/in/3.mp3", "/out/new"), ("/in/4.mp3", "/out/existing")]
+	assert mock_logger.info.call_count == 2
+
+	# Directories are only made once, however many batches use them
+	mock_makedirs.reset_mock()
+	move_files(mock_logger, OrderedDict([("/out/new", ["/in/8.mp3"])]), ready_dirs, mock_engine)
+	assert not mock_makedirs.called
+
+
+@patch("id3autosort.sorter.MOVE_BATCH_SIZE", 2)
+@patch("id3autosort.sorter.move_files")
+@patch("id3autosort.sorter.MoveEngine")
+def test_sort_batches(mock_engine, mock_move_files):
+	batches = []
+	mock_move_files.side_effect = lambda logger, batch, ready_dirs, engine, cache, journal, stats, views, placed: batches.append(dict(batch))
+
+	sort(Mock(), TEST_AUDIO, "/tmp", Structure("{artist}"), True, False)
+
+	assert [sum(len(files) for files in batch.values()) for batch in batches] == [2, 2, 2, 1]
+	assert len(set(id(c[0][2]) for c in mock_move_files.call_args_list)) == 1
+
+
+@pytest.mark.parametrize("read_order", ["inode", "extent"])
+def test_get_music_files_read_order(read_order):
+	mock_logger = Mock()
+	walked = sorted(get_music_files(mock_logger, TEST_AUDIO, True))
+
+	with patch("id3autosort.sorter.order_reads", wraps=order_reads) as mock_order_reads:
+		assert sorted(get_music_files(mock_logger, TEST_AUDIO, True, read_order=read_order)) == walked
+		assert mock_order_reads.call_args[0][2] == read_order
+
+
+@pytest.mark.parametrize("jobs", [1, 2], ids=["serial", "parallel"])
+@pytest.mark.parametrize("drop_cache", [True, False], ids=["drop", "keep"])
+def test_get_music_files_drop_cache(jobs, drop_cache):
+	expected = sorted(get_music_files(Mock(), TEST_AUDIO, True))
+
+	with patch("id3autosort.sorter.tag_read_hints", wraps=tag_read_hints) as mock_hints:
+		assert sorted(get_music_files(Mock(), TEST_AUDIO, True, jobs=jobs, drop_cache=drop_cache)) == expected
+
+	# Worker processes have their own copy of the module
+	if jobs == 1:
+		assert set(c[0][1] for c in mock_hints.call_args_list) == set([drop_cache])
+
+
+def test_sort_cache_follows_moves(tmpdir):
+	mock_logger = Mock()
+	source = tmpdir.mkdir("source")
+	dest = tmpdir.mkdir("dest")
+	cache = MetadataCache(str(tmpdir.join("cache.db")))
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+
+	sort(mock_logger, str(source), str(dest), Structure("{artist}"), True, False, cache=cache)
+	moved = dest.join("TestMP3", "test_mp3.mp3")
+	assert moved.check()
+
+	with patch("id3autosort.sorter.read_tags") as mock_read_tags:
+		assert list(get_music_files(mock_logger, str(dest), True, fields=["artist"], cache=cache)) == [
+			(str(moved), {"artist": "TestMP3"})]
+		assert not mock_read_tags.called
+
+	cache.close()
+
+
+def test_sort_journal(tmpdir):
+	mock_logger = Mock()
+	library = tmpdir.mkdir("library")
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(library))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(library))
+
+	sort(mock_logger, str(library), str(library), Structure("{artist}"), True, False, journal=journal)
+	moves = journal.moves()
+	assert sorted(moves) == sorted([
+		(str(library.join("test_flac.flac")), str(library.join("TestFLAC", "test_flac.flac"))),
+		(str(library.join("test_mp3.mp3")), str(library.join("TestMP3", "test_mp3.mp3")))])
+
+	# Sorting in place again finds the moved files, but a resumed sort doesn't read them
+	with patch("id3autosort.sorter.read_tags") as mock_read_tags:
+		sort(mock_logger, str(library), str(library), Structure("{artist}"), True, False,
+			 journal=journal, resume=True)
+		assert not mock_read_tags.called
+
+	undo(mock_logger, journal, [str(tmpdir.join("elsewhere"))], str(library), False)
+	mock_logger.info.assert_called_with("No moves from %s to undo", str(tmpdir.join("elsewhere")))
+	assert journal.moves() == moves
+
+	undo(mock_logger, journal, [str(library)], str(library), False)
+	assert library.join("test_mp3.mp3").check()
+	assert library.join("test_flac.flac").check()
+	assert journal.moves() == []
+	journal.close()
+
+
+@pytest.mark.parametrize("link", ["hard", "symlink"])
+def test_sort_link(tmpdir, link):
+	mock_logger = Mock()
+	source = tmpdir.mkdir("source")
+	library = tmpdir.mkdir("library")
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	mover = MoveEngine(mock_logger, link=link)
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+
+	sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, mover=mover, journal=journal)
+	mover.finish()
+	assert source.join("test_mp3.mp3").check()
+	assert library.join("TestMP3", "test_mp3.mp3").samefile(source.join("test_mp3.mp3"))
+
+	# Linking the same files again doesn't fail on the links already there
+	mock_logger.reset_mock()
+	sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, mover=mover, journal=journal)
+	mover.finish()
+	assert not mock_logger.info.called
+
+	# Undoing removes the links and leaves the originals
+	undo(mock_logger, journal, [str(source)], str(library), False)
+	assert source.join("test_mp3.mp3").check()
+	assert not library.join("TestMP3", "test_mp3.mp3").check(link=True)
+	assert journal.moves() == []
+	journal.close()
+
+
+@pytest.mark.parametrize("walk_threads", [1, 4], ids=["serial-walk", "threaded-walk"])
+def test_sort_inside_source(walk_threads, tmpdir):
+	mock_logger = Mock()
+	source = tmpdir.mkdir("source")
+	library = source.mkdir("library")
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(source))
+	views = [Structure(join("ALBUMS", "{album}"))]
+
+	# Files moved into the library aren't read again when the walk reaches them
+	with patch("id3autosort.sorter.read_tags", wraps=read_tags) as mock_read_tags:
+		sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, walk_threads=walk_threads,
+			 views=views)
+		assert mock_read_tags.call_count == 2
+
+	assert library.join("TestMP3", "test_mp3.mp3").check()
+	assert not mock_logger.info.called
+
+	# Nor are files already where they belong moved onto themselves
+	sort(mock_logger, str(library.join("TestMP3")), str(library), Structure("{artist}"), True, False)
+	assert library.join("TestMP3", "test_mp3.mp3").check()
+	assert not mock_logger.info.called
+
+
+def test_sort_link_resume(tmpdir):
+	mock_logger = Mock()
+	source = tmpdir.mkdir("source")
+	library = tmpdir.mkdir("library")
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	mover = MoveEngine(mock_logger, link=HARD_LINK)
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(source))
+
+	sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, mover=mover, journal=journal)
+	mover.finish()
+	copy(join(TEST_AUDIO, "test_ogg.ogg"), str(source))
+
+	# Files linked before aren't read again, only the one that arrived since
+	with patch("id3autosort.sorter.read_tags", wraps=read_tags) as mock_read_tags:
+		sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, mover=mover,
+			 journal=journal, resume=True)
+		mover.finish()
+		assert [c[0][1] for c in mock_read_tags.call_args_list] == [str(source.join("test_ogg.ogg"))]
+
+	assert library.join("TestOGG", "test_ogg.ogg").samefile(source.join("test_ogg.ogg"))
+	journal.close()
+
+
+def test_sort_views(tmpdir):
+	mock_logger = Mock()
+	source = tmpdir.mkdir("source")
+	library = tmpdir.mkdir("library")
+	journal = MoveJournal(str(tmpdir.join("journal")))
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(source))
+	views = [Structure(join("ALBUMS", "{album}")), Structure(join("MISSING", "{nosuchtag}"))]
+
+	with patch("id3autosort.sorter.read_tags", wraps=read_tags) as mock_read_tags:
+		sort(mock_logger, str(source), str(library), Structure("{artist}"), True, False, journal=journal, views=views)
+		assert mock_read_tags.call_count == 2
+		assert set(mock_read_tags.call_args[0][3]) == {"artist", "album", "nosuchtag"}
+
+	moved = library.join("TestMP3", "test_mp3.mp3")
+	view = library.join("ALBUMS", "_id3autosort_testing_", "test_mp3.mp3")
+	assert moved.check() and not source.join("test_mp3.mp3").check()
+	assert view.islink() and view.readlink() == str(moved)
+	assert not library.join("MISSING").check()
+
+	# Undoing removes the views before moving the files back
+	undo(mock_logger, journal, [str(source)], str(library), False)
+	assert source.join("test_mp3.mp3").check()
+	assert not view.check(link=True)
+	assert journal.moves() == []
+	journal.close()
+
+
+@pytest.mark.parametrize("jobs", [1, 2], ids=["serial", "parallel"])
+def test_sort_stats(jobs, tmpdir):
+	source = tmpdir.mkdir("source")
+	dest = tmpdir.mkdir("dest")
+	stats = RunStats(slowest=1)
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(source))
+
+	source_sizes = dict((str(f), f.size()) for f in source.listdir())
+
+	sort(Mock(), str(source), str(dest), Structure("{artist}"), True, False, jobs=jobs, stats=stats)
+	report = stats.report()
+
+	assert set(report["stages"]) >= {"walk", "screen", "parse", "normalize", "path_build", "makedirs", "move"}
+	assert report["stages"]["path_build"]["count"] == 2
+	assert report["counters"]["files"] == report["counters"]["moved"] == 2
+	assert report["counters"]["bytes_moved"] == sum(f.size() for f in dest.visit(lambda f: f.isfile()))
+	assert report["latency"]["p50"] is not None
+
+	# Files are described as they were when read, before they moved
+	(slowest,) = report["slowest"]["parse"]
+	assert slowest["format"] in ("mp3", "flac")
+	assert slowest["size"] == source_sizes[slowest["path"]]
+
+
+@pytest.mark.parametrize("jobs", [1, 2], ids=["serial", "parallel"])
+def test_get_music_files_timeout(jobs, tmpdir):
+	mock_logger = Mock()
+	quarantine = Quarantine(str(tmpdir.join("quarantine")))
+	stats = RunStats()
+	hung = HUNG_AUDIO
+	expected = [(path, tags) for (path, tags) in get_music_files(mock_logger, TEST_AUDIO, True) if path != hung]
+
+	with patch("id3autosort.sorter._read_lookup_job", _hanging_read_job):
+		assert list(get_music_files(mock_logger, TEST_AUDIO, True, jobs=jobs, stats=stats, file_timeout=1,
+									quarantine=quarantine)) == expected
+
+	mock_logger.warning.assert_called_once_with("Gave up reading %s after %g seconds", hung, 1)
+	assert stats.counters["abandoned"] == 1
+	assert "normalize" in stats.stages
+
+	# Later runs skip the file without trying it again, until it changes
+	with patch("id3autosort.sorter._read_lookup_job", _hanging_read_job):
+		assert list(get_music_files(mock_logger, TEST_AUDIO, True, jobs=jobs, quarantine=quarantine)) == expected
+
+	mock_logger.info.assert_any_call("Skipping %s, quarantined", hung)
+	quarantine.close()
+
+
+def test_sort_files(tmpdir):
+	source = tmpdir.mkdir("source")
+	dest = tmpdir.mkdir("dest")
+	copy(join(TEST_AUDIO, "test_mp3.mp3"), str(source))
+	copy(join(TEST_AUDIO, "test_flac.flac"), str(source))
+
+	sort(Mock(), str(source), str(dest), Structure("{artist}"), True, False, files=[str(source.join("test_mp3.mp3"))])
+
+	assert dest.join("TestMP3", "test_mp3.mp3").check()
+	assert source.join("test_flac.flac").check()
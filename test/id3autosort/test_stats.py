@@ -0,0 +1,203 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+import json
+
+from threading import Thread
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.stats import (
+	io_counters,
+	load_hook,
+	log_report,
+	NO_TIMING,
+	percentile,
+	RunStats,
+	StageHook,
+	timing,
+	write_report,
+	)
+
+
+@pytest.mark.parametrize("percent, expected", [(50, 5), (95, 10), (99, 10), (10, 1)],
+						 ids=["p50", "p95", "p99", "p10"])
+def test_percentile(percent, expected):
+	assert percentile(list(range(1, 11)), percent) == expected
+
+
+def test_percentile_empty():
+	assert percentile([], 50) is None
+
+
+def test_io_counters():
+	with patch("id3autosort.stats.open", side_effect=IOError, create=True):
+		assert io_counters() is None
+
+
+def test_timing_nested():
+	stats = RunStats()
+
+	with patch("id3autosort.stats.time.perf_counter", side_effect=[0.0, 1.0, 3.0, 10.0]):
+		with stats.timing("parse", latency=True):
+			with stats.timing("normalize"):
+				pass
+
+	# The outer stage doesn't count time spent in the inner one
+	assert stats.stages["normalize"][:2] == [1, 2.0]
+	assert stats.stages["parse"][:2] == [1, 8.0]
+	assert stats.latencies == [10.0]
+
+
+def test_timing_disabled():
+	assert timing(None, "parse") is NO_TIMING
+
+	with timing(None, "parse"):
+		pass
+
+
+def test_timed():
+	stats = RunStats()
+
+	assert list(stats.timed("walk", iter(["a", "b"]))) == ["a", "b"]
+	assert stats.stages["walk"][0] == 3
+
+
+def test_threads():
+	stats = RunStats()
+
+	def _work():
+		for _ in range(100):
+			with stats.timing("parse", latency=True):
+				stats.count("files")
+
+	threads = [Thread(target=_work) for _ in range(4)]
+
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	assert stats.stages["parse"][0] == 400
+	assert stats.counters["files"] == 400
+	assert len(stats.latencies) == 400
+
+
+def test_merge():
+	stats = RunStats()
+	worker = RunStats()
+
+	with worker.timing("parse", latency=True):
+		worker.count("files", 3)
+
+	stats.count("files")
+	stats.merge(worker.snapshot())
+	report = stats.report()
+
+	assert report["files"] == 4
+	assert report["stages"]["parse"]["count"] == 1
+	assert report["latency"]["p50"] == worker.latencies[0]
+
+
+def test_report(tmpdir):
+	mock_logger = Mock()
+	stats = RunStats()
+	report_path = tmpdir.join("stats.json")
+
+	with stats.timing("move"):
+		stats.count("files", 2)
+		stats.count("bytes_moved", 1024)
+
+	report = stats.report()
+	assert report["files"] == 2
+	assert report["files_per_sec"] > 0
+	assert list(report["latency"]) == ["p50", "p95", "p99"]
+	assert report["latency"]["p99"] is None
+
+	log_report(mock_logger, report)
+	mock_logger.info.assert_any_call("%-12s %d", "bytes_moved", 1024)
+
+	write_report(str(report_path), report)
+	assert json.loads(report_path.read())["stages"]["move"]["count"] == 1
+
+
+def test_slowest(tmpdir):
+	stats = RunStats(slowest=2)
+	paths = []
+
+	for (index, size) in enumerate([10, 30, 20]):
+		music = tmpdir.join("{0}.MP3".format(index))
+		music.write("x" * size)
+		paths.append(str(music))
+
+	with patch("id3autosort.stats.time.perf_counter", side_effect=[0.0, 0.1, 0.0, 0.3, 0.0, 0.2]):
+		for path in paths:
+			with stats.timing("parse", path):
+				pass
+
+	slowest = stats.report()["slowest"]["parse"]
+	assert [(entry["path"], entry["size"], entry["format"]) for entry in slowest] == [
+		(paths[1], 30, "mp3"), (paths[2], 20, "mp3")]
+	assert slowest[0]["wall"] == slowest[0]["own"] == pytest.approx(0.3)
+
+
+def test_slowest_merge():
+	stats = RunStats(slowest=1)
+	worker = RunStats(slowest=1)
+
+	with patch("id3autosort.stats.time.perf_counter", side_effect=[0.0, 0.1, 0.0, 0.5]):
+		with stats.timing("parse", "/in/fast.flac"):
+			pass
+
+		with worker.timing("parse", "/in/slow.flac"):
+			pass
+
+	stats.merge(worker.snapshot())
+	assert [entry["path"] for entry in stats.report()["slowest"]["parse"]] == ["/in/slow.flac"]
+
+	mock_logger = Mock()
+	log_report(mock_logger, stats.report())
+	mock_logger.info.assert_any_call("Slowest files in %s:", "parse")
+
+
+def test_hooks():
+	calls = []
+
+	class _Hook(StageHook):
+		def start(self, stage, path):
+			calls.append(("start", stage, path))
+
+		def finish(self, stage, path, wall, cpu):
+			calls.append(("finish", stage, path))
+
+	stats = RunStats(hooks=[_Hook(), StageHook()])
+
+	with stats.timing("parse", "/in/1.mp3"):
+		with stats.timing("normalize", "/in/1.mp3"):
+			pass
+
+	assert calls == [("start", "parse", "/in/1.mp3"), ("start", "normalize", "/in/1.mp3"),
+					 ("finish", "normalize", "/in/1.mp3"), ("finish", "parse", "/in/1.mp3")]
+
+
+def test_load_hook():
+	assert isinstance(load_hook("id3autosort.stats:StageHook"), StageHook)
+
+
+@pytest.mark.parametrize("spec", ["id3autosort.stats", "id3autosort.noexist:Hook", "id3autosort.stats:Missing",
+								  "id3autosort.stats:PROC_IO"],
+						 ids=["no-name", "no-module", "no-attribute", "not-callable"])
+def test_load_hook_invalid(spec):
+	with pytest.raises(ValueError):
+		load_hook(spec)
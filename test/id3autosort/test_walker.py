@@ -0,0 +1,105 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from io import BytesIO
+from os import getcwd, symlink, walk
+from os.path import join
+from time import sleep
+from types import GeneratorType
+
+import pytest
+
+from mock import Mock, patch
+
+from id3autosort.dirsnapshot import DirSnapshot
+from id3autosort.walker import list_dir, read_file_list, scan_files
+
+
+@pytest.fixture
+def tree(tmpdir):
+	for path in [("a", "b", "deep.mp3"), ("a", "mid.ogg"), ("c", "other.flac"), ("top.wma",)]:
+		tmpdir.join(*path).ensure()
+
+	tmpdir.join("empty").ensure(dir=True)
+	symlink(str(tmpdir.join("a")), str(tmpdir.join("c", "link_to_a")))
+	symlink(str(tmpdir.join("top.wma")), str(tmpdir.join("c", "link_to_top.wma")))
+
+	return tmpdir
+
+
+def test_list_dir(tree):
+	(files, subdirs) = list_dir(str(tree.join("c")))
+
+	assert sorted(files) == [str(tree.join("c", "link_to_top.wma")), str(tree.join("c", "other.flac"))]
+	assert subdirs == []
+
+	(files, subdirs) = list_dir(str(tree))
+	assert files == [str(tree.join("top.wma"))]
+	assert sorted(subdirs) == [str(tree.join("a")), str(tree.join("c")), str(tree.join("empty"))]
+
+
+@pytest.mark.parametrize("threads", [1, 3], ids=["serial", "threaded"])
+def test_scan_files(tree, threads):
+	mock_logger = Mock()
+	expected = [join(basedir, name) for (basedir, dirs, names) in walk(str(tree)) for name in names]
+
+	walker = scan_files(mock_logger, [str(tree)], threads=threads)
+	assert isinstance(walker, GeneratorType)
+	assert sorted(walker) == sorted(expected)
+
+	if threads == 1:
+		assert list(scan_files(mock_logger, [str(tree)], threads=threads)) == expected
+
+
+@pytest.mark.parametrize("threads", [1, 3], ids=["serial", "threaded"])
+def test_scan_files_not_recursive(tree, threads):
+	mock_logger = Mock()
+	result = scan_files(mock_logger, [str(tree), str(tree.join("a"))], recursive=False, threads=threads)
+
+	assert sorted(result) == [str(tree.join("a", "mid.ogg")), str(tree.join("top.wma"))]
+
+
+@patch("id3autosort.walker.WALK_QUEUE_DEPTH", 1)
+@pytest.mark.parametrize("threads", [1, 2], ids=["serial", "threaded"])
+def test_scan_files_errors(tree, threads):
+	mock_logger = Mock()
+	missing = str(tree.join("missing"))
+
+	assert sorted(scan_files(mock_logger, [missing, str(tree.join("a"))], threads=threads)) == [
+		str(tree.join("a", "b", "deep.mp3")), str(tree.join("a", "mid.ogg"))]
+	assert mock_logger.info.call_args[0][:2] == ("Could not list directory %s: %s", missing)
+
+
+@pytest.mark.parametrize("threads", [1, 3], ids=["serial", "threaded"])
+def test_scan_files_snapshot(tree, threads):
+	mock_logger = Mock()
+	snapshot = DirSnapshot(str(tree.join("snapshot")))
+	everything = sorted(scan_files(mock_logger, [str(tree.join("a")), str(tree.join("c"))], threads=threads))
+
+	assert sorted(scan_files(mock_logger, [str(tree.join("a")), str(tree.join("c"))], threads=threads,
+							 snapshot=snapshot)) == everything
+	assert list(scan_files(mock_logger, [str(tree.join("a")), str(tree.join("c"))], threads=threads,
+						   snapshot=snapshot)) == []
+
+	# Only directories that changed are listed, however deep they are, for files new since
+	sleep(0.05)
+	tree.join("a", "b", "new.mp3").ensure()
+	assert list(scan_files(mock_logger, [str(tree.join("a")), str(tree.join("c"))], threads=threads,
+						   snapshot=snapshot)) == [str(tree.join("a", "b", "new.mp3"))]
+
+
+@pytest.mark.parametrize("chunk_size", [3, 1024], ids=["split-entries", "whole"])
+def test_read_file_list(chunk_size):
+	listing = BytesIO(b"/music/a.mp3\0relative/b.flac\0\0/music/caf\xc3\xa9.ogg")
+
+	assert list(read_file_list(listing, chunk_size)) == [
+		"/music/a.mp3", join(getcwd(), "relative", "b.flac"), "/music/caf\u00e9.ogg"]
+
@@ -0,0 +1,106 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from sys import platform
+from threading import Event
+from time import sleep
+
+import pytest
+
+from mock import ANY, Mock, patch
+
+from id3autosort.watch import InotifyWatcher, make_watcher, PollingWatcher, watch
+
+
+def _collect(watcher, wanted, attempts=20):
+	result = []
+
+	for _ in range(attempts):
+		result.extend(watcher.changes(0.1))
+
+		if wanted in result:
+			break
+
+	return result
+
+
+def test_polling_watcher(tmpdir):
+	tmpdir.join("old.mp3").write("old")
+	watcher = PollingWatcher(Mock(), [str(tmpdir)], 0.01)
+	music = tmpdir.mkdir("album").join("new.mp3")
+	music.write("new")
+
+	# Files already there aren't reported, and new ones only count once they stop changing
+	assert watcher.changes() == [(str(music), False)]
+	assert watcher.changes() == [(str(music), True)]
+	assert watcher.changes() == []
+	watcher.close()
+
+
+@pytest.mark.skipif(not platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_watcher(tmpdir):
+	watcher = InotifyWatcher(Mock(), [str(tmpdir)])
+	music = tmpdir.join("new.mp3")
+	assert watcher.changes(0) == []
+
+	with open(str(music), "w") as new:
+		new.write("new")
+		new.flush()
+		assert (str(music), False) in _collect(watcher, (str(music), False))
+
+	assert (str(music), True) in _collect(watcher, (str(music), True))
+
+	# Directories made after watching started are watched too
+	album = tmpdir.mkdir("album")
+	first = album.join("1.mp3")
+	first.write("1")
+	assert (str(first), True) in _collect(watcher, (str(first), True))
+
+	second = album.join("2.mp3")
+	second.write("2")
+	assert (str(second), True) in _collect(watcher, (str(second), True))
+	watcher.close()
+
+
+def test_watch():
+	stop = Event()
+	handled = []
+	changes = [[("/in/a/1.mp3", True)],
+			   [("/in/a/1.mp3", False), ("/in/b/1.mp3", True), ("/in/a/2.mp3", True)],
+			   [("/in/a/1.mp3", True), ("/in/b/2.mp3", False)]]
+
+	def _changes(timeout):
+		sleep(min(timeout, 0.01))
+		return changes.pop(0) if changes else []
+
+	def _handle(directory, files):
+		handled.append((directory, files))
+
+		if len(handled) == 2:
+			stop.set()
+
+	watcher = Mock()
+	watcher.changes.side_effect = _changes
+	watch(Mock(), watcher, _handle, 0.05, stop)
+
+	# Each directory's files are handed over together, once it has settled, without files still being written
+	assert sorted(handled) == [("/in/a", ["/in/a/2.mp3", "/in/a/1.mp3"]), ("/in/b", ["/in/b/1.mp3"])]
+
+
+def test_make_watcher(tmpdir):
+	mock_logger = Mock()
+
+	assert isinstance(make_watcher(mock_logger, [str(tmpdir)], 1), PollingWatcher)
+
+	with patch("id3autosort.watch.InotifyWatcher", side_effect=OSError("Unavailable")):
+		assert isinstance(make_watcher(mock_logger, [str(tmpdir)]), PollingWatcher)
+
+	mock_logger.info.assert_called_once_with("Could not use inotify, polling for changes instead: %s", ANY)
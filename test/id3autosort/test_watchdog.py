@@ -0,0 +1,57 @@
+# encoding: utf-8
+
+################################################################################
+#                                 id3autosort                                  #
+#  A collection of tools for manipulating and interacting with music metadata  #
+#                               (C) 2019 Mischif                               #
+#       Released under version 3.0 of the Non-Profit Open Source License       #
+################################################################################
+
+from __future__ import unicode_literals
+
+from os import _exit
+from time import monotonic, sleep
+
+from mock import patch
+
+from id3autosort.watchdog import CRASHED, DONE, SKIPPED, TIMED_OUT, WatchdogPool
+
+
+def _job(item):
+	if item == "hang":
+		sleep(60)
+	elif item == "crash":
+		_exit(1)
+
+	return item.upper()
+
+
+def test_watchdog_pool():
+	items = ["a", "hang", "b", "crash", "c", "d"]
+	started = monotonic()
+
+	result = list(WatchdogPool(2, 0.5).imap(_job, items))
+
+	# Results come back in order, and the hung worker only costs its budget
+	assert result == [("a", "A", DONE), ("hang", None, TIMED_OUT), ("b", "B", DONE),
+					  ("crash", None, CRASHED), ("c", "C", DONE), ("d", "D", DONE)]
+	assert monotonic() - started < 30
+
+
+def test_watchdog_pool_wanted():
+	result = list(WatchdogPool(1, 5).imap(_job, ["a", "b", "c"], lambda item: item != "b"))
+	assert result == [("a", "A", DONE), ("b", None, SKIPPED), ("c", "C", DONE)]
+
+
+@patch("id3autosort.watchdog.WATCHDOG_QUEUE_DEPTH", 1)
+def test_watchdog_pool_backlog():
+	# Finished items waiting on a slow one don't stop the rest from being handed out
+	items = ["hang"] + [str(i) for i in range(10)]
+	result = list(WatchdogPool(3, 1).imap(_job, items))
+
+	assert [status for (_, _, status) in result] == [TIMED_OUT] + [DONE] * 10
+	assert [value for (_, value, _) in result[1:]] == [str(i) for i in range(10)]
+
+
+def test_watchdog_pool_nothing():
+	assert list(WatchdogPool(2, 1).imap(_job, [])) == []